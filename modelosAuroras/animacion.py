@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Patch
+from utilidades import DatosOMNI, proyeccionRapida, zonaOvalo
+
+#%%
+
+# Cuadros PNG de los ovalos de una tormenta, sin ventanas (backend Agg) y repartidos
+# entre los procesos de un pool. Cada modelo se pasa a una "serie":
+#   fechas  = array (T,) de ut (segundos)
+#   huellas = array (T, 2 polos, 2 limites, 3, N) con lat, lon y r de los puntos de los
+#             dos limites del ovalo (como en tormentaT96), completado con NaN
+#   modelo  = nombre para el titulo
+#   etiquetas = texto de la leyenda del ovalo de cada hora (lo que muestra el ovalo, como
+#             en las figuras de starkov y hipEscala)
+# Los cuadros se guardan en un directorio como cuadro_<polo>_<indice>.png, junto con
+# indice.json (archivo, polo, indice, fecha y ut de cada cuadro). Cada proceso dibuja
+# muchos cuadros seguidos con el mismo mapa base en cache (utilidades.mapaBase).
+#
+# Uso desde la terminal:
+#   python animacion.py starkov 2025_01_01.lst cuadros_starkov
+#   python animacion.py escala 2025_01_01.lst cuadros_escala
+#   python animacion.py t96 tormenta_2025_01_01 cuadros_t96 --omni 2025_01_01.lst
+
+POLOS = ("norte", "sur")
+NOMBRES = {"starkov": "el\\;modelo \\;de \\;Starkov", "escala": "la\\;hipotesis \\;de \\;escala",
+           "t96": "el\\;modelo \\;T96"}
+
+def _etiquetas(kps, presiones=None):
+
+    # "$Kp = ...$" por hora, con la presion dinamica si el ovalo esta escalado a ella
+    etiquetas = []
+    for i, kp in enumerate(kps):
+        texto = f"Kp = {kp:g}" if np.isfinite(kp) else "Ovalo"
+        if presiones is not None:
+            texto += f",\\; P_d = {presiones[i]:.2f}\\;nPa"
+        etiquetas.append(f"${texto}$")
+
+    return etiquetas
+
+def _huellasStarkov(datos, kps):
+
+    # limite polar y ecuatorial de Starkov en la forma (T, 2 polos, 2 limites, 3, N)
+    import starkov
+    lat, lon = starkov.ovalosLote(datos.fechas, kps)                  # (T, 3, 2, N)
+    huellas = np.stack([lat[:, :2], lon[:, :2], np.ones_like(lat[:, :2])], axis=3)
+
+    return huellas.transpose(0, 2, 1, 3, 4)
+
+def serieStarkov(archivo):
+
+    # ovalos de Starkov con el kp medido de cada hora, sin ovalo en las horas con datos
+    # faltantes
+    datos = DatosOMNI.de(archivo)
+    kps = np.where(datos.validas, datos.kpMedido, np.nan)
+
+    return {"fechas": datos.ut, "huellas": _huellasStarkov(datos, kps), "modelo": "starkov",
+            "etiquetas": _etiquetas(kps)}
+
+def serieEscala(archivo, kp=2, P1=0.5):
+
+    # ovalo de Starkov con kp fijo escalado con la presion dinamica de cada hora
+    # (hipotesis de escala, como en hipEscala.main). La leyenda muestra el kp fijo y la
+    # presion de la hora, a la que esta escalado el ovalo
+    from hipEscala import escalar
+    datos = DatosOMNI.de(archivo)
+    huellas = _huellasStarkov(datos, np.full(len(datos), kp))
+    huellas[:, :, :, 0] = escalar(huellas[:, :, :, 0], P1, datos.parametros[:, 0, None, None, None])
+
+    return {"fechas": datos.ut, "huellas": huellas, "modelo": "escala",
+            "etiquetas": _etiquetas(np.full(len(datos), kp), datos.parametros[:, 0])}
+
+def serieT96(directorio, archivoOMNI=None):
+
+    # huellas de una tormenta calculada con tormentaT96.calcularTormenta, las fechas
+    # salen del archivo de OMNI usado (info.json) o de archivoOMNI
+    from tormentaT96 import abrirTormenta
+    huellas, hecho, info = abrirTormenta(directorio)
+    datos = DatosOMNI.de(archivoOMNI if archivoOMNI is not None else info["archivo"])
+    huellas = np.where(hecho[:, None, None, None, None], huellas, np.nan)
+
+    return {"fechas": datos.ut, "huellas": huellas, "modelo": "t96",
+            "etiquetas": _etiquetas(np.where(datos.conKp, datos.kpMedido, np.nan))}
+
+def _dibujarCuadro(tarea):
+
+    # dibuja y guarda un cuadro, se ejecuta en los procesos del pool
+    ruta, polo, ut, interno, externo, modelo, etiqueta, rango, figsize, dpi, color = tarea
+    fecha = datetime.fromtimestamp(int(ut), tz=timezone.utc)
+
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = proyeccionRapida(fig, polo, rango, fecha)
+
+    puntos = [p[:, np.isfinite(p).all(axis=0)] for p in (interno[:2], externo[:2])]
+    hayOvalo = all(p.shape[1] >= 3 for p in puntos)
+    if hayOvalo:
+        zonaOvalo(ax, puntos[0], puntos[1], color=color)
+
+    ax.text(
+        x=0.025, y=0.98,          # posición relativa en axes (0 a 1)
+        s=f"$UT={fecha.strftime('%H:%M:%S')}$",
+        transform=ax.transAxes,   # coordenadas relativas al axes
+        fontsize=20,
+        verticalalignment='top',
+        bbox=dict(boxstyle="round,pad=0.2", facecolor="white",edgecolor="k", alpha=1)
+    )
+    fech = fecha.strftime("%Y/%m/%d")
+    ax.text(
+        x=0.25, y=0.09,          # posición relativa en axes (0 a 1)
+        s=f"$ Simulación \\; con \\; {NOMBRES.get(modelo, modelo)}$\n $para \\;la \\; Tormenta \\;del\\; {fech}$",
+        transform=ax.transAxes,   # coordenadas relativas al axes
+        fontsize=16,
+        weight=700,
+        verticalalignment='top',
+        bbox=dict(boxstyle="round,pad=0.2", facecolor="white",edgecolor="k", alpha=1)
+    )
+
+    handles, labels = ax.get_legend_handles_labels()
+    if hayOvalo:
+        handles.append(Patch(facecolor=color, edgecolor='#6F1EC0'))
+        labels.append(etiqueta)
+    ax.legend(handles=handles, labels=labels, loc='upper right', fontsize=15, framealpha=1,
+              edgecolor="k", alignment="right")
+
+    # compresion baja: el png se escribe mucho mas rapido y pesa un poco mas
+    fig.savefig(ruta, pil_kwargs={"compress_level": 1})
+
+    return ruta
+
+def renderizar(serie, directorio, polos=POLOS, rango=(45, 90), figsize=(7, 8), dpi=150,
+               procesos=None, color="#19DA40"):
+
+    # dibuja todos los cuadros de la serie en directorio y escribe indice.json
+    os.makedirs(directorio, exist_ok=True)
+    tareas, indice = [], []
+    etiquetas = serie.get("etiquetas", ["$Ovalo$"]*len(serie["fechas"]))
+    for p, polo in enumerate(POLOS):
+        if polo not in polos:
+            continue
+        for i, ut in enumerate(serie["fechas"]):
+            nombre = f"cuadro_{polo}_{i:04d}.png"
+            tareas.append((os.path.join(directorio, nombre), polo, int(ut), serie["huellas"][i, p, 0],
+                           serie["huellas"][i, p, 1], serie["modelo"], etiquetas[i], tuple(rango),
+                           tuple(figsize), dpi, color))
+            indice.append({"archivo": nombre, "polo": polo, "indice": i, "ut": int(ut),
+                           "fecha": datetime.fromtimestamp(int(ut), tz=timezone.utc).isoformat()})
+
+    # varios cuadros por tarea para que cada proceso aproveche su mapa base
+    procesos = procesos or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        list(pool.map(_dibujarCuadro, tareas, chunksize=max(1, len(tareas)//(4*procesos))))
+
+    with open(os.path.join(directorio, "indice.json"), "w") as f:
+        json.dump({"modelo": serie["modelo"], "cuadros": indice}, f, indent=2)
+
+    return indice
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Cuadros PNG de los ovalos de una tormenta")
+    parser.add_argument("modelo", choices=["starkov", "escala", "t96"])
+    parser.add_argument("entrada", help="archivo .lst de OMNI (starkov, escala) o directorio de tormentaT96 (t96)")
+    parser.add_argument("salida", help="directorio de los cuadros")
+    parser.add_argument("--omni", default=None, help="archivo de OMNI de la tormenta (t96)")
+    parser.add_argument("--polos", nargs="+", default=list(POLOS), choices=POLOS)
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--dpi", type=int, default=150)
+    args = parser.parse_args()
+
+    if args.modelo == "starkov":
+        serie = serieStarkov(args.entrada)
+    elif args.modelo == "escala":
+        serie = serieEscala(args.entrada)
+    else:
+        serie = serieT96(args.entrada, args.omni)
+
+    indice = renderizar(serie, args.salida, args.polos, dpi=args.dpi, procesos=args.procesos)
+    print(f"{len(indice)} cuadros en {args.salida}")
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    start = time.time()
+
+    main()
+
+    end = time.time()
+    print(f"Tiempo de ejecución: {end - start:.3f} segundos")
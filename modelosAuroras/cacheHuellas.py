@@ -0,0 +1,122 @@
+import os
+import hashlib
+import json
+import numpy as np
+
+#%%
+
+# Cache en disco de las huellas (footpoints) de los ovalos de T96.
+# Cada resultado de seguirLineasGEO se guarda en un archivo .npz cuyo nombre es el hash
+# de todo lo que determina el calculo (modelo, parmod, ut, RS, RC, step, polo y ovalo),
+# asi la misma simulacion nunca se repite entre ejecuciones. Cuando el directorio supera
+# el tamaño maximo se borran los archivos usados hace mas tiempo (LRU): en cada acierto
+# se actualiza la fecha de modificacion del archivo.
+
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cacheHuellas")
+
+class CacheHuellas:
+
+    def __init__(self, directorio=DIRECTORIO, tamanoMax=200*1024**2):
+
+        # tamanoMax = tamaño maximo del directorio en bytes
+        self.directorio = directorio
+        self.tamanoMax = tamanoMax
+        self.aciertos = 0
+        self.fallos = 0
+        self.borrados = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def clave(self, modelo, parametros, ut, RS, RC, step, polo, ovalo, extra=None):
+
+        # hash sha256 de los datos de la simulacion, los numeros se pasan a float para
+        # que por ejemplo step=100 y step=100.0 o RS lista/array den la misma clave.
+        # extra = diccionario con otras opciones que cambian el resultado (se agregan a
+        # la clave), por ejemplo el muestreo adaptativo
+        datos = {
+            "modelo": modelo,
+            "parametros": np.asarray(parametros, dtype=float).ravel().tolist(),
+            "ut": float(ut),
+            "RS": np.asarray(RS, dtype=float).tolist(),
+            "RC": np.asarray(RC, dtype=float).tolist(),
+            "step": int(step),
+            "polo": polo,
+            "ovalo": ovalo,
+        }
+        if extra:
+            datos["extra"] = extra
+        texto = json.dumps(datos, sort_keys=True)
+
+        return hashlib.sha256(texto.encode()).hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + ".npz")
+
+    def obtener(self, clave):
+
+        # devuelve (lat, lon, r) si la clave esta guardada, si no None
+        ruta = self._ruta(clave)
+        try:
+            with np.load(ruta) as datos:
+                huellas = datos["lat"], datos["lon"], datos["r"]
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            self.fallos += 1
+            return None
+
+        os.utime(ruta)   # marca el archivo como usado recientemente
+        self.aciertos += 1
+
+        return huellas
+
+    def guardar(self, clave, lat, lon, r):
+
+        # se escribe en un archivo temporal y se renombra, asi otro proceso nunca lee
+        # un archivo a medio escribir
+        ruta = self._ruta(clave)
+        temporal = ruta + ".%d.tmp" % os.getpid()
+        with open(temporal, "wb") as f:
+            np.savez(f, lat=lat, lon=lon, r=r)
+        os.replace(temporal, ruta)
+
+        self.limpiar()
+
+    def limpiar(self):
+
+        # borra los archivos menos usados hasta que el directorio quede bajo tamanoMax
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".npz"):
+                info = os.stat(os.path.join(self.directorio, nombre))
+                archivos.append((info.st_mtime, info.st_size, nombre))
+
+        total = sum(a[1] for a in archivos)
+        for _, tamano, nombre in sorted(archivos):
+            if total <= self.tamanoMax:
+                break
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+            except FileNotFoundError:
+                pass
+            total -= tamano
+            self.borrados += 1
+
+    def vaciar(self):
+
+        # borra todo el contenido de la cache
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith(".npz"):
+                os.remove(os.path.join(self.directorio, nombre))
+
+    def estadisticas(self):
+
+        entradas = [n for n in os.listdir(self.directorio) if n.endswith(".npz")]
+        tamano = sum(os.path.getsize(os.path.join(self.directorio, n)) for n in entradas)
+        consultas = self.aciertos + self.fallos
+
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasaAciertos": self.aciertos/consultas if consultas else 0.,
+            "borrados": self.borrados,
+            "entradas": len(entradas),
+            "bytes": tamano,
+        }
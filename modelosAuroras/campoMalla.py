@@ -0,0 +1,219 @@
+import os
+import json
+import hashlib
+import numpy as np
+from geopack import geopack
+import t96Vectorial
+import trazadoVectorial
+
+#%%
+
+# Campo T96 + IGRF "en malla" para seguir muchas lineas en el mismo campo estatico
+# (mismos parametros y misma fecha). El campo externo de T96 se calcula una sola vez en
+# los nodos de una malla rectilinea en GSM, mas densa cerca de la tierra, y despues se
+# interpola (trilineal) en lugar de evaluar T96 en cada paso. El campo interno (IGRF)
+# se sigue calculando en forma exacta: cerca de la tierra varia como 1/r^3 y es el que
+# mas error daria interpolado, y ademas es barato. Tampoco se interpola cerca de la
+# magnetopausa, donde T96 pasa del campo del modelo al IMF en una capa muy delgada: los
+# puntos con la coordenada sigma de la magnetopausa a menos de "banda" de la frontera
+# se calculan con T96 exacto.
+#
+# Un CampoMalla es una funcion campo(x, y, z) -> bx, by, bz que se puede pasar a
+# trazadoVectorial.trazarLineas(..., campo=...). La malla vale solo para el angulo del
+# dipolo (psi) de la epoca con la que se calculo: si la epoca activa de geopack tiene
+# otro psi, al evaluarla se da un error en lugar de mezclar T96 de una fecha con IGRF
+# de otra. crearCampoMalla compara las huellas con
+# las del campo exacto y refina la malla hasta que el error quede bajo la tolerancia.
+
+DIRECTORIO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mallasCampo")
+
+# limites de la malla (Re): afuera de esto geopack.trace ya corta las lineas
+# (x >= 20, y**2+z**2 >= 1600), salvo en la cola hasta rlim
+LIMITES = {"x": (-100., 20.), "y": (-40., 40.), "z": (-40., 40.)}
+TOLERANCIA_PSI = 1e-6     # radianes
+
+def ejeMalla(a, b, n, escala=4.):
+
+    # n nodos entre a y b, mas juntos cerca de 0: equiespaciados en arcsinh(x/escala),
+    # la separacion cerca de 0 es ~escala*du y crece exponencialmente hacia afuera
+    u = np.linspace(np.arcsinh(a/escala), np.arcsinh(b/escala), n)
+
+    return escala*np.sinh(u)
+
+class CampoMalla:
+
+    def __init__(self, parametros, psi, ejes, valores, banda=0.05, escala=4.):
+
+        # ejes = (ex, ey, ez) nodos de la malla (ejeMalla con "escala"), valores = array
+        # (3, nx, ny, nz) con el campo externo de T96 en los nodos. descripcion identifica
+        # la malla (parametros, psi, nodos, escala, banda) en la clave de CacheHuellas
+        self.parametros = np.asarray(parametros, dtype=float)
+        self.psi = psi
+        self.ejes = ejes
+        self.valores = valores
+        self.banda = banda
+        self.escala = escala
+        self.xappa = (self.parametros[0]/2.)**0.14
+        self.puntosFuera = 0     # evaluaciones fuera de la malla o en la banda (T96 exacto)
+        n = tuple(len(e) for e in ejes)
+        self.descripcion = "malla %dx%dx%d %s" % (n + (_clave(self.parametros, psi, n, escala, banda),))
+
+    @classmethod
+    def calcular(cls, parametros, psi, n=(64, 48, 48), escala=4., banda=0.05, bloque=20000):
+
+        # evalua T96 en todos los nodos, de a "bloque" puntos para no usar tanta memoria
+        ejes = tuple(ejeMalla(*LIMITES[c], m, escala) for c, m in zip("xyz", n))
+        X, Y, Z = np.meshgrid(*ejes, indexing="ij")
+        X, Y, Z = X.ravel(), Y.ravel(), Z.ravel()
+        valores = np.empty((3, len(X)))
+        for i in range(0, len(X), bloque):
+            s = slice(i, i + bloque)
+            valores[:, s] = t96Vectorial.t96(parametros, psi, X[s], Y[s], Z[s])
+
+        return cls(parametros, psi, ejes, valores.reshape((3,) + tuple(n)), banda, escala)
+
+    def externo(self, x, y, z):
+
+        # interpolacion trilineal del campo externo, los puntos fuera de la malla o cerca
+        # de la magnetopausa se calculan con T96 exacto
+        x, y, z = [np.atleast_1d(np.asarray(c, dtype=float)) for c in (x, y, z)]
+        b = np.empty((3,) + x.shape)
+
+        ex, ey, ez = self.ejes
+        sigma = t96Vectorial._sigma(self.xappa, x, y, z)
+        dentro = ((x >= ex[0]) & (x <= ex[-1]) & (y >= ey[0]) & (y <= ey[-1])
+                  & (z >= ez[0]) & (z <= ez[-1]) & (np.abs(sigma - 1.08) > self.banda))
+
+        if not np.all(dentro):
+            fuera = ~dentro
+            self.puntosFuera += int(fuera.sum())
+            b[:, fuera] = t96Vectorial.t96(self.parametros, self.psi, x[fuera], y[fuera], z[fuera])
+
+        if np.any(dentro):
+            indices, pesos = [], []
+            for e, c in zip(self.ejes, (x[dentro], y[dentro], z[dentro])):
+                i = np.clip(np.searchsorted(e, c) - 1, 0, len(e) - 2)
+                indices.append(i)
+                pesos.append((c - e[i])/(e[i+1] - e[i]))
+            (i, j, k), (tx, ty, tz) = indices, pesos
+
+            v = self.valores
+            bd = 0.
+            for di, wx in ((0, 1 - tx), (1, tx)):
+                for dj, wy in ((0, 1 - ty), (1, ty)):
+                    for dk, wz in ((0, 1 - tz), (1, tz)):
+                        bd = bd + v[:, i + di, j + dj, k + dk]*(wx*wy*wz)
+            b[:, dentro] = bd
+
+        return b[0], b[1], b[2]
+
+    def __call__(self, x, y, z):
+
+        # campo total en GSM: T96 interpolado + IGRF exacto (epoca activa de geopack)
+        self.verificarEpoca()
+        bx, by, bz = self.externo(x, y, z)
+        hx, hy, hz = trazadoVectorial.igrfGSM(x, y, z)
+
+        return bx + hx, by + hy, bz + hz
+
+    def verificarEpoca(self):
+
+        # la epoca activa de geopack tiene que tener el psi de la malla
+        if abs(geopack.psi - self.psi) > TOLERANCIA_PSI:
+            raise ValueError(f"la malla es para psi={self.psi:.6f} rad y la epoca activa de geopack "
+                             f"tiene psi={geopack.psi:.6f} rad, activar la epoca de la malla o "
+                             "crear otra con crearCampoMalla")
+
+    def guardar(self, ruta):
+        np.savez(ruta, parametros=self.parametros, psi=self.psi, ex=self.ejes[0], ey=self.ejes[1],
+                 ez=self.ejes[2], valores=self.valores, banda=self.banda, escala=self.escala)
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as d:
+            # las mallas guardadas antes de escala tienen la de crearCampoMalla por defecto
+            escala = float(d["escala"]) if "escala" in d else 4.
+            return cls(d["parametros"], float(d["psi"]), (d["ex"], d["ey"], d["ez"]), d["valores"],
+                       float(d["banda"]), escala)
+
+def _clave(parametros, psi, n, escala, banda):
+
+    datos = {"parametros": np.asarray(parametros, dtype=float).tolist(), "psi": float(psi),
+             "n": list(map(int, n)), "escala": float(escala), "banda": float(banda), "limites": LIMITES}
+
+    return hashlib.sha256(json.dumps(datos, sort_keys=True).encode()).hexdigest()
+
+def errorHuellas(campo, parametros, x, y, z, dir):
+
+    # compara las huellas de las lineas que salen de (x, y, z) con el campo exacto y con
+    # "campo". Devuelve el maximo angulo (grados, visto desde el centro de la tierra)
+    # entre huellas de lineas cerradas en los dos casos, y cuantas lineas cambiaron de
+    # cerrada a abierta o al reves
+    exacta = np.array(trazadoVectorial.trazarLineas(x, y, z, dir, parametros))
+    aprox = np.array(trazadoVectorial.trazarLineas(x, y, z, dir, parametros, campo=campo))
+
+    cerradaE = np.sqrt(np.sum(exacta**2, axis=0)) < 5
+    cerradaA = np.sqrt(np.sum(aprox**2, axis=0)) < 5
+    ambas = cerradaE & cerradaA
+    if np.any(ambas):
+        e, a = exacta[:, ambas], aprox[:, ambas]
+        cosAng = np.sum(e*a, axis=0)/np.sqrt(np.sum(e**2, axis=0)*np.sum(a**2, axis=0))
+        angulo = np.degrees(np.arccos(np.clip(cosAng, -1, 1))).max()
+    else:
+        angulo = 0.
+
+    return angulo, int(np.sum(cerradaE != cerradaA))
+
+def crearCampoMalla(parametros, tol=0.1, n=(64, 48, 48), escala=4., banda=0.05, puntosPrueba=None,
+                    maxRefinamientos=3, factor=1.5, directorio=DIRECTORIO):
+
+    # Campo en malla para los parametros dados y la epoca activa de geopack (psi).
+    # tol = error maximo (grados) de las huellas respecto al seguimiento exacto, medido
+    # en las lineas que salen de puntosPrueba = (x, y, z), por defecto 12 puntos en un
+    # circulo de 8 Re en el plano z=0, hacia los dos polos. Si el error es mayor, la malla
+    # se refina multiplicando la cantidad de nodos por "factor" en cada eje, hasta
+    # maxRefinamientos veces. Las mallas se guardan en directorio (None = sin cache).
+    # Devuelve el CampoMalla y el error obtenido (angulo maximo, lineas que cambiaron).
+    psi = geopack.psi
+    if puntosPrueba is None:
+        phi = np.linspace(0, 2*np.pi, 12, endpoint=False)
+        puntosPrueba = (8*np.cos(phi), 8*np.sin(phi), np.zeros(12))
+
+    n = tuple(map(int, n))
+    for refinamiento in range(maxRefinamientos + 1):
+
+        ruta = None
+        if directorio is not None:
+            os.makedirs(directorio, exist_ok=True)
+            ruta = os.path.join(directorio, _clave(parametros, psi, n, escala, banda) + ".npz")
+
+        if ruta is not None and os.path.exists(ruta):
+            campo = CampoMalla.cargar(ruta)
+        else:
+            campo = CampoMalla.calcular(parametros, psi, n, escala, banda)
+            if ruta is not None:
+                campo.guardar(ruta)
+
+        # la validacion tambien se guarda, junto a la malla y para estos puntos de prueba
+        rutaError = None
+        if ruta is not None:
+            prueba = hashlib.sha256(np.asarray(puntosPrueba, dtype=float).tobytes()).hexdigest()[:16]
+            rutaError = ruta[:-4] + "_" + prueba + ".json"
+        if rutaError is not None and os.path.exists(rutaError):
+            with open(rutaError) as f:
+                error = tuple(json.load(f))
+        else:
+            errores = [errorHuellas(campo, parametros, *puntosPrueba, dir) for dir in (-1, 1)]
+            error = (float(max(e[0] for e in errores)), sum(e[1] for e in errores))
+            if rutaError is not None:
+                with open(rutaError, "w") as f:
+                    json.dump(error, f)
+        if error[0] <= tol and error[1] == 0:
+            break
+        n = tuple(int(np.ceil(m*factor)) for m in n)
+
+    else:
+        print(f"crearCampoMalla: no se llego a tol={tol} (error {error[0]:.3f} grados, "
+              f"{error[1]} lineas cambiaron), se devuelve la ultima malla")
+
+    return campo, error
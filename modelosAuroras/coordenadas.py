@@ -0,0 +1,67 @@
+import numpy as np
+
+#%%
+
+# Cambio entre coordenadas geomagneticas centradas en el dipolo (las del modelo de
+# Starkov) y geograficas, para arrays de cualquier forma: (N,) puntos de un ovalo,
+# (T, N) ovalos de varias horas, etc. La matriz de rotacion de cada polo se calcula una
+# sola vez y el producto se hace para todos los puntos juntos (un solo matmul).
+
+# posicion de los polos magneticos en coordenadas geograficas [lat, lon] en grados
+POLOS_MAGNETICOS = {"norte": (82.41, -82.86), "sur": (-80.65, 107.0)}
+
+_matrices = {}
+
+def matrizRotacion(polo):
+
+    # matriz R tal que v_geo = R @ v_mag, para el dipolo con eje en el polo magnetico
+    # dado ("norte" o "sur"). Se guarda en cache y se devuelve de solo lectura
+    polo = polo.lower()
+    if polo not in _matrices:
+        if polo not in POLOS_MAGNETICOS:
+            raise ValueError("polo debe ser 'norte' o 'sur'")
+        lat0, lon0 = np.deg2rad(POLOS_MAGNETICOS[polo])
+
+        # lmda es la diferencia de latitud entre el polo geografico y el magnetico
+        lmda = np.pi/2 - lat0
+        R = np.array([[np.cos(lon0)*np.cos(lmda), -np.sin(lon0), np.cos(lon0)*np.sin(lmda)],
+                      [np.sin(lon0)*np.cos(lmda),  np.cos(lon0), np.sin(lon0)*np.sin(lmda)],
+                      [-np.sin(lmda),              0.,           np.cos(lmda)]])
+        R.setflags(write=False)
+        _matrices[polo] = R
+
+    return _matrices[polo]
+
+def cartesianas(lat, lon):
+
+    # vectores unitarios (..., 3) a partir de latitud y longitud en radianes
+    lat, lon = np.broadcast_arrays(np.asarray(lat, dtype=float), np.asarray(lon, dtype=float))
+    coslat = np.cos(lat)
+
+    return np.stack((coslat*np.cos(lon), coslat*np.sin(lon), np.sin(lat)), axis=-1)
+
+def esfericas(v):
+
+    # latitud y longitud en grados de los vectores (..., 3), longitud en (-180, 180]
+    x, y, z = v[..., 0], v[..., 1], v[..., 2]
+    r = np.sqrt(x**2 + y**2 + z**2)
+
+    return np.rad2deg(np.arcsin(z/r)), np.rad2deg(np.arctan2(y, x))
+
+def magAGeo(latMg, lonMg, polo, radianes=False):
+
+    # coordenadas geomagneticas -> geograficas, resultado en grados. Con radianes=True
+    # la entrada esta en radianes (como en starkov.ovalos)
+    if not radianes:
+        latMg, lonMg = np.deg2rad(latMg), np.deg2rad(lonMg)
+
+    return esfericas(cartesianas(latMg, lonMg) @ matrizRotacion(polo).T)
+
+def geoAMag(latGeo, lonGeo, polo, radianes=False):
+
+    # coordenadas geograficas -> geomagneticas, resultado en grados (la inversa de R es
+    # su transpuesta)
+    if not radianes:
+        latGeo, lonGeo = np.deg2rad(latGeo), np.deg2rad(lonGeo)
+
+    return esfericas(cartesianas(latGeo, lonGeo) @ matrizRotacion(polo))
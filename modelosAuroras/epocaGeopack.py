@@ -0,0 +1,101 @@
+import dis
+from collections import OrderedDict
+import numpy as np
+from geopack import geopack
+
+#%%
+
+# geopack guarda en variables globales del modulo el estado que deja recalc(ut): los
+# coeficientes de IGRF (g, h, rec), el angulo del dipolo (psi) y las matrices de
+# rotacion entre sistemas (a11...a33 GEO-GSM, etc.). trace, igrf_gsm, geogsm y demas
+# usan siempre el ultimo estado calculado.
+#
+# Epoca(ut) llama a recalc una sola vez, guarda una copia de ese estado y lo vuelve a
+# poner en geopack cada vez que se activa, asi se puede pasar de una fecha a otra (o
+# volver a una ya usada) sin recalcular y sin depender de cual fue el ultimo recalc:
+#
+#     with Epoca(ut) as epoca:
+#         geopack.trace(...)          # usa el estado de ut
+#
+# Epoca.de(ut) devuelve la misma Epoca para la misma fecha (cache por proceso).
+
+# nombres de las variables globales que escribe geopack.recalc
+ESTADO = tuple(sorted({i.argval for i in dis.get_instructions(geopack.recalc)
+                       if i.opname == "STORE_GLOBAL"}))
+
+class Epoca:
+
+    recalculos = 0        # veces que se llamo a geopack.recalc desde Epoca
+    ahorrados = 0         # cambios de estado hechos sin recalc (copiando el guardado)
+    maxCache = 64         # cantidad de epocas guardadas por Epoca.de
+    _activa = None        # epoca cuyo estado esta ahora en geopack
+    _cache = OrderedDict()
+
+    def __init__(self, ut, vxgse=-400, vygse=0, vzgse=0):
+
+        self.ut = ut
+        self.vgse = (vxgse, vygse, vzgse)
+        self.psi = geopack.recalc(ut, vxgse, vygse, vzgse)
+        Epoca.recalculos += 1
+
+        # copia del estado (los arrays se copian para que nadie los modifique), la copia
+        # queda puesta en geopack: asi "geopack.g is self._estado['g']" dice si esta
+        # epoca sigue activa aunque alguien haya llamado a recalc por fuera
+        self._estado = {nombre: np.copy(v) if isinstance(v, np.ndarray) else v
+                        for nombre, v in ((n, getattr(geopack, n)) for n in ESTADO)}
+        for nombre, valor in self._estado.items():
+            setattr(geopack, nombre, valor)
+        self._anteriores = []
+        Epoca._activa = self
+
+    @classmethod
+    def de(cls, ut, vxgse=-400, vygse=0, vzgse=0):
+
+        # Epoca ya calculada para esa fecha (y velocidad), o una nueva
+        clave = (float(ut), vxgse, vygse, vzgse)
+        epoca = cls._cache.get(clave)
+        if epoca is None:
+            epoca = cls(ut, vxgse, vygse, vzgse)
+            cls._cache[clave] = epoca
+            if len(cls._cache) > cls.maxCache:
+                cls._cache.popitem(last=False)
+        else:
+            cls._cache.move_to_end(clave)
+
+        return epoca
+
+    def activar(self):
+
+        # pone el estado de esta epoca en geopack. Si ya era la activa no hace falta
+        # copiar nada (ni se ahorro nada), si no, la copia reemplaza a un recalc
+        if not self.estaActiva():
+            for nombre, valor in self._estado.items():
+                setattr(geopack, nombre, valor)
+            Epoca.ahorrados += 1
+        Epoca._activa = self
+
+        return self.psi
+
+    def estaActiva(self):
+        return geopack.g is self._estado["g"]
+
+    def __enter__(self):
+
+        # al salir del "with" se vuelve a la epoca que estaba activa antes (si el estado
+        # de geopack venia de un recalc hecho por fuera, no hay a donde volver)
+        anterior = Epoca._activa
+        self._anteriores.append(anterior if anterior is not None and anterior.estaActiva() else None)
+        self.activar()
+        return self
+
+    def __exit__(self, *excepcion):
+
+        anterior = self._anteriores.pop()
+        if anterior is not None and anterior is not self:
+            anterior.activar()
+
+        return False
+
+    @classmethod
+    def estadisticas(cls):
+        return {"recalculos": cls.recalculos, "ahorrados": cls.ahorrados, "enCache": len(cls._cache)}
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+from datetime import datetime, timezone
+from utilidades import leerOMNIPorBloques
+
+#%%
+
+# Exportacion de los limites de los ovalos de varios modelos a un directorio con:
+#   ovalos.f32   = float32 crudo con forma (tiempo, modelo, limite, polo, coordenada, punto)
+#                  limite = ("int", "ext"), polo = ("norte", "sur"), coordenada =
+#                  ("lat", "lon") en grados geograficos, completado con NaN
+#   tiempos.f64  = float64 crudo con forma (tiempo, variable), variables = VARIABLES
+#   info.json    = dimensiones, modelos, cantidad de puntos y metadatos de cada modelo
+#                  (RS, RC, kp fijo, etc.)
+# Los dos archivos crudos se escriben de a un paso de tiempo (append), asi una corrida
+# larga nunca tiene todos los ovalos en memoria, y se pueden leer mientras se escriben
+# (abrirOvalos los abre como memmap con los pasos completos). Si la escritura se
+# interrumpe, al abrir de nuevo el directorio se descarta el ultimo paso incompleto y se
+# sigue agregando. exportarGeoJSON pasa un directorio a GeoJSON tambien de a un paso.
+
+LIMITES = ("int", "ext")
+POLOS = ("norte", "sur")
+COORDENADAS = ("lat", "lon")
+VARIABLES = ("ut", "kp", "Pdyn", "Dst", "ByIMF", "BzIMF")
+FORMATO = 1
+
+def _rutas(directorio):
+    return [os.path.join(directorio, n) for n in ("info.json", "ovalos.f32", "tiempos.f64")]
+
+def _pasosCompletos(info, rutaOvalos, rutaTiempos):
+
+    # cantidad de pasos escritos completos en los dos archivos
+    bytesOvalo = 4*np.prod(info["forma"])
+    bytesTiempo = 8*len(info["variables"])
+
+    return int(min(os.path.getsize(rutaOvalos)//bytesOvalo, os.path.getsize(rutaTiempos)//bytesTiempo))
+
+class EscritorOvalos:
+
+    def __init__(self, directorio, modelos, puntos=100, metadatos=None):
+
+        # modelos = nombres de los modelos (eje 1), puntos = largo maximo de cada limite,
+        # metadatos = {modelo: dict} con los parametros fijos de cada modelo
+        metadatos = metadatos or {}
+        self.directorio = directorio
+        self.modelos = list(modelos)
+        self.info = {"formato": FORMATO,
+                     "dimensiones": ["tiempo", "modelo", "limite", "polo", "coordenada", "punto"],
+                     "modelos": self.modelos, "limites": list(LIMITES), "polos": list(POLOS),
+                     "coordenadas": list(COORDENADAS), "variables": list(VARIABLES),
+                     "forma": [len(self.modelos), len(LIMITES), len(POLOS), len(COORDENADAS), int(puntos)],
+                     "metadatos": {m: metadatos.get(m, {}) for m in self.modelos}}
+        # ida y vuelta por json para comparar con el info.json guardado
+        self.info = json.loads(json.dumps(self.info))
+
+        rutaInfo, rutaOvalos, rutaTiempos = _rutas(directorio)
+        if os.path.exists(rutaInfo):
+            with open(rutaInfo) as f:
+                infoGuardada = json.load(f)
+            if infoGuardada != self.info:
+                raise ValueError(f"{directorio} tiene ovalos con otra configuracion: {infoGuardada}")
+            # se descarta un paso a medio escribir
+            self.pasos = _pasosCompletos(self.info, rutaOvalos, rutaTiempos)
+            for ruta, tamano in ((rutaOvalos, 4*np.prod(self.info["forma"])), (rutaTiempos, 8*len(VARIABLES))):
+                with open(ruta, "r+b") as f:
+                    f.truncate(self.pasos*tamano)
+        else:
+            os.makedirs(directorio, exist_ok=True)
+            for ruta in (rutaOvalos, rutaTiempos):
+                open(ruta, "wb").close()
+            with open(rutaInfo, "w") as f:
+                json.dump(self.info, f, indent=2)
+            self.pasos = 0
+
+        self._ovalos = open(rutaOvalos, "ab")
+        self._tiempos = open(rutaTiempos, "ab")
+
+    def __len__(self):
+        return self.pasos
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cerrar()
+
+    def escribir(self, ut, ovalos, kp=np.nan, parametros=None):
+
+        # agrega un paso de tiempo. ovalos = {modelo: array (2 limites, 2 polos, >=2, n)}
+        # con lat y lon en las dos primeras filas del eje 2 (n <= puntos), los modelos
+        # que faltan quedan con NaN. parametros = [Pdyn, Dst, ByIMF, BzIMF] de la hora
+        forma = self.info["forma"]
+        paso = np.full(forma, np.nan, dtype="<f4")
+        for modelo, valores in ovalos.items():
+            valores = np.asarray(valores, dtype=float)[:, :, :len(COORDENADAS)]
+            if valores.shape[-1] > forma[-1]:
+                raise ValueError(f"{modelo}: {valores.shape[-1]} puntos, el maximo es {forma[-1]}")
+            paso[self.modelos.index(modelo), ..., :valores.shape[-1]] = valores
+
+        parametros = np.full(4, np.nan) if parametros is None else parametros
+        tiempo = np.concatenate([[ut, kp], np.asarray(parametros, dtype=float)]).astype("<f8")
+
+        self._ovalos.write(paso.tobytes())
+        self._tiempos.write(tiempo.tobytes())
+        self._ovalos.flush()
+        self._tiempos.flush()
+        self.pasos += 1
+
+    def cerrar(self):
+        self._ovalos.close()
+        self._tiempos.close()
+
+def abrirOvalos(directorio):
+
+    # ovalos (T, modelo, limite, polo, coordenada, punto) y tiempos (T, variable) como
+    # memmap de solo lectura, con los pasos completos, e info
+    rutaInfo, rutaOvalos, rutaTiempos = _rutas(directorio)
+    with open(rutaInfo) as f:
+        info = json.load(f)
+    T = _pasosCompletos(info, rutaOvalos, rutaTiempos)
+    if T == 0:
+        return np.empty([0] + info["forma"], dtype="<f4"), np.empty((0, len(info["variables"]))), info
+
+    ovalos = np.memmap(rutaOvalos, dtype="<f4", mode="r", shape=tuple([T] + info["forma"]))
+    tiempos = np.memmap(rutaTiempos, dtype="<f8", mode="r", shape=(T, len(info["variables"])))
+
+    return ovalos, tiempos, info
+
+def exportarGeoJSON(directorio, destino, modelos=None):
+
+    # escribe los ovalos del directorio como FeatureCollection de GeoJSON: una
+    # LineString cerrada por limite, polo, modelo y paso de tiempo, con lon en
+    # [-180, 180). Se escribe de a un paso, sin armar toda la coleccion en memoria
+    ovalos, tiempos, info = abrirOvalos(directorio)
+    modelos = info["modelos"] if modelos is None else modelos
+    n = 0
+    with open(destino, "w") as f:
+        f.write('{"type": "FeatureCollection", "features": [\n')
+        for i in range(len(ovalos)):
+            propiedades = dict(zip(info["variables"], map(float, tiempos[i])))
+            propiedades["fecha"] = datetime.fromtimestamp(int(propiedades["ut"]), tz=timezone.utc).isoformat()
+            paso = np.asarray(ovalos[i], dtype=float)
+            for modelo in modelos:
+                m = info["modelos"].index(modelo)
+                for l, limite in enumerate(info["limites"]):
+                    for p, polo in enumerate(info["polos"]):
+                        lat, lon = paso[m, l, p]
+                        validos = np.isfinite(lat) & np.isfinite(lon)
+                        if validos.sum() < 2:
+                            continue
+                        lon = (lon[validos] + 180.) % 360. - 180.
+                        puntos = np.round(np.column_stack([lon, lat[validos]]), 4).tolist()
+                        feature = {"type": "Feature",
+                                   "geometry": {"type": "LineString", "coordinates": puntos + puntos[:1]},
+                                   "properties": dict(propiedades, modelo=modelo, limite=limite, polo=polo,
+                                                      metadatos=info["metadatos"].get(modelo, {}))}
+                        # nan no es JSON valido
+                        texto = json.dumps(feature).replace("NaN", "null")
+                        f.write((",\n" if n else "") + texto)
+                        n += 1
+        f.write("\n]}\n")
+
+    return n
+
+def _limitesStarkov(lat, lon):
+
+    # (T, 3 limites, 2 polos, N) de starkov.ovalosLote -> (T, 2 limites, 2 polos, 2, N)
+    return np.stack([lat[:, :2], lon[:, :2]], axis=3)
+
+def exportarTormenta(archivo, directorio, tormenta=None, kpEscala=2, P1=0.5, puntos=100, filas=1000):
+
+    # exporta para cada hora del archivo de OMNI los ovalos de Starkov (kp medido), de
+    # la hipotesis de escala (Starkov con kpEscala escalado con la presion de la hora,
+    # como en hipEscala.main) y, si se da el directorio de tormentaT96, los de T96.
+    # El archivo se recorre de a "filas" filas. Las horas con datos faltantes se
+    # escriben con kp NaN y sin ovalos de Starkov ni de escala (lat y lon NaN)
+    import starkov
+    from hipEscala import escalar
+
+    modelos = ["starkov", "escala"]
+    metadatos = {"starkov": {"kpMedido": True, "mlt": len(starkov.MLT)},
+                 "escala": {"kpFijo": kpEscala, "P1": P1}}
+    huellasT96 = None
+    if tormenta is not None:
+        from tormentaT96 import abrirTormenta
+        huellasT96, hecho, infoT96 = abrirTormenta(tormenta)
+        modelos.append("t96")
+        metadatos["t96"] = {"parmod": "Pdyn, Dst, ByIMF, BzIMF", "RS": infoT96["RS"],
+                            "RC": infoT96["RC"], "step": infoT96["step"]}
+
+    with EscritorOvalos(directorio, modelos, puntos, metadatos) as escritor:
+        i = 0
+        for datos, lat, lon in starkov.ovalosPorBloques(leerOMNIPorBloques(archivo, filas)):
+            starkovBloque = _limitesStarkov(lat, lon)
+            escala = _limitesStarkov(*starkov.ovalosLote(datos.fechas, np.full(len(datos), kpEscala)))
+            escala[:, :, :, 0] = escalar(escala[:, :, :, 0], P1, datos.parametros[:, 0, None, None, None])
+            starkovBloque[~datos.validas] = np.nan
+            escala[~datos.validas] = np.nan
+            kps = np.where(datos.validas, datos.kpMedido, np.nan)
+
+            for k in range(len(datos)):
+                if i + k < len(escritor):
+                    continue
+                ovalos = {"starkov": starkovBloque[k], "escala": escala[k]}
+                if huellasT96 is not None and hecho[i + k]:
+                    # (2 polos, 2 ovalos, 3, step) -> (2 limites, 2 polos, 3, step)
+                    ovalos["t96"] = np.asarray(huellasT96[i + k]).transpose(1, 0, 2, 3)
+                escritor.escribir(datos.ut[k], ovalos, kps[k], datos.parametros[k])
+            i += len(datos)
+
+        return len(escritor)
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Exporta los ovalos de una tormenta")
+    parser.add_argument("archivo", help="archivo .lst de OMNI")
+    parser.add_argument("salida", help="directorio de salida")
+    parser.add_argument("--tormenta", default=None, help="directorio de tormentaT96 con los ovalos de T96")
+    parser.add_argument("--geojson", default=None, help="archivo GeoJSON a escribir ademas")
+    args = parser.parse_args()
+
+    pasos = exportarTormenta(args.archivo, args.salida, args.tormenta)
+    print(f"{pasos} pasos en {args.salida}")
+    if args.geojson:
+        print(f"{exportarGeoJSON(args.salida, args.geojson)} limites en {args.geojson}")
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    start = time.time()
+
+    main()
+
+    end = time.time()
+    print(f"Tiempo de ejecución: {end - start:.3f} segundos")
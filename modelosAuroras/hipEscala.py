@@ -9,21 +9,34 @@ from utilidades import leerOMNI
 from starkov import ovalos
 from utilidades import zonaOvalo
 #%%
-# Funcion que calcula el cambio de latitudes por la hipotesis de escala en función de la presion
-def escalar(lat1, P1, P2):
+# Funcion que calcula el cambio de latitudes por la hipotesis de escala en función de la presion.
+# Las latitudes estan en grados (negativas en el hemisferio sur, se conserva el signo) y
+# lat1, P1 y P2 se combinan con el broadcasting de numpy. Si la presion crece mucho el
+# coseno de la latitud nueva pasaria de 1, se recorta y la latitud queda en 0. dtype es
+# el tipo de las cuentas y del resultado (np.float32 usa la mitad de memoria)
+def escalar(lat1, P1, P2, dtype=np.float64):
     
     # Las latitudes de entrada son en grados, se las pasa a radianes
-
-    
-    lat1 = np.deg2rad(lat1)
+    tipo = np.dtype(dtype).type
+    lat1 = np.asarray(lat1, dtype=tipo)
+    factor = (np.asarray(P2, dtype=tipo)/tipo(P1))**tipo(1/12)
     
     # esta expresion devuelve el cos de la latitud nueva,z=cos(lat2)
-    z = np.cos(lat1) * (P2/P1)**( 1/(12) )
+    z = np.cos(np.deg2rad(lat1)) * factor
     
-    lat2 = np.rad2deg( np.arccos(z) )
+    lat2 = np.rad2deg( np.arccos(np.clip(z, 0, 1)) )
+
 
+    return np.copysign(lat2, lat1)
 
-    return lat2
+# Escala un mismo ovalo base (latitudes (N,) o de cualquier forma) con toda una serie de
+# presiones (T,) en una sola pasada, devuelve un array (T, N)
+def escalarSerie(lat1, P1, presiones, dtype=np.float64):
+    
+    presiones = np.asarray(presiones, dtype=dtype)
+    presiones = presiones.reshape(presiones.shape + (1,)*np.ndim(lat1))
+    
+    return escalar(lat1, P1, presiones, dtype)
 
 
 def main():
@@ -55,13 +68,10 @@ def main():
         latEqEsc = escalar(ptsEq[0], P1, P2)    
                 
            
-        # Definir las latitudes y longitudes de los ovalos escalados
-        if polo == "sur":
-            ptsPoEsc = [-latPoEsc, ptsPo[1]]
-            ptsEqEsc = [-latEqEsc, ptsEq[1]]
-        else:          
-            ptsPoEsc = [latPoEsc, ptsPo[1]]
-            ptsEqEsc = [latEqEsc, ptsEq[1]]
+        # Definir las latitudes y longitudes de los ovalos escalados (escalar conserva
+        # el signo de las latitudes del sur)
+        ptsPoEsc = [latPoEsc, ptsPo[1]]
+        ptsEqEsc = [latEqEsc, ptsEq[1]]
         
         df = pd.DataFrame({
             "latPolar"   : ptsPo[0],
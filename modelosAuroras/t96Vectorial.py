@@ -0,0 +1,870 @@
+import types
+import numpy as np
+from scipy import special
+from geopack import t96 as t96Escalar
+
+#%%
+
+# Versión vectorial del modelo T96 de geopack: t96(parmod, ps, x, y, z) recibe arrays
+# de coordenadas GSM (Re) y devuelve arrays con el campo en nT, con los mismos
+# resultados que geopack.t96.t96 punto a punto.
+#
+# Las funciones de geopack.t96 que ya funcionan con arrays (sin "if" sobre las
+# coordenadas) se reutilizan tal cual, pero ligadas a los globales de este modulo,
+# asi cuando llaman a circle, xksi, cylharm, etc. usan las versiones vectoriales de
+# abajo, y los bloques "common" (/warp/) de tailrc96 quedan en este modulo sin tocar
+# el estado de geopack.
+
+def _adoptar(*nombres):
+    for nombre in nombres:
+        f = getattr(t96Escalar, nombre)
+        globals()[nombre] = types.FunctionType(f.__code__, globals(), nombre, f.__defaults__)
+
+_adoptar("dipshld", "tailrc96", "tail87", "dipxyz", "crosslp", "birk1shld",
+         "birk2tot_02", "birk2shl", "fexp", "fexp1", "r2outer", "loops4", "r2sheet",
+         "r2inner", "dipdistr", "intercon", "dipole")
+
+# constantes de los bloques /coord11/, /rhdr/, /loopdip1/, /coord21/ y /dx1/ de birk1tot_02
+rh, dr = [9., 4.]
+tilt, xcentre, radius, dipx, dipy = [1.00891, [2.28397, -5.60831], [1.86106, 7.83281], 1.12541, 0.945719]
+dx, scalein, scaleout = [-0.16, 0.08, 0.4]
+xx1 = np.array([-11., -7, -7, -3, -3, 1, 1, 1, 5, 5, 9, 9])
+yy1 = np.array([2., 0, 4, 2, 6, 0, 4, 8, 2, 6, 0, 4])
+xx2 = np.array([-10., -7, -4, -4, 0, 4, 4, 7, 10, 0, 0, 0, 0, 0])
+yy2 = np.array([3., 6, 3, 9, 6, 3, 9, 6, 3, 0, 0, 0, 0, 0])
+zz2 = np.array([20., 20, 4, 20, 4, 4, 20, 20, 20, 2, 3, 4.5, 7, 10])
+
+# coeficientes lineales de la region 1 (alta latitud: c1, plasma sheet: c2)
+c1R1 = np.array([
+    -0.911582e-03,-0.376654e-02,-0.727423e-02,-0.270084e-02,-0.123899E-02,
+    -0.154387E-02,-0.340040E-02,-0.191858E-01,-0.518979E-01,0.635061E-01,
+    0.440680,-0.396570,0.561238E-02,0.160938E-02,-0.451229E-02,
+    -0.251810E-02,-0.151599E-02,-0.133665E-02,-0.962089E-03,-0.272085E-01,
+    -0.524319E-01,0.717024E-01,0.523439,-0.405015,-89.5587,23.2806])
+c2R1 = np.array([
+    6.04133,.305415,.606066e-02,.128379e-03,-.179406e-04,
+    1.41714,-27.2586,-4.28833,-1.30675,35.5607,8.95792,.961617E-03,
+    -.801477E-03,-.782795E-03,-1.65242,-16.5242,-5.33798,.424878E-03,
+    .331787E-03,-.704305E-03,.844342E-03,.953682E-04,.886271E-03,
+    25.1120,20.9299,5.14569,-44.1670,-51.0672,-1.87725,20.2998,
+    48.7505,-2.97415,3.35184,-54.2921,-.838712,-10.5123,70.7594,
+    -4.94104,.106166E-03,.465791E-03,-.193719E-03,10.8439,-29.7968,
+     8.08068,.463507E-03,-.224475E-04,.177035E-03,-.317581E-03,
+    -.264487E-03,.102075E-03,7.71390,10.1915,-4.99797,-23.1114,
+    -29.2043,12.2928,10.9542,33.6671,-9.3851,.174615E-03,-.789777E-06,
+    .686047E-03,.460104E-04,-.345216E-02,.221871E-02,.110078E-01,
+    -.661373E-02,.249201E-02,.343978E-01,-.193145E-05,.493963E-05,
+    -.535748E-04,.191833E-04,-.100496E-03,-.210103E-03,-.232195E-02,
+    .315335E-02,-.134320E-01,-.263222E-01])
+
+
+def t96(parmod, ps, x, y, z):
+
+    # mismo calculo que geopack.t96.t96, los tres casos (dentro de la magnetosfera,
+    # capa limite y fuera) se separan con mascaras en vez de "if"
+    x, y, z = np.broadcast_arrays(*[np.atleast_1d(np.asarray(c, dtype=float)) for c in (x, y, z)])
+
+    pdyn0,eps10 = [2.,3630.7]
+    a = np.array([1.162,22.344,18.50,2.602,6.903,5.287,0.5790,0.4462,0.7850])
+    s0,dsig = [1.08,0.005]
+    delimfx,delimfy = [20.,10.]
+    pdyn,dst,byimf,bzimf = parmod[0:4]
+
+    sps=np.sin(ps)
+    depr=0.8*dst-13.*np.sqrt(pdyn)
+
+    # cantidades relacionadas con el IMF (escalares)
+    bt=np.sqrt(byimf**2+bzimf**2)
+    if (byimf == 0) & (bzimf == 0):
+        theta = 0
+    else:
+        theta=np.arctan2(byimf,bzimf)
+        if theta < 0: theta += 2*np.pi
+    ct=np.cos(theta)
+    st=np.sin(theta)
+    eps=718.5*np.sqrt(pdyn)*bt*np.sin(theta/2.)
+
+    facteps=eps/eps10-1.
+    factpd=np.sqrt(pdyn/pdyn0)-1.
+    rcampl=-a[0]*depr
+
+    tampl2=a[1]+a[2]*factpd+a[3]*facteps
+    tampl3=a[4]+a[5]*factpd
+    b1ampl=a[6]+a[7]*facteps
+    b2ampl=20.*b1ampl
+    reconn=a[8]
+
+    xappa=(pdyn/pdyn0)**0.14
+    xappa3=xappa**3
+    ys=y*ct-z*st
+    zs=z*ct+y*st
+
+    factimf=np.exp(x/delimfx-(ys/delimfy)**2)
+
+    oimfx=0.
+    oimfy=reconn*byimf*factimf
+    oimfz=reconn*bzimf*factimf
+
+    rimfampl=reconn*bt
+
+    xx=x*xappa
+    yy=y*xappa
+    zz=z*xappa
+
+    sigma=_sigma(xappa, x, y, z)
+
+    # caso (3), fuera de la magnetosfera y de la capa limite: solo el IMF
+    qx,qy,qz = dipole(ps,x,y,z)
+    bx=oimfx-qx
+    by=oimfy-qy
+    bz=oimfz-qz
+
+    # casos (1) y (2): se calcula el campo del modelo solo para esos puntos
+    dentro = sigma < (s0+dsig)
+    if np.any(dentro):
+        xd, yd, zd = xx[dentro], yy[dentro], zz[dentro]
+        cfx,cfy,cfz = dipshld(ps,xd,yd,zd)
+        bxrc,byrc,bzrc,bxt2,byt2,bzt2,bxt3,byt3,bzt3 = tailrc96(sps,xd,yd,zd)
+        r1x,r1y,r1z = birk1tot_02(ps,xd,yd,zd)
+        r2x,r2y,r2z = birk2tot_02(ps,xd,yd,zd)
+        rimfx,rimfys,rimfzs = intercon(xd,ys[dentro]*xappa,zs[dentro]*xappa)
+        rimfy=rimfys*ct+rimfzs*st
+        rimfz=rimfzs*ct-rimfys*st
+
+        fx=cfx*xappa3 + rcampl*bxrc+tampl2*bxt2+tampl3*bxt3+ b1ampl*r1x +b2ampl*r2x +rimfampl*rimfx
+        fy=cfy*xappa3 + rcampl*byrc+tampl2*byt2+tampl3*byt3+ b1ampl*r1y +b2ampl*r2y +rimfampl*rimfy
+        fz=cfz*xappa3 + rcampl*bzrc+tampl2*bzt2+tampl3*bzt3+ b1ampl*r1z +b2ampl*r2z +rimfampl*rimfz
+
+        # en la capa limite se interpola entre el campo del modelo y el IMF, en el
+        # interior (sigma < s0-dsig) fint=1 y fext=0 dan exactamente fx,fy,fz
+        sd = sigma[dentro]
+        fint=np.where(sd < (s0-dsig), 1., 0.5*(1.-(sd-s0)/dsig))
+        fext=np.where(sd < (s0-dsig), 0., 0.5*(1.+(sd-s0)/dsig))
+        qxd, qyd, qzd = qx[dentro], qy[dentro], qz[dentro]
+        oimfyd, oimfzd = oimfy[dentro], oimfz[dentro]
+
+        bx[dentro]=np.where(fext == 0, fx, (fx+qxd)*fint+oimfx*fext -qxd)
+        by[dentro]=np.where(fext == 0, fy, (fy+qyd)*fint+oimfyd*fext -qyd)
+        bz[dentro]=np.where(fext == 0, fz, (fz+qzd)*fint+oimfzd*fext -qzd)
+
+    return bx,by,bz
+
+
+def _sigma(xappa, x, y, z):
+
+    # coordenada "sigma" de la magnetopausa del modelo (1.08 en la frontera), en la
+    # forma de t96: elipsoide adelante y cilindro detras de x=x0-am
+    x0=5.48/xappa
+    am=70./xappa
+    rho2=y**2+z**2
+    asq=am**2
+    xmxm=np.maximum(am+x-x0, 0)
+    axx0=xmxm**2
+    aro=asq+rho2
+
+    return np.sqrt((aro+axx0+np.sqrt((aro+axx0)**2-4.*asq*axx0))/(2.*asq))
+
+def fueraMagnetopausa(parmod, x, y, z):
+
+    # True para los puntos donde t96 ya no calcula el campo del modelo (fuera de la
+    # magnetopausa y de la capa limite), ahi solo queda el IMF
+    xappa=(parmod[0]/2.)**0.14
+
+    return _sigma(xappa, np.asarray(x), np.asarray(y), np.asarray(z)) >= 1.08+0.005
+
+def cylharm(a, x,y,z):
+
+    # apantallamiento del dipolo perpendicular (ver geopack.t96.cylharm)
+    rho=np.sqrt(y**2+z**2)
+    eje = rho < 1e-8
+    rho=np.where(eje, 1e-8, rho)
+    sinfi=np.where(eje, 1., z/rho)
+    cosfi=np.where(eje, 0., y/rho)
+
+    sinfi2=sinfi**2
+    si2co2=sinfi2-cosfi**2
+
+    bx,by,bz =[0.]*3
+
+    for i in range(3):
+        dzeta=rho/a[i+6]
+        xksi=x/a[i+6]
+        xj0=special.j0(dzeta)
+        xj1=special.j1(dzeta)
+        xexp=np.exp(xksi)
+        bx=bx-a[i]*xj1*xexp*sinfi
+        by=by+a[i]*(2*xj1/dzeta-xj0)*xexp*sinfi*cosfi
+        bz=bz+a[i]*(xj1/dzeta*si2co2-xj0*sinfi2)*xexp
+
+    for i in range(3,6):
+        dzeta=rho/a[i+6]
+        xksi=x/a[i+6]
+        xj0=special.j0(dzeta)
+        xj1=special.j1(dzeta)
+        xexp=np.exp(xksi)
+        brho=(xksi*xj0-(dzeta**2+xksi-1)*xj1/dzeta)*xexp*sinfi
+        bphi=(xj0+xj1/dzeta*(xksi-1))*xexp*cosfi
+        bx=bx+a[i]*(dzeta*xj0+xksi*xj1)*xexp*sinfi
+        by=by+a[i]*(brho*cosfi-bphi*sinfi)
+        bz=bz+a[i]*(brho*sinfi+bphi*cosfi)
+
+    return bx,by,bz
+
+def cylhar1(a, x,y,z):
+
+    # apantallamiento del dipolo paralelo (ver geopack.t96.cylhar1)
+    rho=np.sqrt(y**2+z**2)
+    eje = rho < 1e-8
+    rho=np.where(eje, 1e-8, rho)
+    sinfi=np.where(eje, 1., z/rho)
+    cosfi=np.where(eje, 0., y/rho)
+
+    bx,by,bz =[0.]*3
+
+    for i in range(3):
+        dzeta=rho/a[i+6]
+        xksi=x/a[i+6]
+        xj0=special.j0(dzeta)
+        xj1=special.j1(dzeta)
+        xexp=np.exp(xksi)
+        brho=xj1*xexp
+        bx=bx-a[i]*xj0*xexp
+        by=by+a[i]*brho*cosfi
+        bz=bz+a[i]*brho*sinfi
+
+    for i in range(3,6):
+        dzeta=rho/a[i+6]
+        xksi=x/a[i+6]
+        xj0=special.j0(dzeta)
+        xj1=special.j1(dzeta)
+        xexp=np.exp(xksi)
+        brho=(dzeta*xj0+xksi*xj1)*xexp
+        bx=bx+a[i]*(dzeta*xj1-xj0*(xksi+1))*xexp
+        by=by+a[i]*brho*cosfi
+        bz=bz+a[i]*brho*sinfi
+
+    return bx,by,bz
+
+def _derivadasRhos(rhos, xs, y):
+
+    # derivadas de rhos comunes a ringcurr96 y taildisk, con el caso rhos ~ 0 aparte
+    eje = rhos < 1e-5
+    rhosS = np.where(eje, 1., rhos)
+    drhosdx = np.where(eje, 0., xs*dxsx/rhosS)
+    drhosdy = np.where(eje, np.sign(y), (xs*dxsy+y)/rhosS)
+    drhosdz = np.where(eje, 0., xs*dxsz/rhosS)
+
+    return drhosdx, drhosdy, drhosdz
+
+def ringcurr96(x,y,z):
+
+    # corriente de anillo (ver geopack.t96.ringcurr96), usa el bloque /warp/ que
+    # deja tailrc96 en los globales de este modulo
+    d0,deltadx,xd,xldx = [2.,0.,0.,4.]
+    f = np.array([569.895366,-1603.386993])
+    beta = np.array([2.722188,3.766875])
+
+    dzsy=xs*y*dpsrr
+    xxd=x-xd
+    fdx=0.5*(1+xxd/np.sqrt(xxd**2+xldx**2))
+    dddx=deltadx*0.5*xldx**2/np.sqrt(xxd**2+xldx**2)**3
+    d=d0+deltadx*fdx
+
+    zs=zsww
+    dzetas=np.sqrt(zs**2+d**2)
+    rhos=  np.sqrt(xs**2+y**2)
+    ddzetadx=(zs*dzsx+d*dddx)/dzetas
+    ddzetady=zs*dzsy/dzetas
+    ddzetadz=zs*dzsz/dzetas
+
+    drhosdx, drhosdy, drhosdz = _derivadasRhos(rhos, xs, y)
+
+    bx,by,bz = [0.]*3
+
+    for i in range(2):
+        bi = beta[i]
+        s1=np.sqrt((dzetas+bi)**2+(rhos+bi)**2)
+        s2=np.sqrt((dzetas+bi)**2+(rhos-bi)**2)
+        ds1ddz=(dzetas+bi)/s1
+        ds2ddz=(dzetas+bi)/s2
+        ds1drhos=(rhos+bi)/s1
+        ds2drhos=(rhos-bi)/s2
+
+        ds1dx=ds1ddz*ddzetadx+ds1drhos*drhosdx
+        ds1dy=ds1ddz*ddzetady+ds1drhos*drhosdy
+        ds1dz=ds1ddz*ddzetadz+ds1drhos*drhosdz
+
+        ds2dx=ds2ddz*ddzetadx+ds2drhos*drhosdx
+        ds2dy=ds2ddz*ddzetady+ds2drhos*drhosdy
+        ds2dz=ds2ddz*ddzetadz+ds2drhos*drhosdz
+
+        s1ts2=s1*s2
+        s1ps2=s1+s2
+        s1ps2sq=s1ps2**2
+        fac1=np.sqrt(s1ps2sq-(2*bi)**2)
+        as0=fac1/(s1ts2*s1ps2sq)
+        term1=1/(s1ts2*s1ps2*fac1)
+        fac2=as0/s1ps2sq
+        dasds1=term1-fac2/s1*(s2*s2+s1*(3*s1+4*s2))
+        dasds2=term1-fac2/s2*(s1*s1+s2*(3*s2+4*s1))
+
+        dasdx=dasds1*ds1dx+dasds2*ds2dx
+        dasdy=dasds1*ds1dy+dasds2*ds2dy
+        dasdz=dasds1*ds1dz+dasds2*ds2dz
+
+        bx=bx+f[i]*((2*as0+y*dasdy)*spss-xs*dasdz+as0*dpsrr*(y**2*cpss+z*zs))
+        by=by-f[i]*y*(as0*dpsrr*xs+dasdz*cpss+dasdx*spss)
+        bz=bz+f[i]*((2*as0+y*dasdy)*cpss+xs*dasdx-as0*dpsrr*(x*zs+y**2*spss))
+
+    return bx,by,bz
+
+def taildisk(x,y,z):
+
+    # disco de corriente de la cola (ver geopack.t96.taildisk)
+    xshift = 4.5
+    f = np.array([-745796.7338,1176470.141,-444610.529,-57508.01028])
+    beta = np.array([7.9250000,8.0850000,8.4712500,27.89500])
+
+    rhos=np.sqrt((xs-xshift)**2+y**2)
+    drhosdx, drhosdy, drhosdz = _derivadasRhos(rhos, xs-xshift, y)
+
+    bx,by,bz = [0.]*3
+
+    for i in range(4):
+        bi=beta[i]
+
+        s1=np.sqrt((dzetas+bi)**2+(rhos+bi)**2)
+        s2=np.sqrt((dzetas+bi)**2+(rhos-bi)**2)
+        ds1ddz=(dzetas+bi)/s1
+        ds2ddz=(dzetas+bi)/s2
+        ds1drhos=(rhos+bi)/s1
+        ds2drhos=(rhos-bi)/s2
+
+        ds1dx=ds1ddz*ddzetadx+ds1drhos*drhosdx
+        ds1dy=ds1ddz*ddzetady+ds1drhos*drhosdy
+        ds1dz=ds1ddz*ddzetadz+ds1drhos*drhosdz
+
+        ds2dx=ds2ddz*ddzetadx+ds2drhos*drhosdx
+        ds2dy=ds2ddz*ddzetady+ds2drhos*drhosdy
+        ds2dz=ds2ddz*ddzetadz+ds2drhos*drhosdz
+
+        s1ts2=s1*s2
+        s1ps2=s1+s2
+        s1ps2sq=s1ps2**2
+        fac1=np.sqrt(s1ps2sq-(2*bi)**2)
+        as0=fac1/(s1ts2*s1ps2sq)
+        term1=1/(s1ts2*s1ps2*fac1)
+        fac2=as0/s1ps2sq
+        dasds1=term1-fac2/s1*(s2*s2+s1*(3*s1+4*s2))
+        dasds2=term1-fac2/s2*(s1*s1+s2*(3*s2+4*s1))
+
+        dasdx=dasds1*ds1dx+dasds2*ds2dx
+        dasdy=dasds1*ds1dy+dasds2*ds2dy
+        dasdz=dasds1*ds1dz+dasds2*ds2dz
+
+        bx=bx+f[i]*((2*as0+y*dasdy)*spss-(xs-xshift)*dasdz+as0*dpsrr*(y**2*cpss+z*zsww))
+        by=by-f[i]*y*(as0*dpsrr*xs+dasdz*cpss+dasdx*spss)
+        bz=bz+f[i]*((2*as0+y*dasdy)*cpss+(xs-xshift)*dasdx-as0*dpsrr*(x*zsww+y**2*spss))
+
+    return bx,by,bz
+
+def _puntosFrontera(r, r3, pas, cpsas, spsas, t01, t02, signo):
+
+    # puntos sobre los bordes norte (1) y sur (2) de la zona de interpolacion de la region 1
+    sqr=np.sqrt(r)
+    st01as=sqr/(r3+1/np.sin(t01)**6-1)**0.1666666667
+    st02as=sqr/(r3+1/np.sin(t02)**6-1)**0.1666666667
+    ct01as=signo*np.sqrt(1-st01as**2)
+    ct02as=signo*np.sqrt(1-st02as**2)
+
+    xas1=r*st01as*np.cos(pas)
+    y1=  r*st01as*np.sin(pas)
+    zas1=r*ct01as
+    x1= xas1*cpsas+zas1*spsas
+    z1=-xas1*spsas+zas1*cpsas
+
+    xas2=r*st02as*np.cos(pas)
+    y2=  r*st02as*np.sin(pas)
+    zas2=r*ct02as
+    x2= xas2*cpsas+zas2*spsas
+    z2=-xas2*spsas+zas2*cpsas
+
+    return x1, y1, z1, x2, y2, z2
+
+def _loopR1(x, y, z, ps):
+    d = diploop1([x, y, z, ps])
+    return c1R1 @ d[0], c1R1 @ d[1], c1R1 @ d[2]
+
+def _conR1(x, y, z, ps):
+    d = condip1([x, y, z, ps])
+    return c2R1 @ d[0], c2R1 @ d[1], c2R1 @ d[2]
+
+def birk1tot_02(ps, x,y,z):
+
+    # corrientes de la region 1 (ver geopack.t96.birk1tot_02), cada punto se clasifica
+    # en una de las cuatro zonas (alta latitud, plasma sheet, psbl norte o sur) y cada
+    # zona se calcula sobre su subconjunto de puntos
+    xltday,xltnght = [78.,70.]
+    dtet0 = 0.034906
+
+    tnoonn=(90-xltday)*0.01745329
+    tnoons=np.pi-tnoonn
+    dtetdn=(xltday-xltnght)*0.01745329
+    dr2=dr**2
+
+    sps=np.sin(ps)
+    r2=x**2+y**2+z**2
+    r=np.sqrt(r2)
+    r3=r*r2
+
+    rmrh=r-rh
+    rprh=r+rh
+    sqm=np.sqrt(rmrh**2+dr2)
+    sqp=np.sqrt(rprh**2+dr2)
+    c=sqp-sqm
+    q=np.sqrt((rh+1)**2+dr2)-np.sqrt((rh-1)**2+dr2)
+    spsas=sps/r*c/q
+    cpsas=np.sqrt(1-spsas**2)
+    xas = x*cpsas-z*spsas
+    zas = x*spsas+z*cpsas
+    pas = np.arctan2(y,xas)    # arctan2(0,0) = 0 como en la version escalar
+    tas=np.arctan2(np.sqrt(xas**2+y**2),zas)
+    stas=np.sin(tas)
+    f=stas/(stas**6*(1-r3)+r3)**0.1666666667
+
+    tet0=np.arcsin(f)
+    tet0=np.where(tas > 1.5707963, np.pi-tet0, tet0)
+    dtet=dtetdn*np.sin(pas*0.5)**2
+    tetr1n=tnoonn+dtet
+    tetr1s=tnoons-dtet
+
+    # mismas condiciones y en el mismo orden que la version escalar
+    loc = np.zeros(np.shape(x), dtype=int)
+    loc[(tet0 < tetr1n-dtet0) | (tet0 > tetr1s+dtet0)] = 1      # alta latitud
+    loc[(tet0 > tetr1n+dtet0) & (tet0 < tetr1s-dtet0)] = 2      # plasma sheet
+    loc[(tet0 >= tetr1n-dtet0) & (tet0 <= tetr1n+dtet0)] = 3    # psbl norte
+    loc[(tet0 >= tetr1s-dtet0) & (tet0 <= tetr1s+dtet0)] = 4    # psbl sur
+    if np.any(loc == 0): raise ValueError
+
+    bx = np.zeros(np.shape(x))
+    by = np.zeros(np.shape(x))
+    bz = np.zeros(np.shape(x))
+
+    m = loc == 1
+    if np.any(m):
+        bx[m], by[m], bz[m] = _loopR1(x[m], y[m], z[m], ps)
+    m = loc == 2
+    if np.any(m):
+        bx[m], by[m], bz[m] = _conR1(x[m], y[m], z[m], ps)
+
+    # en las zonas de transicion se interpola entre el campo en el borde norte y el sur
+    for zona in (3, 4):
+        m = loc == zona
+        if not np.any(m):
+            continue
+        if zona == 3:
+            t01, t02, signo = tetr1n[m]-dtet0, tetr1n[m]+dtet0, 1
+        else:
+            t01, t02, signo = tetr1s[m]-dtet0, tetr1s[m]+dtet0, -1
+        x1, y1, z1, x2, y2, z2 = _puntosFrontera(r[m], r3[m], pas[m], cpsas[m], spsas[m], t01, t02, signo)
+        if zona == 3:
+            bx1, by1, bz1 = _loopR1(x1, y1, z1, ps)
+            bx2, by2, bz2 = _conR1(x2, y2, z2, ps)
+        else:
+            bx1, by1, bz1 = _conR1(x1, y1, z1, ps)
+            bx2, by2, bz2 = _loopR1(x2, y2, z2, ps)
+
+        ss=np.sqrt((x2-x1)**2+(y2-y1)**2+(z2-z1)**2)
+        ds=np.sqrt((x[m]-x1)**2+(y[m]-y1)**2+(z[m]-z1)**2)
+        frac=ds/ss
+        bx[m]=bx1*(1-frac)+bx2*frac
+        by[m]=by1*(1-frac)+by2*frac
+        bz[m]=bz1*(1-frac)+bz2*frac
+
+    # campo de apantallamiento
+    bsx,bsy,bsz = birk1shld(ps, x,y,z)
+
+    return bx+bsx, by+bsy, bz+bsz
+
+def _inclinacion(r, sps):
+
+    # seno y coseno del angulo de inclinacion "deformado" a la distancia r (diploop1)
+    dr2=dr**2
+    sqm=np.sqrt((r-rh)**2+dr2)
+    sqp=np.sqrt((r+rh)**2+dr2)
+    c=sqp-sqm
+    q=np.sqrt((rh+1)**2+dr2)-np.sqrt((rh-1)**2+dr2)
+    spsas=sps/r*c/q
+    cpsas=np.sqrt(1-spsas**2)
+
+    return spsas, cpsas
+
+def diploop1(xi):
+
+    # igual que geopack.t96.diploop1 pero d tiene una dimension extra para los puntos,
+    # y los 12 dipolos se calculan juntos (primer eje) en vez de uno por uno
+    x,y,z, ps = xi
+    sps=np.sin(ps)
+    d = np.empty((3,26)+np.shape(x))
+
+    # posiciones de los 12 dipolos
+    r=np.sqrt((xx1*dipx)**2+(yy1*dipy)**2)
+    spsas, cpsas = _inclinacion(r, sps)
+    xd= ((xx1*dipx)*cpsas)[:, None]
+    yd= (yy1*dipy)[:, None]
+    zd=(-(xx1*dipx)*spsas)[:, None]
+    bx1x,by1x,bz1x,bx1y,by1y,bz1y,bx1z,by1z,bz1z = dipxyz(x-xd,y-yd,z-zd)
+    # los dipolos con yd != 0 van de a pares, el segundo es el simetrico en y
+    par = np.abs(yd) > 1e-10
+    bx2x,by2x,bz2x,bx2y,by2y,bz2y,bx2z,by2z,bz2z = [c*par for c in dipxyz(x-xd,y+yd,z-zd)]
+
+    d[0,0:12]=bx1z+bx2z
+    d[1,0:12]=by1z+by2z
+    d[2,0:12]=bz1z+bz2z
+    d[0,12:24]=(bx1x+bx2x)*sps
+    d[1,12:24]=(by1x+by2x)*sps
+    d[2,12:24]=(bz1x+bz2x)*sps
+
+    spsas, cpsas = _inclinacion(np.sqrt((xcentre[0]+radius[0])**2), sps)
+    xoct1= x*cpsas-z*spsas
+    yoct1= y
+    zoct1= x*spsas+z*cpsas
+
+    bxoct1,byoct1,bzoct1 = crosslp(xoct1,yoct1,zoct1,xcentre[0],radius[0],tilt)
+    d[0,24]= bxoct1*cpsas+bzoct1*spsas
+    d[1,24]= byoct1
+    d[2,24]=-bxoct1*spsas+bzoct1*cpsas
+
+    spsas, cpsas = _inclinacion(np.sqrt((radius[1]-xcentre[1])**2), sps)
+    xoct2= x*cpsas-z*spsas -xcentre[1]
+    yoct2= y
+    zoct2= x*spsas+z*cpsas
+    bx,by,bz = circle(xoct2,yoct2,zoct2,radius[1])
+    d[0,25] =  bx*cpsas+bz*spsas
+    d[1,25] =  by
+    d[2,25] = -bx*spsas+bz*cpsas
+
+    return d
+
+def circle(x,y,z,rl):
+
+    # espira circular de radio rl (ver geopack.t96.circle)
+    rho2=x*x+y*y
+    rho=np.sqrt(rho2)
+    r22=z*z+(rho+rl)**2
+    r2=np.sqrt(r22)
+    r12=r22-4*rho*rl
+    r32=0.5*(r12+r22)
+    xk2=1-r12/r22
+    xk2s=1-xk2
+    dl=np.log(1/xk2s)
+    k=1.38629436112+xk2s*(0.09666344259+xk2s*(0.03590092383+xk2s*(0.03742563713+xk2s*0.01451196212)))+\
+      dl*(0.5+xk2s*(0.12498593597+xk2s*(0.06880248576+xk2s*(0.03328355346+xk2s*0.00441787012))))
+    e=1+xk2s*(0.44325141463+xk2s*(0.0626060122+xk2s*(0.04757383546+xk2s*0.01736506451)))+\
+      dl*xk2s*(0.2499836831+xk2s*(0.09200180037+xk2s*(0.04069697526+xk2s*0.00526449639)))
+
+    lejos = rho > 1e-6
+    rho2S = np.where(lejos, rho2, 1.)
+    brho=np.where(lejos,
+                  z/(rho2S*r2)*(r32/r12*e-k),
+                  np.pi*rl/r2*(rl-rho)/r12*z/(r32-rho2))
+
+    bx=brho*x
+    by=brho*y
+    bz=(k-e*(r32-2*rl*rl)/r12)/r2
+
+    return bx,by,bz
+
+def condip1(xi):
+
+    # igual que geopack.t96.condip1 pero d, cf y sf tienen una dimension extra para los
+    # puntos, y los dipolos de cada grupo se calculan juntos (primer eje)
+    x,y,z, ps = xi
+    sps=np.sin(ps)
+    cps=np.cos(ps)
+    d = np.empty((3,79)+np.shape(x))
+    cf = np.empty((5,)+np.shape(x))
+    sf = np.empty((5,)+np.shape(x))
+
+    xsm=x*cps-z*sps-dx
+    zsm=z*cps+x*sps
+    ro2=xsm**2+y**2
+    ro=np.sqrt(ro2)
+
+    cf[0]=xsm/ro
+    sf[0]=y/ro
+    for m in range(1,5):
+        cf[m]=cf[m-1]*cf[0]-sf[m-1]*sf[0]
+        sf[m]=sf[m-1]*cf[0]+cf[m-1]*sf[0]
+
+    r2=ro2+zsm**2
+    r=np.sqrt(r2)
+    c=zsm/r
+    s=ro/r
+    ch=np.sqrt(0.5*(1+c))
+    sh=np.sqrt(0.5*(1-c))
+    tnh=sh/ch
+    cnh=1/tnh
+
+    # d[:,0:5], armonicos conicos
+    m = np.arange(5)[:, None]
+    m1 = m+1
+    bt=m1*cf/(r*s)*(tnh**m1+cnh**m1)
+    bf=-0.5*m1*sf/r*(tnh**m/ch**2-cnh**m/sh**2)
+    bxsm= bt*c*cf[0]-bf*sf[0]
+    by  = bt*c*sf[0]+bf*cf[0]
+    bzsm=-bt*s
+
+    d[0,0:5]= bxsm*cps+bzsm*sps
+    d[1,0:5]= by
+    d[2,0:5]=-bxsm*sps+bzsm*cps
+
+    xsm = x*cps-z*sps
+    zsm = z*cps+x*sps
+
+    # d[:,5:32] y d[:,32:59], 9 grupos de 4 dipolos
+    escala = np.where(np.isin(np.arange(9), (2, 4, 5)), scalein, scaleout)
+    xd = (xx2[:9]*escala)[:, None]
+    yd = (yy2[:9]*escala)[:, None]
+    zd = zz2[:9][:, None]
+
+    bx1x,by1x,bz1x,bx1y,by1y,bz1y,bx1z,by1z,bz1z = dipxyz(xsm-xd,y-yd,zsm-zd)
+    bx2x,by2x,bz2x,bx2y,by2y,bz2y,bx2z,by2z,bz2z = dipxyz(xsm-xd,y+yd,zsm-zd)
+    bx3x,by3x,bz3x,bx3y,by3y,bz3y,bx3z,by3z,bz3z = dipxyz(xsm-xd,y-yd,zsm+zd)
+    bx4x,by4x,bz4x,bx4y,by4y,bz4y,bx4z,by4z,bz4z = dipxyz(xsm-xd,y+yd,zsm+zd)
+
+    ix = slice(5,32,3)
+    iy = slice(6,32,3)
+    iz = slice(7,32,3)
+
+    d[0,ix]=(bx1x+bx2x-bx3x-bx4x)*cps+(bz1x+bz2x-bz3x-bz4x)*sps
+    d[1,ix]= by1x+by2x-by3x-by4x
+    d[2,ix]=(bz1x+bz2x-bz3x-bz4x)*cps-(bx1x+bx2x-bx3x-bx4x)*sps
+
+    d[0,iy]=(bx1y-bx2y-bx3y+bx4y)*cps+(bz1y-bz2y-bz3y+bz4y)*sps
+    d[1,iy]= by1y-by2y-by3y+by4y
+    d[2,iy]=(bz1y-bz2y-bz3y+bz4y)*cps-(bx1y-bx2y-bx3y+bx4y)*sps
+
+    d[0,iz]=(bx1z+bx2z+bx3z+bx4z)*cps+(bz1z+bz2z+bz3z+bz4z)*sps
+    d[1,iz]= by1z+by2z+by3z+by4z
+    d[2,iz]=(bz1z+bz2z+bz3z+bz4z)*cps-(bx1z+bx2z+bx3z+bx4z)*sps
+
+    ix = slice(32,59,3)
+    iy = slice(33,59,3)
+    iz = slice(34,59,3)
+
+    d[0,ix]=sps*((bx1x+bx2x+bx3x+bx4x)*cps+(bz1x+bz2x+bz3x+bz4x)*sps)
+    d[1,ix]=sps*(by1x+by2x+by3x+by4x)
+    d[2,ix]=sps*((bz1x+bz2x+bz3x+bz4x)*cps-(bx1x+bx2x+bx3x+bx4x)*sps)
+
+    d[0,iy]=sps*((bx1y-bx2y+bx3y-bx4y)*cps+(bz1y-bz2y+bz3y-bz4y)*sps)
+    d[1,iy]=sps*(by1y-by2y+by3y-by4y)
+    d[2,iy]=sps*((bz1y-bz2y+bz3y-bz4y)*cps-(bx1y-bx2y+bx3y-bx4y)*sps)
+
+    d[0,iz]=sps*((bx1z+bx2z-bx3z-bx4z)*cps+(bz1z+bz2z-bz3z-bz4z)*sps)
+    d[1,iz]=sps*(by1z+by2z-by3z-by4z)
+    d[2,iz]=sps*((bz1z+bz2z-bz3z-bz4z)*cps-(bx1z+bx2z-bx3z-bx4z)*sps)
+
+    # d[:,59:69] y d[:,69:79], 5 pares de dipolos sobre el eje z
+    zd=zz2[9:14][:, None]
+    bx1x,by1x,bz1x,bx1y,by1y,bz1y,bx1z,by1z,bz1z = dipxyz(xsm,y,zsm-zd)
+    bx2x,by2x,bz2x,bx2y,by2y,bz2y,bx2z,by2z,bz2z = dipxyz(xsm,y,zsm+zd)
+
+    ix = slice(59,69,2)
+    iz = slice(60,69,2)
+    d[0,ix]=(bx1x-bx2x)*cps+(bz1x-bz2x)*sps
+    d[1,ix]= by1x-by2x
+    d[2,ix]=(bz1x-bz2x)*cps-(bx1x-bx2x)*sps
+
+    d[0,iz]=(bx1z+bx2z)*cps+(bz1z+bz2z)*sps
+    d[1,iz]= by1z+by2z
+    d[2,iz]=(bz1z+bz2z)*cps-(bx1z+bx2z)*sps
+
+    ix = slice(69,79,2)
+    iz = slice(70,79,2)
+    d[0,ix]=sps*((bx1x+bx2x)*cps+(bz1x+bz2x)*sps)
+    d[1,ix]=sps* (by1x+by2x)
+    d[2,ix]=sps*((bz1x+bz2x)*cps-(bx1x+bx2x)*sps)
+
+    d[0,iz]=sps*((bx1z-bx2z)*cps+(bz1z-bz2z)*sps)
+    d[1,iz]=sps* (by1z-by2z)
+    d[2,iz]=sps*((bz1z-bz2z)*cps-(bx1z-bx2z)*sps)
+
+    return d
+
+def shlcar3x3(a, x,y,z, sps):
+
+    # apantallamiento con 2x3x3 armonicos "cartesianos" (ver geopack.t96.shlcar3x3).
+    # Los 36 coeficientes lineales estan ordenados [m, i, k, n], los 18 armonicos se
+    # calculan juntos sobre los dos primeros ejes
+    cps=np.sqrt(1-sps**2)
+    s3ps=4*cps**2-1
+
+    A = a[0:36].reshape(2,3,3,2)
+    p = a[36:39][:, None, None]
+    r = a[39:42][None, :, None]
+    q = a[42:45][:, None, None]
+    s = a[45:48][None, :, None]
+
+    # amplitud de cada armonico: la parte n=2 va multiplicada por cos(ps) (m=1) o por
+    # sin(3ps)/sin(ps) (m=2), y todo el segundo grupo por sin(ps)
+    f1 = (A[0,:,:,0] + A[0,:,:,1]*cps)[..., None]
+    f2 = sps*(A[1,:,:,0] + A[1,:,:,1]*s3ps)[..., None]
+
+    sqpr=np.sqrt(1/p**2+1/r**2)
+    sqqs=np.sqrt(1/q**2+1/s**2)
+    epr=np.exp(x*sqpr)
+    eqs=np.exp(x*sqqs)
+    cypi=np.cos(y/p)
+    sypi=np.sin(y/p)
+    cyqi=np.cos(y/q)
+    syqi=np.sin(y/q)
+    szrk=np.sin(z/r)
+    czrk=np.cos(z/r)
+    czsk=np.cos(z/s)
+    szsk=np.sin(z/s)
+
+    hx=np.sum(f1*(-sqpr*epr*cypi*szrk) + f2*(-sqqs*eqs*cyqi*czsk), axis=(0,1))
+    hy=np.sum(f1*(epr/p*sypi*szrk) + f2*(eqs/q*syqi*czsk), axis=(0,1))
+    hz=np.sum(f1*(-epr/r*cypi*czrk) + f2*(eqs/s*cyqi*szsk), axis=(0,1))
+
+    return hx,hy,hz
+
+def r2_birk(x,y,z, ps):
+
+    # region 2 sin apantallamiento (ver geopack.t96.r2_birk): segun xksi cada punto usa
+    # r2outer, r2sheet, r2inner o una mezcla de dos de ellos
+    delarg,delarg1= [0.03,0.015]
+
+    cps=np.cos(ps)
+    sps=np.sin(ps)
+
+    xsm=x*cps-z*sps
+    zsm=z*cps+x*sps
+
+    xks=xksi(xsm,y,zsm)
+
+    zona1 = xks < -(delarg+delarg1)
+    zona2 = ~zona1 & (xks < -delarg+delarg1)
+    zona3 = ~zona1 & ~zona2 & (xks < delarg-delarg1)
+    zona4 = ~zona1 & ~zona2 & ~zona3 & (xks < delarg+delarg1)
+    zona5 = ~zona1 & ~zona2 & ~zona3 & ~zona4
+
+    # pesos de cada parte del campo, todos multiplicados por -0.02 para que bz=-1 nT en x=-5.3 re, y=z=0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t2 = tksi(xks,-delarg,delarg1)
+        t4 = tksi(xks,delarg,delarg1)
+    wOuter = np.where(zona1, -0.02, np.where(zona2, -0.02-(-0.02*t2), 0.))
+    wSheet = np.where(zona3, -0.02, np.where(zona2, -0.02*t2, np.where(zona4, -0.02-(-0.02*t4), 0.)))
+    wInner = np.where(zona5, -0.02, np.where(zona4, -0.02*t4, 0.))
+
+    bxsm = np.zeros(np.shape(x))
+    by = np.zeros(np.shape(x))
+    bzsm = np.zeros(np.shape(x))
+    for funcion, w, m in ((r2outer, wOuter, zona1 | zona2),
+                          (r2sheet, wSheet, zona2 | zona3 | zona4),
+                          (r2inner, wInner, zona4 | zona5)):
+        if np.any(m):
+            fx, fy, fz = funcion(xsm[m], y[m], zsm[m])
+            bxsm[m] += fx*w[m]
+            by[m] += fy*w[m]
+            bzsm[m] += fz*w[m]
+
+    bx=bxsm*cps+bzsm*sps
+    bz=bzsm*cps-bxsm*sps
+
+    return bx,by,bz
+
+def xksi(x,y,z):
+
+    # coordenada de estiramiento de la region 2 (ver geopack.t96.xksi)
+    a11a12,a21a22,a41a42,a51a52,a61a62,b11b12,b21b22,c61c62,c71c72,r0,dr =\
+        [0.305662,-0.383593,0.2677733,-0.097656,-0.636034,-0.359862,0.424706,-0.126366,0.292578,1.21563,7.50937]
+
+    tnoon,dteta = [0.3665191,0.09599309]
+
+    dr2=dr*dr
+    x2=x*x
+    y2=y*y
+    z2=z*z
+    r2=x2+y2+z2
+    r=np.sqrt(r2)
+    xr=x/r
+    yr=y/r
+    zr=z/r
+
+    pr=np.where(r < r0, 0., np.sqrt((r-r0)**2+dr2)-dr)
+
+    f=x+pr*(a11a12+a21a22*xr+a41a42*xr*xr+a51a52*yr*yr+a61a62*zr*zr)
+    g=y+pr*(b11b12*yr+b21b22*xr*yr)
+    h=z+pr*(c61c62*zr+c71c72*xr*zr)
+    g2=g*g
+
+    fgh=f**2+g2+h**2
+    fgh32=np.sqrt(fgh)**3
+    fchsg2=f**2+g2
+
+    # en el eje z (fchsg2 ~ 0) xksi = -1
+    eje = fchsg2 < 1e-5
+    fchsg2S = np.where(eje, 1., fchsg2)
+    sqfchsg2=np.sqrt(fchsg2S)
+    alpha=fchsg2S/fgh32
+    theta=tnoon+0.5*dteta*(1-f/sqfchsg2)
+    phi=np.sin(theta)**2
+
+    return np.where(eje, -1., alpha-phi)
+
+def tksi(xksi,xks0,dxksi):
+
+    # funcion de transicion suave entre 0 y 1 (ver geopack.t96.tksi)
+    tdz3=2.*dxksi**3
+    br3a=(xksi-xks0+dxksi)**3
+    br3b=(xksi-xks0-dxksi)**3
+
+    return np.select([xksi-xks0 < -dxksi, xksi < xks0, xksi-xks0 < dxksi],
+                     [0., 1.5*br3a/(tdz3+br3a), 1.+1.5*br3b/(tdz3-br3b)],
+                     1.)
+
+def bconic(x,y,z,nmax):
+
+    # armonicos conicos (ver geopack.t96.bconic), una fila por cada m
+    cbx = np.empty((nmax,)+np.shape(x))
+    cby = np.empty((nmax,)+np.shape(x))
+    cbz = np.empty((nmax,)+np.shape(x))
+
+    ro2=x**2+y**2
+    ro=np.sqrt(ro2)
+
+    cf=x/ro
+    sf=y/ro
+    cfm1=1
+    sfm1=0
+
+    r2=ro2+z**2
+    r=np.sqrt(r2)
+    c=z/r
+    s=ro/r
+    ch=np.sqrt(0.5*(1+c))
+    sh=np.sqrt(0.5*(1-c))
+    tnhm1=1
+    cnhm1=1
+    tnh=sh/ch
+    cnh=1/tnh
+
+    for m in range(nmax):
+        m1 = m+1
+        cfm=cfm1*cf-sfm1*sf
+        sfm=cfm1*sf+sfm1*cf
+        cfm1=cfm
+        sfm1=sfm
+        tnhm=tnhm1*tnh
+        cnhm=cnhm1*cnh
+        bt=m1*cfm/(r*s)*(tnhm+cnhm)
+        bf=-0.5*m1*sfm/r*(tnhm1/ch**2-cnhm1/sh**2)
+        tnhm1=tnhm
+        cnhm1=cnhm
+        cbx[m]= bt*c*cf-bf*sf
+        cby[m]= bt*c*sf+bf*cf
+        cbz[m]=-bt*s
+
+    return cbx,cby,cbz
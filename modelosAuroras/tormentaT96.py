@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import numpy as np
+from concurrent.futures import as_completed
+from utilidades import DatosOMNI
+from tsyganenkoT96 import seguirLineasGEO, crearPool
+from epocaGeopack import Epoca
+
+#%%
+
+# Ovalos de T96 para todas las horas de un archivo de tormenta de OMNI.
+# Cada hora (fila del archivo) se calcula en un proceso del pool, que activa su propia
+# epoca de geopack (recalc de ut, ver epocaGeopack), y los resultados se guardan en un
+# directorio con:
+#   huellas.npy = array (T, 2 polos, 2 ovalos, 3, step) con lat, lon (grados) y r (Re)
+#                 de las huellas de las lineas cerradas, completado con NaN
+#   hecho.npy   = array (T,) de bool, True para las horas ya calculadas
+#   info.json   = archivo (nombre, tamaño y fecha de modificacion), modelo, RS, RC y
+#                 step usados
+# Los dos .npy se abren como memmap y se escriben hora por hora, asi si el calculo se
+# interrumpe, al volver a llamar a calcularTormenta con el mismo directorio solo se
+# calculan las horas que faltan. Si el archivo de OMNI cambio (otro tamaño o fecha de
+# modificacion) no se retoma el calculo.
+
+POLOS = ("norte", "sur")
+OVALOS = ("int", "ext")
+
+def filasOMNI(archivo):
+
+    # cantidad de filas (horas) del archivo de OMNI
+    return len(DatosOMNI.de(archivo))
+
+def _origen(archivo):
+
+    # lo que identifica la version del archivo de OMNI, como en omniBinario
+    info = os.stat(archivo)
+    return {"tamano": info.st_size, "modificado": info.st_mtime}
+
+def _calcularHora(archivo, indice, modelo, RS, RC, step, modo):
+
+    # trabajo de cada proceso: las cuatro curvas (2 polos x 2 ovalos) de una hora. Las
+    # horas con datos faltantes quedan con NaN, sin seguir lineas
+    datos = DatosOMNI.de(archivo)
+    fecha, ut, parametros, kps = datos.fila(indice)
+    huellas = np.full((len(POLOS), len(OVALOS), 3, step), np.nan)
+    if not datos.validas[indice]:
+        return indice, huellas
+    Epoca.de(ut).activar()
+
+    for i, polo in enumerate(POLOS):
+        for j, ovalo in enumerate(OVALOS):
+            lat, lon, r = seguirLineasGEO(modelo, polo, ovalo, parametros, ut, RS, RC, step, modo)
+            n = len(lat)
+            huellas[i, j, :, :n] = lat, lon, r
+
+    return indice, huellas
+
+def abrirTormenta(directorio, modo="r"):
+
+    # abre un directorio creado por calcularTormenta, devuelve huellas, hecho e info
+    with open(os.path.join(directorio, "info.json")) as f:
+        info = json.load(f)
+    huellas = np.load(os.path.join(directorio, "huellas.npy"), mmap_mode=modo)
+    hecho = np.load(os.path.join(directorio, "hecho.npy"), mmap_mode=modo)
+
+    return huellas, hecho, info
+
+def _crearTormenta(directorio, info, T):
+
+    # crea los archivos vacios, o abre los existentes si son del mismo calculo
+    rutaInfo = os.path.join(directorio, "info.json")
+    if os.path.exists(rutaInfo):
+        with open(rutaInfo) as f:
+            infoGuardada = json.load(f)
+        if infoGuardada != info:
+            raise ValueError(f"{directorio} tiene un calculo con otros parametros: {infoGuardada}")
+        return abrirTormenta(directorio, "r+")[:2]
+
+    os.makedirs(directorio, exist_ok=True)
+    huellas = np.lib.format.open_memmap(os.path.join(directorio, "huellas.npy"), mode="w+",
+                                        dtype=float, shape=(T, len(POLOS), len(OVALOS), 3, info["step"]))
+    huellas[:] = np.nan
+    hecho = np.lib.format.open_memmap(os.path.join(directorio, "hecho.npy"), mode="w+",
+                                      dtype=bool, shape=(T,))
+    hecho[:] = False
+    huellas.flush()
+    hecho.flush()
+
+    # info.json se escribe al final: si existe, los .npy estan completos
+    with open(rutaInfo, "w") as f:
+        json.dump(info, f, indent=2)
+
+    return huellas, hecho
+
+def calcularTormenta(archivo, directorio, modelo="t96", RS=[8.5, 9.5], RC=[5, 30], step=100,
+                     modo="serie", procesos=None):
+
+    # calcula (o completa) los ovalos de todas las horas del archivo y los guarda en
+    # directorio. modo es el modo de seguirLineasGEO dentro de cada proceso ("serie" o
+    # "vectorial", el modo "paralelo" no se puede usar dentro de otro pool)
+    T = filasOMNI(archivo)
+    info = {"archivo": os.path.basename(archivo), "origen": _origen(archivo), "modelo": modelo,
+            "RS": list(map(float, RS)), "RC": list(map(float, RC)), "step": int(step)}
+    huellas, hecho = _crearTormenta(directorio, info, T)
+
+    pendientes = [i for i in range(T) if not hecho[i]]
+    print(f"{T - len(pendientes)}/{T} horas ya calculadas en {directorio}")
+    if not pendientes:
+        return abrirTormenta(directorio)
+
+    pool = crearPool(procesos)
+    inicio = time.time()
+    futuros = [pool.submit(_calcularHora, archivo, i, modelo, RS, RC, step, modo) for i in pendientes]
+
+    for k, futuro in enumerate(as_completed(futuros), 1):
+        indice, resultado = futuro.result()
+        huellas[indice] = resultado
+        huellas.flush()
+        hecho[indice] = True
+        hecho.flush()
+
+        transcurrido = time.time() - inicio
+        restante = transcurrido/k*(len(pendientes) - k)
+        print(f"hora {indice} lista ({k}/{len(pendientes)}), "
+              f"{transcurrido:.0f} s transcurridos, ~{restante:.0f} s restantes")
+
+    return abrirTormenta(directorio)
+
+def main():
+
+    archivo = "2025_01_01.lst"
+    huellas, hecho, info = calcularTormenta(archivo, "tormenta_2025_01_01", modo="vectorial")
+    print(f"{hecho.sum()} horas calculadas, huellas con forma {huellas.shape}")
+
+    return 0
+
+
+if __name__ == '__main__':
+
+    start = time.time()
+
+    main()
+
+    end = time.time()
+    print(f"Tiempo de ejecución: {end - start:.3f} segundos")
@@ -0,0 +1,304 @@
+import numpy as np
+from geopack import geopack
+import t96Vectorial
+
+#%%
+
+# Seguimiento de lineas de campo "en bloque": todas las lineas avanzan juntas, paso a
+# paso, como un array de N puntos. Se usa el mismo esquema que geopack.trace (Runge-Kutta
+# con control de error de geopack.step y las mismas reglas para el tamaño del paso), asi
+# los puntos finales coinciden con los de geopack.trace linea por linea.
+# Como en geopack, antes de usar estas funciones hay que llamar a geopack.recalc(ut).
+
+# campo interno IGRF en coordenadas GSM para arrays de puntos, usa los coeficientes y
+# la matriz GEO-GSM que deja geopack.recalc
+def igrfGSM(x, y, z):
+
+    gp = geopack
+
+    # GSM -> GEO
+    xgeo = gp.a11*x + gp.a21*y + gp.a31*z
+    ygeo = gp.a12*x + gp.a22*y + gp.a32*z
+    zgeo = gp.a13*x + gp.a23*y + gp.a33*z
+
+    # coordenadas esfericas (en los polos phi=0, como en geopack.sphcar)
+    r = np.sqrt(xgeo**2 + ygeo**2 + zgeo**2)
+    theta = np.arctan2(np.sqrt(xgeo**2 + ygeo**2), zgeo)
+    phi = np.arctan2(ygeo, xgeo)
+
+    br, btheta, bphi = igrfGEO(r, theta, phi)
+
+    # componentes cartesianas GEO (geopack.bspcar) y de vuelta a GSM
+    s = np.sin(theta)
+    c = np.cos(theta)
+    be = br*s + btheta*c
+    bx = be*np.cos(phi) - bphi*np.sin(phi)
+    by = be*np.sin(phi) + bphi*np.cos(phi)
+    bz = br*c - btheta*s
+
+    return (gp.a11*bx + gp.a12*by + gp.a13*bz,
+            gp.a21*bx + gp.a22*by + gp.a23*bz,
+            gp.a31*bx + gp.a32*by + gp.a33*bz)
+
+# misma recursion de polinomios de Legendre que geopack.igrf_geo, pero cada termino
+# se calcula para todos los puntos a la vez
+def igrfGEO(r, theta, phi):
+
+    g, h, rec = geopack.g, geopack.h, geopack.rec
+
+    ct = np.cos(theta)
+    st = np.sin(theta)
+    smlst = np.abs(st) < 1e-5
+
+    # orden maximo de la expansion segun la distancia, igual que en geopack: lejos de
+    # la tierra se usan menos terminos, los terminos n >= k de cada punto valen cero
+    irp3 = np.floor(r+2)
+    k = np.minimum(np.floor(3+30/irp3), 13).astype(int) + 1
+    kmax = int(k.max())
+    n = np.arange(kmax)[:, None]
+
+    ar = 1/r
+    a = ar**(n+2) * (n < k)          # a[n] = (a/r)^(n+2)
+    b = a*(n+1)                      # b[n] = (n+1)(a/r)^(n+2)
+
+    br = np.zeros(np.shape(r))
+    bt = np.zeros(np.shape(r))
+    bf = np.zeros(np.shape(r))
+    d, p = 0., 1.
+
+    # m = 0
+    p1, d1, p2, d2 = p, d, 0., 0.
+    mn = 0
+    for n in range(kmax):
+        w = g[mn]
+        br += b[n]*w*p1
+        bt -= a[n]*w*d1
+        xk = rec[mn]
+        d0 = ct*d1 - st*p1 - xk*d2
+        p0 = ct*p1 - xk*p2
+        d2, p2, d1 = d1, p1, d0
+        p1 = p0
+        mn += n+1
+
+    d = st*d + ct*p
+    p = st*p
+
+    # m > 0
+    l0 = 0
+    for m in range(1, kmax):
+        smf = np.sin(m*phi)
+        cmf = np.cos(m*phi)
+        p1, d1, p2, d2 = p, d, 0., 0.
+        tbf = 0.
+        l0 += m+1
+        mn = l0
+        for n in range(m, kmax):
+            w = g[mn]*cmf + h[mn]*smf
+            br += b[n]*w*p1
+            bt -= a[n]*w*d1
+            tp = np.where(smlst, d1, p1)
+            tbf += a[n]*(g[mn]*smf - h[mn]*cmf)*tp
+            xk = rec[mn]
+            d0 = ct*d1 - st*p1 - xk*d2
+            p0 = ct*p1 - xk*p2
+            d2, p2, d1 = d1, p1, d0
+            p1 = p0
+            mn += n+1
+
+        d = st*d + ct*p
+        p = st*p
+        bf += tbf*m
+
+    bf = np.where(smlst, np.where(ct < 0, -bf, bf), bf/np.where(smlst, 1., st))
+
+    return br, bt, bf
+
+# campo total T96 + IGRF en GSM, el angulo del dipolo es el que dejo geopack.recalc
+def campoTotal(parametros, x, y, z):
+
+    bx, by, bz = t96Vectorial.t96(parametros, geopack.psi, x, y, z)
+    hx, hy, hz = igrfGSM(x, y, z)
+
+    return bx+hx, by+hy, bz+hz
+
+# vector tangente a la linea de campo, escalado por ds3 (geopack.rhand)
+def _derecha(campo, x, y, z, ds3):
+
+    bx, by, bz = campo(x, y, z)
+    b = ds3/np.sqrt(bx**2 + by**2 + bz**2)
+
+    return bx*b, by*b, bz*b
+
+# un paso de Runge-Kutta-Merson con control de error (geopack.step): las lineas con
+# error demasiado grande repiten el paso con ds a la mitad, las demas quedan listas
+def _paso(campo, x, y, z, ds, errin, maxloop=100):
+
+    xn, yn, zn = x.copy(), y.copy(), z.copy()
+    ok = np.zeros(len(x), dtype=bool)
+    pendientes = np.arange(len(x))
+    ds = ds.copy()
+
+    for i in range(maxloop):
+        xp, yp, zp = x[pendientes], y[pendientes], z[pendientes]
+        ds3 = -ds[pendientes]/3.
+        r11,r12,r13 = _derecha(campo, xp, yp, zp, ds3)
+        r21,r22,r23 = _derecha(campo, xp+r11, yp+r12, zp+r13, ds3)
+        r31,r32,r33 = _derecha(campo, xp+.5*(r11+r21), yp+.5*(r12+r22), zp+.5*(r13+r23), ds3)
+        r41,r42,r43 = _derecha(campo, xp+.375*(r11+3.*r31), yp+.375*(r12+3.*r32), zp+.375*(r13+3.*r33), ds3)
+        r51,r52,r53 = _derecha(campo, xp+1.5*(r11-3.*r31+4.*r41), yp+1.5*(r12-3.*r32+4.*r42), zp+1.5*(r13-3.*r33+4.*r43), ds3)
+        errcur = np.abs(r11-4.5*r31+4.*r41-.5*r51) + np.abs(r12-4.5*r32+4.*r42-.5*r52) + np.abs(r13-4.5*r33+4.*r43-.5*r53)
+
+        bien = errcur < errin
+        listas = pendientes[bien]
+        xn[listas] = xp[bien] + 0.5*(r11+4.*r41+r51)[bien]
+        yn[listas] = yp[bien] + 0.5*(r12+4.*r42+r52)[bien]
+        zn[listas] = zp[bien] + 0.5*(r13+4.*r43+r53)[bien]
+        ok[listas] = True
+
+        pendientes = pendientes[~bien]
+        if len(pendientes) == 0:
+            break
+        ds[pendientes] *= 0.5
+
+    return xn, yn, zn, ok
+
+# estado final de cada linea en trazarLineas(..., devolverEstado=True)
+LLEGO = 0              # llego a r0 (huella en la ionosfera)
+LIMITE = 1             # salio por rlim o por los limites de geopack.trace
+MAXLOOP = 2            # se acabaron los maxloop pasos (igual que geopack.trace)
+NO_CONVERGE = 3        # el paso de Runge-Kutta no bajo del error pedido
+CORTE_DISTANCIA = 4    # corte anticipado: se aleja de la tierra mas alla de rCorte
+CORTE_MAGNETOPAUSA = 5 # corte anticipado: se aleja de la tierra fuera de la magnetopausa
+CORTE_PASOS = 6        # corte anticipado: se acabo el presupuesto de maxPasos pasos
+ECUADOR = 7            # cruzo el plano z=0 (solo con hastaEcuador=True)
+CORTES = (CORTE_DISTANCIA, CORTE_MAGNETOPAUSA, CORTE_PASOS)
+MARGEN_MP = 1.       # Re, ver el corte por magnetopausa en trazarLineas
+ESTADOS = ("llego", "limite", "maxloop", "noConverge",
+           "corteDistancia", "corteMagnetopausa", "cortePasos", "ecuador")
+
+# Sigue a la vez las lineas de campo que salen de los puntos (x, y, z) en GSM, hasta
+# r0 o hasta rlim, igual que geopack.trace para cada punto. Devuelve las coordenadas
+# finales xf, yf, zf (arrays). campo = None usa T96 + IGRF con los parametros dados,
+# se puede pasar cualquier funcion campo(x, y, z) -> bx, by, bz que acepte arrays.
+#
+# Corte anticipado: las lineas abiertas son las mas largas de seguir y su punto final
+# se descarta, por eso se pueden dejar de seguir antes de llegar a rlim:
+#   rCorte       = la linea se corta si se aleja de la tierra estando a mas de rCorte Re
+#   magnetopausa = la linea se corta si sale de la magnetopausa de T96 alejandose de
+#                  la tierra (afuera el campo es solo el IMF)
+#   maxPasos     = presupuesto de pasos de cada linea
+# Las lineas cortadas quedan abiertas y sus coordenadas finales son NaN. Con
+# devolverEstado=True tambien se devuelve el estado final de cada linea (ver ESTADOS).
+#
+# hastaEcuador=True sigue las lineas solo hasta que cruzan el plano z=0 GSM (por ejemplo
+# desde la ionosfera hacia afuera), el punto final es el cruce interpolado linealmente
+# entre los dos ultimos puntos y el estado es ECUADOR.
+def trazarLineas(x, y, z, dir, parametros, r0=1.02, rlim=100, maxloop=1000, campo=None,
+                 rCorte=None, magnetopausa=False, maxPasos=None, devolverEstado=False,
+                 hastaEcuador=False):
+
+    if campo is None:
+        campo = lambda x, y, z: campoTotal(parametros, x, y, z)
+
+    x, y, z = [np.array(c, dtype=float).ravel() for c in np.broadcast_arrays(x, y, z)]
+    err = 0.001
+    ds = np.full(len(x), 0.5*dir)
+    estado = np.full(len(x), MAXLOOP)
+
+    # signo de la componente radial del campo para inicializar rr (ver geopack.trace)
+    r1, r2, r3 = _derecha(campo, x, y, z, -ds/3.)
+    ad = np.where((x*r1 + y*r2 + z*r3) < 0, -0.01, 0.01)
+    rr = np.sqrt(x**2 + y**2 + z**2) + ad
+
+    # el corte por magnetopausa vale para lineas que salen de ella. Una linea que empieza
+    # afuera (o en la capa limite) puede entrar enseguida y cerrarse, esas se cortan solo
+    # cuando ya se alejaron mas de MARGEN_MP Re de su punto inicial
+    if magnetopausa:
+        dentroMP = ~t96Vectorial.fueraMagnetopausa(parametros, x, y, z)
+        rInicio = np.sqrt(x**2 + y**2 + z**2)
+
+    activas = np.arange(len(x))
+
+    for l in range(maxloop):
+
+        xa, ya, za = x[activas], y[activas], z[activas]
+        ryz = ya**2 + za**2
+        r = np.sqrt(xa**2 + ryz)
+
+        # lineas que llegaron al limite exterior o que cruzaron r0 desde afuera. En
+        # geopack.trace la "interpolacion" del punto final usa el mismo punto (xr = x),
+        # asi que el punto final es el primero que queda dentro de r0
+        fuera = (r >= rlim) | (ryz >= 1600) | (xa >= 20)
+        llego = (r < r0) & (rr[activas] > r)
+        estado[activas[fuera]] = LIMITE
+        estado[activas[llego]] = LLEGO
+        sigue = ~(fuera | llego)
+
+        # cortes anticipados, solo para lineas que se estan alejando de la tierra
+        alejando = sigue & (r > rr[activas])
+        if rCorte is not None:
+            corte = alejando & (r > rCorte)
+            estado[activas[corte]] = CORTE_DISTANCIA
+            sigue &= ~corte
+        if magnetopausa:
+            fueraMP = t96Vectorial.fueraMagnetopausa(parametros, xa, ya, za)
+            salio = dentroMP[activas] | (r > rInicio[activas] + MARGEN_MP)
+            corte = alejando & sigue & fueraMP & salio
+            dentroMP[activas] |= ~fueraMP
+            estado[activas[corte]] = CORTE_MAGNETOPAUSA
+            sigue &= ~corte
+        if maxPasos is not None and l >= maxPasos:
+            estado[activas[sigue]] = CORTE_PASOS
+            sigue[:] = False
+
+        activas = activas[sigue]
+        if len(activas) == 0:
+            break
+        r = r[sigue]
+
+        # cerca de la tierra y acercandose, pasos mas cortos (igual que geopack.trace)
+        acerca = ~((r >= rr[activas]) | (r > 5))
+        fc = np.where((r - r0) < 0.05, 0.05, 0.2)
+        ds[activas] = np.where(acerca, np.where(r >= 3, dir, dir*fc*(r - r0 + 0.2)), ds[activas])
+
+        # geopack.trace solo cambia ds al acercarse: una linea que sale de la ionosfera
+        # se queda con el primer paso corto. Con hastaEcuador el paso vuelve a crecer
+        # (hasta 0.5 Re) a medida que la linea se aleja
+        if hastaEcuador:
+            ds[activas] = np.where(acerca, ds[activas], dir*np.minimum(0.5, fc*(r - r0 + 0.2)))
+        rr[activas] = r
+
+        xv, yv, zv = x[activas], y[activas], z[activas]
+        xn, yn, zn, ok = _paso(campo, xv, yv, zv, ds[activas], err)
+        x[activas], y[activas], z[activas] = xn, yn, zn
+
+        # si el paso no converge geopack.step se rinde, esas lineas se dejan de seguir
+        estado[activas[~ok]] = NO_CONVERGE
+
+        if hastaEcuador:
+            cruce = ok & (zv != 0) & (np.sign(zn) != np.sign(zv))
+            t = zv[cruce]/(zv[cruce] - zn[cruce])
+            c = activas[cruce]
+            x[c] = xv[cruce] + t*(xn[cruce] - xv[cruce])
+            y[c] = yv[cruce] + t*(yn[cruce] - yv[cruce])
+            z[c] = 0.
+            estado[c] = ECUADOR
+            ok &= ~cruce
+
+        activas = activas[ok]
+
+    cortadas = np.isin(estado, CORTES)
+    x[cortadas], y[cortadas], z[cortadas] = np.nan, np.nan, np.nan
+
+    if devolverEstado:
+        return x, y, z, estado
+    return x, y, z
+
+# cuenta cuantas lineas terminaron en cada estado, y cuantas se cortaron antes de tiempo
+def resumenEstados(estado):
+
+    resumen = {nombre: int(np.sum(estado == i)) for i, nombre in enumerate(ESTADOS)}
+    resumen["cortadas"] = int(np.sum(np.isin(estado, CORTES)))
+    resumen["total"] = len(estado)
+
+    return resumen
@@ -5,9 +5,14 @@ from datetime import datetime, timezone
 from matplotlib.patches import Patch
 from matplotlib.patches import Wedge, Circle
 import time
+import os
+from concurrent.futures import ProcessPoolExecutor
 from utilidades import zonaOvalo
-from utilidades import leerOMNI
+from utilidades import DatosOMNI
 from utilidades import proyeccionOrtografica
+import trazadoVectorial
+from cacheHuellas import CacheHuellas
+from epocaGeopack import Epoca
 
 #%%
 
@@ -27,14 +32,22 @@ def contornos(RS, RC, step):
     #   R_externo = distancias al centro de la tierra de cada punto del ovalo externo en Radios terrestres(Re
     #   phi       = longitudes GSM en radianes
     
-    RS, RC = radios(RS, RC)
     phi = np.linspace(0, 2*np.pi, step)  # Longitud GSM en radianes
+    R_interno, R_externo = radioContorno(RS, RC, phi)
+    
+    return R_interno, R_externo, phi
+
+def radioContorno(RS, RC, phi):
+    
+    # radios de los contornos interno y externo para cualquier longitud GSM phi
+    # (radianes, escalar o array), la misma curva que usa contornos
+    RS, RC = radios(RS, RC)
     RS1, RS2 = RS[0], RS[1]  # Radios subsolares (Re)
     RC1, RC2 = RC[0], RC[1]   # Radios en la cola (Re)
     R_interno = RS1 + (RC1 - RS1) * np.sin(phi/2)**2
     R_externo = RS2 + (RC2 - RS2) * np.sin(phi/2)**2
     
-    return R_interno, R_externo, phi
+    return R_interno, R_externo
 
 def radios(RS=[10, 10.5], RC =[6, 12.0]):
     
@@ -44,25 +57,41 @@ def radios(RS=[10, 10.5], RC =[6, 12.0]):
       RC = [RC[0], RC[1]]   # Radios en la cola (Re)
       return RS, RC
 
-def seguirLineasGSM(modelo, polo, ovalo, parametros, ut, RS, RC, step=60):
+# reglas de corte anticipado por defecto del modo "corte" (ver trazadoVectorial.trazarLineas)
+CORTE = {"rCorte": 60, "magnetopausa": True, "maxPasos": None}
+
+def seguirLineasGSM(modelo, polo, ovalo, parametros, ut, RS, RC, step=60, modo="serie", pool=None,
+                    corte=None, estadisticas=None, muestreo="uniforme", espaciado=1.0, maxNivel=5,
+                    campo=None, phi=None, compactar=True):
     
     # 2. Función para trazar líneas de campo hasta la ionosfera:
+    # modo = "serie" sigue las lineas una por una en este proceso, modo = "paralelo"
+    # reparte los puntos del contorno entre los procesos de un pool (ver crearPool),
+    # modo = "vectorial" sigue todas las lineas a la vez como arrays (solo T96, ver
+    # trazadoVectorial), modo = "corte" es el vectorial pero las lineas abiertas se
+    # dejan de seguir antes de llegar a rlim, con las reglas del diccionario corte
+    # (por defecto CORTE). Si se pasa un diccionario estadisticas, se le suman los
+    # estados finales de las lineas (cuantas se cortaron antes de tiempo, etc.)
+    # muestreo = "uniforme" usa step angulos phi equiespaciados, muestreo = "adaptativo"
+    # empieza con step angulos y agrega angulos solo donde hace falta (ver _muestreoAdaptativo)
+    # campo = campo(x, y, z) para los modos "vectorial" y "corte" en lugar de T96 + IGRF
+    # exactos, por ejemplo un CampoMalla (ver campoMalla), que tiene que ser de los mismos
+    # parametros (ver _verificarCampo)
+    # phi = angulos (radianes) del contorno a usar en lugar de los step equiespaciados,
+    # solo con muestreo uniforme (por ejemplo un subconjunto de los de contornos)
+    # compactar=False deja las lineas abiertas como NaN en su lugar en vez de sacarlas,
+    # asi el punto k es el de la linea que sale del angulo phi[k]
     
-    # Llamo a la función contornos, obtengo los puntos de los ovalos
-    R_interno, R_externo, phi = contornos(RS, RC, step)
-    
+    _verificarCampo(campo, parametros)
+
     # Selecciono cual contorno utilizar para la simulación
     if ovalo == 'ext':
-        x = R_externo*np.cos(phi)
-        y = R_externo*np.sin(phi)
+        radio = lambda phi: radioContorno(RS, RC, phi)[1]
     elif ovalo == 'int':
-        x = R_interno*np.cos(phi)
-        y = R_interno*np.sin(phi)
+        radio = lambda phi: radioContorno(RS, RC, phi)[0]
     else:
         return print('Parametro de ovalo no valido')
     
-    z = 0 # Los contornos se definen el ecuador z=0
-    
     # Seleccióno la dirección del siguimiento de las lineas de campo
     if polo == 'sur':
         dir = 1
@@ -71,20 +100,180 @@ def seguirLineasGSM(modelo, polo, ovalo, parametros, ut, RS, RC, step=60):
     else:
         dir =-1            # default: norte
     
+    # para cada valor de angulo en phi, se sigue la linea de campo que sale del
+    # punto del contorno correspondiente a ese valor de angulo
+    if muestreo == "uniforme":
+        if phi is None:
+            phi = np.linspace(0, 2*np.pi, step)  # igual que en contornos
+        phi = np.asarray(phi, dtype=float)
+        R = radio(phi)
+        XF, YF, ZF = _trazar(modelo, dir, parametros, ut, R*np.cos(phi), R*np.sin(phi),
+                             modo, pool, corte, estadisticas, campo)
+    elif muestreo == "adaptativo":
+        XF, YF, ZF = _muestreoAdaptativo(modelo, dir, parametros, ut, radio, step, espaciado, maxNivel,
+                                         modo, pool, corte, estadisticas, campo)
+    else:
+        raise ValueError("muestreo debe ser 'uniforme' o 'adaptativo'")
+
+    #Elimina puntos que quedaron fuera del limite de 5 radios terrestres  
+    R = np.sqrt(XF**2 + YF**2 + ZF**2)
+    cerradas = R < 5
+    if not compactar:
+        return tuple(np.where(cerradas, v, np.nan) for v in (XF, YF, ZF))
+        
+    return XF[cerradas], YF[cerradas], ZF[cerradas]
+
+def _verificarCampo(campo, parametros):
+
+    # un campo con parametros propios (CampoMalla) tiene que ser de los parametros del
+    # seguimiento, si no las huellas serian de otro campo
+    if campo is not None and hasattr(campo, "parametros"):
+        propios = np.asarray(campo.parametros, dtype=float).ravel()
+        pedidos = np.asarray(parametros, dtype=float).ravel()
+        if propios.shape != pedidos.shape or not np.allclose(propios, pedidos, rtol=1e-9, atol=0):
+            raise ValueError(f"el campo es para los parametros {propios.tolist()} y se pidieron "
+                             f"{pedidos.tolist()}")
+
+def _trazar(modelo, dir, parametros, ut, x, y, modo="serie", pool=None, corte=None, estadisticas=None,
+            campo=None):
+    
+    # sigue las lineas de campo de los puntos (x, y, z=0) con el modo elegido (ver
+    # seguirLineasGSM) y devuelve las coordenadas finales de todas, sin filtrar
+    if modo == "serie":
+        XF, YF, ZF = _trazarPuntos(modelo, dir, parametros, x, y)
+    elif modo == "paralelo":
+        XF, YF, ZF = _trazarParalelo(modelo, dir, parametros, ut, x, y, pool)
+    elif modo == "vectorial":
+        if modelo != 't96':
+            raise ValueError("el modo 'vectorial' solo esta implementado para el modelo t96")
+        XF, YF, ZF = trazadoVectorial.trazarLineas(x, y, 0, dir, parametros, r0=1.02, rlim=100, campo=campo)
+    elif modo == "corte":
+        if modelo != 't96':
+            raise ValueError("el modo 'corte' solo esta implementado para el modelo t96")
+        reglas = CORTE if corte is None else corte
+        XF, YF, ZF, estado = trazadoVectorial.trazarLineas(x, y, 0, dir, parametros, r0=1.02, rlim=100,
+                                                           campo=campo, devolverEstado=True, **reglas)
+        if estadisticas is not None:
+            for nombre, n in trazadoVectorial.resumenEstados(estado).items():
+                estadisticas[nombre] = estadisticas.get(nombre, 0) + n
+    else:
+        raise ValueError("modo debe ser 'serie', 'paralelo', 'vectorial' o 'corte'")
+    
+    if estadisticas is not None:
+        estadisticas["lineasTrazadas"] = estadisticas.get("lineasTrazadas", 0) + len(x)
+    
+    return XF, YF, ZF
+
+def _muestreoAdaptativo(modelo, dir, parametros, ut, radio, step, espaciado, maxNivel,
+                        modo="serie", pool=None, corte=None, estadisticas=None, campo=None):
+    
+    # Muestreo adaptativo del contorno: se empieza con step angulos phi equiespaciados y
+    # en cada nivel se agrega el punto medio de los intervalos entre vecinos donde
+    #   - las dos lineas son cerradas pero sus huellas estan a mas de "espaciado"
+    #     grados (angulo visto desde el centro de la tierra), o
+    #   - una linea es cerrada y la otra abierta (ahi esta el borde del ovalo)
+    # hasta que ningun intervalo cumple esas condiciones o despues de maxNivel niveles
+    # (el intervalo mas chico es 2pi/step/2**maxNivel). Cada nivel es un solo trazado con
+    # los angulos nuevos. radio(phi) da el radio del contorno para cada angulo.
+    # Devuelve las huellas de las lineas cerradas ordenadas por phi.
+    
+    def trazar(phi):
+        R = radio(phi)
+        return np.array(_trazar(modelo, dir, parametros, ut, R*np.cos(phi), R*np.sin(phi),
+                                modo, pool, corte, estadisticas, campo))
+    
+    phi = np.linspace(0, 2*np.pi, step, endpoint=False)
+    huellas = trazar(phi)
+    
+    for nivel in range(maxNivel):
+        
+        # vecinos: cada punto con el siguiente, el ultimo con el primero
+        siguiente = np.roll(huellas, -1, axis=1)
+        cerrada = np.sqrt(np.sum(huellas**2, axis=0)) < 5
+        cerradaSig = np.roll(cerrada, -1)
+        cosAng = np.sum(huellas*siguiente, axis=0)/np.sqrt(np.sum(huellas**2, axis=0)*np.sum(siguiente**2, axis=0))
+        angulo = np.degrees(np.arccos(np.clip(cosAng, -1, 1)))
+        intervalo = np.diff(np.append(phi, phi[0] + 2*np.pi))
+        
+        refinar = (cerrada & cerradaSig & (angulo > espaciado)) | (cerrada != cerradaSig)
+        if not np.any(refinar):
+            break
+        
+        nuevos = (phi[refinar] + 0.5*intervalo[refinar]) % (2*np.pi)
+        phi = np.concatenate([phi, nuevos])
+        huellas = np.concatenate([huellas, trazar(nuevos)], axis=1)
+        orden = np.argsort(phi)
+        phi, huellas = phi[orden], huellas[:, orden]
+    
+    cerrada = np.sqrt(np.sum(huellas**2, axis=0)) < 5
+    
+    return huellas[0, cerrada], huellas[1, cerrada], huellas[2, cerrada]
+
+def fronteraAbiertaCerrada(modelo, polo, parametros, ut, sectores=48, rMin=3, rMax=60, tol=0.05,
+                           modo="vectorial", pool=None, campo=None):
+    
+    # Frontera entre lineas cerradas y abiertas en el plano ecuatorial z=0, en lugar de
+    # elegir a mano RS y RC: para cada sector de longitud GSM phi se busca por biseccion
+    # el radio donde la linea que sale de (R cos(phi), R sin(phi), 0) deja de volver a
+    # la tierra. Se supone que en rMin las lineas son cerradas y en rMax abiertas, y que
+    # hay un solo cambio entre medio. Todos los sectores avanzan juntos, cada iteracion
+    # es un solo trazado de "sectores" lineas, y despues de log2((rMax-rMin)/tol)
+    # iteraciones el error del radio es menor que tol (Re).
+    # Devuelve:
+    #   R        = radio de la frontera (ultimo radio cerrado encontrado) de cada sector,
+    #              NaN si en rMin ya es abierta o en rMax todavia es cerrada
+    #   phi      = longitudes GSM de los sectores (radianes)
+    #   XF,YF,ZF = huellas GSM de las lineas en R (NaN en los sectores sin frontera)
+    
+    if polo == 'sur':
+        dir = 1
+    else:
+        dir = -1
+    
+    phi = np.linspace(0, 2*np.pi, sectores, endpoint=False)
+    
+    def cerradas(R):
+        XF, YF, ZF = _trazar(modelo, dir, parametros, ut, R*np.cos(phi), R*np.sin(phi), modo, pool,
+                             campo=campo)
+        return np.sqrt(XF**2 + YF**2 + ZF**2) < 5, XF, YF, ZF
+    
+    # extremos del intervalo: adentro cerrada, afuera abierta
+    dentro = np.full(sectores, float(rMin))
+    fuera = np.full(sectores, float(rMax))
+    valido, XF, YF, ZF = cerradas(dentro)
+    cerradaFuera, _, _, _ = cerradas(fuera)
+    valido &= ~cerradaFuera
+    
+    iteraciones = int(np.ceil(np.log2((rMax - rMin)/tol)))
+    for i in range(iteraciones):
+        medio = 0.5*(dentro + fuera)
+        cerrada, xf, yf, zf = cerradas(medio)
+        dentro = np.where(cerrada, medio, dentro)
+        fuera = np.where(cerrada, fuera, medio)
+        XF, YF, ZF = np.where(cerrada, xf, XF), np.where(cerrada, yf, YF), np.where(cerrada, zf, ZF)
+    
+    R = np.where(valido, dentro, np.nan)
+    XF, YF, ZF = [np.where(valido, c, np.nan) for c in (XF, YF, ZF)]
+    
+    return R, phi, XF, YF, ZF
+
+def _trazarPuntos(modelo, dir, parametros, x, y):
+    
+    # sigue las lineas de campo de los puntos (x, y, z=0) uno por uno, con el estado
+    # de geopack (recalc) que este activo en el proceso que la llama
     
     # polo norte dipolar (lat, lon en grados)
     # parametros físicos para la simulación
     R0 = 1.02    # distancia del centro de la tierra, donde el seguimiento de linea tiene que terminar
     RL = 100     # radio limite de la simulación, si al seguir una linea se supuera, el codigo termina
-    XF = []
-    YF = []
-    ZF = []
-    
-    # para cada valor de angulo en phi, se llama a la función trace
-    # las coordenadas iniciales son la de el punto del contorno correspondiente
-    # a ese valor de angulo, los coordenadas finales de cada seguimiento de linea 
-    # se guardan en 3 listas
-    for i in range(len(phi)):
+    z = 0        # Los contornos se definen el ecuador z=0
+    XF = np.zeros(len(x))
+    YF = np.zeros(len(x))
+    ZF = np.zeros(len(x))
+    
+    # las coordenadas iniciales son la de el punto del contorno, los coordenadas
+    # finales de cada seguimiento de linea se guardan en 3 arrays
+    for i in range(len(x)):
         xf, yf, zf, xx, yy, zz = geopack.trace(
         x[i], y[i], z, #coordenadas iniciales en gsm
         dir=dir, 
@@ -94,17 +283,62 @@ def seguirLineasGSM(modelo, polo, ovalo, parametros, ut, RS, RC, step=60):
         inname = 'igrf', 
         rlim   = RL
         )
-
-    #Elimina puntos que quedaron fuera del limite de 10 radios terrestres  
-        R = np.sqrt(xf**2 + yf**2 + zf**2)
-        if R < 5: 
-            XF.append(xf)
-            YF.append(yf)
-            ZF.append(zf)
-        else:
-            continue
+        XF[i], YF[i], ZF[i] = xf, yf, zf
         
-    return np.array(XF), np.array(YF), np.array(ZF)
+    return XF, YF, ZF
+
+def _trazarBloque(modelo, dir, parametros, ut, x, y):
+    
+    # trabajo de cada proceso del pool: geopack guarda su estado en variables globales
+    # del modulo, asi que cada proceso tiene que activar la epoca por su cuenta (el
+    # recalc se hace una sola vez por proceso y fecha, ver epocaGeopack)
+    Epoca.de(ut).activar()
+    
+    return _trazarPuntos(modelo, dir, parametros, x, y)
+
+_pool = None
+_procesosPool = None
+
+def crearPool(procesos=None):
+    
+    # crea (una sola vez) el pool de procesos usado por el modo "paralelo" y lo devuelve,
+    # el mismo pool se reutiliza en todas las llamadas siguientes. procesos=None usa
+    # todos los nucleos disponibles (o el pool que ya exista); si se pide otra cantidad
+    # de procesos que la del pool existente, se cierra y se crea uno nuevo
+    global _pool, _procesosPool
+    if _pool is not None and procesos is not None and procesos != _procesosPool:
+        cerrarPool()
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=procesos)
+        _procesosPool = _pool._max_workers
+    return _pool
+
+def cerrarPool():
+    
+    # termina los procesos del pool creado con crearPool
+    global _pool, _procesosPool
+    if _pool is not None:
+        _pool.shutdown()
+        _pool = None
+        _procesosPool = None
+
+def _trazarParalelo(modelo, dir, parametros, ut, x, y, pool=None):
+    
+    # reparte los puntos del contorno en bloques consecutivos, uno o mas por proceso.
+    # map devuelve los bloques en el mismo orden en que se enviaron, por lo que al
+    # unirlos los puntos quedan en el mismo orden de phi que en el modo serie
+    if pool is None:
+        pool = crearPool()
+    
+    nBloques = min(len(x), 4*(os.cpu_count() or 1))
+    bloquesX = np.array_split(x, nBloques)
+    bloquesY = np.array_split(y, nBloques)
+    n = len(bloquesX)
+    
+    resultados = pool.map(_trazarBloque, [modelo]*n, [dir]*n, [parametros]*n, [ut]*n, bloquesX, bloquesY)
+    XF, YF, ZF = zip(*resultados)
+    
+    return np.concatenate(XF), np.concatenate(YF), np.concatenate(ZF)
 
 def coord(XF,YF,ZF):
     # Cambio de coordenadas a geocentricas
@@ -115,14 +349,43 @@ def coord(XF,YF,ZF):
     
     return  np.degrees(lat), np.degrees(lon), r
 
-def seguirLineasGEO(modelo, polo, ovalo, kp, fecha, RS, RC, step):
+def seguirLineasGEO(modelo, polo, ovalo, kp, fecha, RS, RC, step, modo="serie", pool=None, cache=None,
+                    corte=None, estadisticas=None, muestreo="uniforme", espaciado=1.0, maxNivel=5,
+                    campo=None, phi=None, compactar=True):
 
     
     # una función que combina las dos anteriores simplemente por comodidad
+    # cache = CacheHuellas para guardar/reutilizar en disco las huellas ya calculadas
     
-    XF,YF,ZF = seguirLineasGSM(modelo, polo, ovalo, kp, fecha, RS, RC, step)
+    _verificarCampo(campo, kp)
+    if cache is not None:
+        extra = {}
+        if muestreo != "uniforme":
+            extra.update(muestreo=muestreo, espaciado=espaciado, maxNivel=maxNivel)
+        if campo is not None:
+            # con un campo aproximado las huellas no son las exactas
+            extra.update(campo=getattr(campo, "descripcion", type(campo).__name__))
+        if modo == "corte":
+            # las reglas de corte deciden que lineas quedan como NaN
+            reglas = CORTE if corte is None else corte
+            extra.update(corte={nombre: reglas[nombre] for nombre in sorted(reglas)})
+        if phi is not None:
+            extra.update(phi=np.asarray(phi, dtype=float).tolist())
+        if not compactar:
+            extra.update(compactar=False)
+        clave = cache.clave(modelo, kp, fecha, RS, RC, step, polo, ovalo, extra=extra)
+        huellas = cache.obtener(clave)
+        if huellas is not None:
+            return huellas
     
-    return coord(XF, YF, ZF)
+    XF,YF,ZF = seguirLineasGSM(modelo, polo, ovalo, kp, fecha, RS, RC, step, modo, pool, corte, estadisticas,
+                               muestreo, espaciado, maxNivel, campo, phi, compactar)
+    huellas = coord(XF, YF, ZF)
+    
+    if cache is not None:
+        cache.guardar(clave, *huellas)
+    
+    return huellas
 
 def dual_half_circle(center=(0, 0), radius=1, angle=90, ax=None, colors=('#FDD922', '#0F1E84', 'white'),
                      **kwargs):
@@ -180,13 +443,14 @@ def graficaLateral():
     ax = setup_fig(xlim=(15, -30), ylim=(-15, 15), xlabel='$X_{GSM} [Re]$', ylabel='$Z_{GSM} [Re]$')
 
 
+    datos = DatosOMNI.de("2025_01_01.lst")
     i = 15
-    fecha, ut, parametros, kps = leerOMNI("2025_01_01.lst", i)
+    fecha, ut, parametros, kps = datos.fila(i)
     j = 0
-    _, _, parametrosComp, _ = leerOMNI("2025_01_01.lst", j)
+    _, _, parametrosComp, _ = datos.fila(j)
                                                   
     # Parametros del campo
-    dip = geopack.recalc(ut)
+    dip = Epoca.de(ut).activar()
     kp = parametros
     CampoExterno = 't96'
     CampoInterno = 'igrf'
@@ -321,15 +585,21 @@ def graficaLateral():
    
 
 def main():
+    
+    # las huellas calculadas se guardan en disco, al repetir la ejecución no se vuelven a trazar
+    cache = CacheHuellas()
+    datos = DatosOMNI.de("2025_01_01.lst")
         
     for polo in ["norte", "sur"]:
         
-        # llamar a leerOMNI para obtener parametros de tormenta
+        # parametros de tormenta (el archivo se lee una sola vez)
         hora = 15
-        fecha, ut, parametros, kps = leerOMNI("2025_01_01.lst", hora)
+        fecha, ut, parametros, kps = datos.fila(hora)
         
-        # llamo a recalc para actualizar los parametros de la simulación de campo
-        dipAngle = geopack.recalc(ut)  
+        # activo la epoca de ut para la simulación de campo: recalc se hace una sola vez
+        # para los dos polos, las dos simulaciones y los cambios de coordenadas
+        epoca = Epoca.de(ut)
+        dipAngle = epoca.activar()
         dt = datetime.fromtimestamp(ut, tz=timezone.utc)
         horaUT = dt.strftime("%H:%M:%S")
         fechaTor = fecha.strftime("%Y/%m/%d")
@@ -339,19 +609,20 @@ def main():
         RC = [5, 30]
         
         # llamar a seguirlineas para seguir las lineas del campo hasta la atmosfera
-        puntosExt = seguirLineasGEO("t96", polo, "ext", parametros, ut, RS, RC, 100)
-        puntosInt = seguirLineasGEO("t96", polo, "int", parametros, ut, RS, RC, 100)
+        puntosExt = seguirLineasGEO("t96", polo, "ext", parametros, ut, RS, RC, 100, cache=cache)
+        puntosInt = seguirLineasGEO("t96", polo, "int", parametros, ut, RS, RC, 100, cache=cache)
         
         # Segunda simulación
 
         hora2 = 0
-        _, _, parametrosComp, kps2 = leerOMNI("2025_01_01.lst", hora2)
+        _, _, parametrosComp, kps2 = datos.fila(hora2)
         
         RS = [8, 9]
         RC = [6, 15]      
         
-        puntosExt2 = seguirLineasGEO("t96", polo, "ext", parametrosComp, ut, RS, RC, 100)
-        puntosInt2 = seguirLineasGEO("t96", polo, "int", parametrosComp, ut, RS, RC, 100)
+        epoca.activar()
+        puntosExt2 = seguirLineasGEO("t96", polo, "ext", parametrosComp, ut, RS, RC, 100, cache=cache)
+        puntosInt2 = seguirLineasGEO("t96", polo, "int", parametrosComp, ut, RS, RC, 100, cache=cache)
         
         # Crear figura/axes con tamaño fijo
         fig = plt.figure(figsize=(7, 8), dpi=150)
@@ -359,14 +630,8 @@ def main():
         # Llamar a proyeccionOrtografica para obtener axes con proyección
         ax = proyeccionOrtografica(fig, polo, [43, 90], fecha, kps[1])
         
-        if polo == "norte":
-            zonaOvalo(ax, puntosExt, puntosInt)
-            zonaOvalo(ax, puntosExt2, puntosInt2, color="orange")
-        elif polo == "sur":    
-            zonaOvalo(ax, puntosInt, puntosExt)
-            zonaOvalo(ax, puntosInt2, puntosExt2, color="orange")
-        else:
-            raise NameError
+        zonaOvalo(ax, puntosInt, puntosExt)
+        zonaOvalo(ax, puntosInt2, puntosExt2, color="orange")
             
         # figure config
         ax.text(
@@ -411,6 +676,8 @@ def main():
         
         plt.show()
         
+    print("Cache de huellas:", cache.estadisticas())
+    print("Epocas de geopack:", Epoca.estadisticas())
 
     return 0
 
@@ -1,13 +1,18 @@
+import os
 import numpy as np
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 import cartopy.crs as ccrs
 import cartopy.feature as cfeature
 import matplotlib.ticker as mticker
 from cartopy.feature.nightshade import Nightshade
 import pandas as pd
 from datetime import datetime, timedelta, timezone
-from shapely.geometry import Polygon
-import warnings
+from collections import OrderedDict
+from matplotlib.path import Path
+from matplotlib.patches import PathPatch
+from coordenadas import POLOS_MAGNETICOS
 
 
 # Esta funcion plotea los puntos sobre la proyección, recibe el axes,
@@ -47,63 +52,262 @@ def graficarOvalo(ax, puntos, tipo, color="red", linestyle="-",label=None):
     return ax
 
 # genera una figura con shapely para la zona entre los ovalos
+# Poligonos de los ovalos ya proyectados: los dos limites (anillos) de cada ovalo se
+# densifican en lat/lon, se proyectan todos juntos con un solo transform_points y se
+# arma un Path de matplotlib con el anillo de mayor area como borde exterior (sentido
+# antihorario) y el otro como agujero (sentido horario). Asi no importa el orden de los
+# limites ni si un anillo rodea el polo o cruza el antimeridiano, y dibujar es solo
+# agregar un PathPatch. Los Path se guardan en cache por proyeccion y puntos.
+_POLIGONOS = OrderedDict()
+_POLIGONOS_MAX = 512
+
+def _densificar(lat, lon, densidad):
+
+    # anillo cerrado con "densidad" puntos por segmento, interpolando en longitud
+    # continua (sin el salto de 360 grados)
+    lat = np.append(lat, lat[0])
+    lon = np.rad2deg(np.unwrap(np.deg2rad(np.append(lon, lon[0]))))
+    t = np.arange((len(lat) - 1)*densidad)/densidad
+    k = np.arange(len(lat))
+
+    return np.interp(t, k, lat), np.interp(t, k, lon)
+
+def _area(xy):
+    # area con signo (formula del poligono), positiva en sentido antihorario
+    x, y = xy[:, 0], xy[:, 1]
+    return 0.5*(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1)))
+
+def _pathOvalo(anillo1, anillo2):
+
+    # Path del ovalo entre dos anillos proyectados (M, 2), None si alguno no tiene
+    # suficientes puntos visibles
+    anillos = [a[np.isfinite(a).all(axis=1)] for a in (anillo1, anillo2)]
+    if any(len(a) < 3 for a in anillos):
+        return None
+    areas = [_area(a) for a in anillos]
+    exterior, interior = (0, 1) if abs(areas[0]) >= abs(areas[1]) else (1, 0)
+    borde = anillos[exterior] if areas[exterior] > 0 else anillos[exterior][::-1]
+    agujero = anillos[interior] if areas[interior] < 0 else anillos[interior][::-1]
+
+    vertices, codigos = [], []
+    for a in (borde, agujero):
+        vertices += [a, a[:1]]
+        codigos += [Path.MOVETO] + [Path.LINETO]*(len(a) - 1) + [Path.CLOSEPOLY]
+
+    return Path(np.concatenate(vertices), np.array(codigos, dtype=Path.code_type))
+
+def proyectarOvalos(proyeccion, ovalos, densidad=4):
+
+    # Path (en coordenadas de proyeccion) de cada ovalo de la lista, ovalo = (pInterno,
+    # pExterno) con p = [lat, lon, ...] en grados geograficos. Los que no estan en cache
+    # se proyectan en un solo llamado. Devuelve None para los ovalos sin puntos
+    claves, faltan = [], {}
+    for pInterno, pExterno in ovalos:
+        anillos = [np.asarray(p[:2], dtype=float) for p in (pInterno, pExterno)]
+        anillos = [a[:, np.isfinite(a).all(axis=0)] for a in anillos]
+        if any(a.shape[1] < 3 for a in anillos):
+            claves.append(None)
+            continue
+        clave = (proyeccion.proj4_init, densidad) + tuple(a.tobytes() for a in anillos)
+        claves.append(clave)
+        if clave in _POLIGONOS:
+            _POLIGONOS.move_to_end(clave)
+        else:
+            faltan.setdefault(clave, anillos)
+
+    nuevos = {}
+    if faltan:
+        densos = [_densificar(a[0], a[1], densidad) for anillos in faltan.values() for a in anillos]
+        lat = np.concatenate([d[0] for d in densos])
+        lon = np.concatenate([d[1] for d in densos])
+        xy = proyeccion.transform_points(ccrs.Geodetic(), lon, lat)[:, :2]
+        proyectados = np.split(xy, np.cumsum([len(d[0]) for d in densos])[:-1])
+        for j, clave in enumerate(faltan):
+            nuevos[clave] = _pathOvalo(proyectados[2*j], proyectados[2*j + 1])
+
+    resultado = [None if c is None else nuevos[c] if c in nuevos else _POLIGONOS[c] for c in claves]
+    _POLIGONOS.update(nuevos)
+    while len(_POLIGONOS) > _POLIGONOS_MAX:
+        _POLIGONOS.popitem(last=False)
+
+    return resultado
+
 def zonaOvalo(ax, pInterno,pExterno, color="#19DA40",edgecolor="#6F1EC0", alpha=0.5):
-    
-    warnings.filterwarnings("ignore", message="Approximating coordinate system.*")
-                            
-    latExt = pExterno[0]
-    lonExt = pExterno[1]
-    latInt = pInterno[0]
-    lonInt = pInterno[1]
-    
 
-    poly = Polygon(shell = list(zip(lonExt, latExt)), holes = [list(zip(lonInt[::-1], latInt[::-1]))])
-    feature = cfeature.ShapelyFeature([poly], crs=ccrs.Geodetic(), 
-                                      facecolor=color,
-                                      linewidth=1.8, 
-                                      edgecolor=edgecolor, 
-                                      alpha=alpha, 
-                                      zorder=3)
-    ax.add_feature(feature)
+    # pinta la zona entre los dos limites del ovalo (el orden de los limites no importa)
+    path = proyectarOvalos(ax.projection, [(pInterno, pExterno)])[0]
+    if path is None:
+        return None
 
-# función para leer datos desde OMNI web
-def leerOMNI(archivo, indice):
-    
-    # Leer datos desde el archivo bajado en OMNI web
-    data = pd.read_csv(archivo,
-                       sep="\s+", 
-                       names=["Año","Día","Hora","ByIMF(GSM)","BzIMF(GSM)","Pdyn(nPa)","kp*10","Dst(nT)"])
+    return ax.add_patch(PathPatch(path, transform=ax.transData,
+                                  facecolor=color,
+                                  linewidth=1.8,
+                                  edgecolor=edgecolor,
+                                  alpha=alpha,
+                                  zorder=3))
 
-    #Saco un fila de parametros correspondientes a una hora
-    fila = np.array(data.iloc[indice].tolist())
+# columnas de los archivos bajados de OMNI web, en orden. Los de 1 minuto (HRO) no
+# traen kp ni Dst: tienen la columna de minuto y el SYM-H, que se usa como Dst
+COLUMNAS_OMNI = ["Año","Día","Hora","ByIMF(GSM)","BzIMF(GSM)","Pdyn(nPa)","kp*10","Dst(nT)"]
+COLUMNAS_OMNI_MINUTO = ["Año","Día","Hora","Minuto","ByIMF(GSM)","BzIMF(GSM)","Pdyn(nPa)","SYM-H(nT)"]
+FORMATOS_OMNI = {"horario": COLUMNAS_OMNI, "minuto": COLUMNAS_OMNI_MINUTO}
 
-    fecha = fila[:3]                                    
-    parametros = [fila[5], fila[7], fila[3], fila[4]]
-    kpMedido = int(fila[6]/10)
-    
-    # restricción del kp para el modelo de t86, sujeto a modificación para los otros modelos
-    if 0 <= kpMedido < 1:
-        kp = 1
-    elif 1 <= kpMedido < 2:
-        kp = 2
-    elif 2 <= kpMedido < 3:
-        kp = 3
-    elif 3 <= kpMedido < 4:
-        kp = 4
-    elif 4 <= kpMedido < 5:
-        kp = 5
-    elif 5 <= kpMedido < 6:
-        kp = 6
-    elif 6 <= kpMedido:
-        kp = 7
-    
-    kps =[kp, kpMedido]
-    
-    año, dia, hora = map(int, fecha)  
-    fecha = datetime(año, 1, 1, tzinfo=timezone.utc) + timedelta(days=dia-1, hours=hora)
-    ut = int(fecha.timestamp())  
+# valores de relleno (dato faltante) de OMNI: los valores con modulo mayor o igual se
+# toman como faltantes (999.9 en los datos horarios, 9999.99 en los de 1 minuto, etc.)
+RELLENO_OMNI = {"ByIMF(GSM)": 999.9, "BzIMF(GSM)": 999.9, "Pdyn(nPa)": 99.99, "kp*10": 99, "Dst(nT)": 99999,
+                "SYM-H(nT)": 99999}
+
+def formatoOMNI(archivo):
+
+    # "horario" o "minuto" segun la primera linea del archivo. Los dos tienen 8
+    # columnas, en los de 1 minuto la cuarta es el minuto (entero) y en los horarios
+    # es ByIMF, que OMNI web escribe siempre con decimales
+    with open(archivo) as f:
+        for linea in f:
+            campos = linea.split()
+            if not campos:
+                continue
+            if len(campos) != len(COLUMNAS_OMNI):
+                raise ValueError(f"{archivo}: {len(campos)} columnas, los formatos soportados de OMNI "
+                                 f"tienen {len(COLUMNAS_OMNI)}: {FORMATOS_OMNI}")
+            return "minuto" if campos[3].isdigit() else "horario"
+
+    return "horario"
+
+def enmascararRelleno(nombre, valores):
+
+    # columna "nombre" como float con NaN en los valores de relleno. La comparacion tiene
+    # una tolerancia relativa, asi tambien se detectan los valores guardados en float32
+    # (99.99 queda como 99.98999786) sin redondearlos antes
+    valores = np.asarray(valores, dtype=float)
+    if nombre in RELLENO_OMNI:
+        valores = np.where(np.abs(valores) >= RELLENO_OMNI[nombre]*(1 - 1e-6), np.nan, valores)
+
+    return valores
+
+# Datos de un archivo de OMNI leidos una sola vez, como columnas (arrays):
+#   fechas     = datetime64 (UTC) de cada fila
+#   ut         = segundos desde 1970 (int)
+#   parametros = array (N, 4) con los parametros de T96 [Pdyn, Dst, ByIMF, BzIMF]
+#   kpMedido   = parte entera del kp medido, kp = kp para el modelo (ver leerOMNI),
+#                0 donde no hay kp (conKp = False, por ejemplo en los datos de 1 minuto)
+#   validas    = filas sin datos faltantes (NaN, ver enmascararRelleno)
+# fila(i) devuelve lo mismo que leerOMNI, indice(fecha) busca la fila de una fecha
+# (datetime o ut) y filas(inicio, fin) recorre un rango.
+class DatosOMNI:
+
+    _cache = {}       # archivo -> (fecha de modificacion, DatosOMNI), ver DatosOMNI.de
+
+    def __init__(self, año, dia, hora, by, bz, pdyn, kp10, dst, minuto=0):
+
+        # kp10 = None si los datos no traen kp, entonces validas solo mira los parametros
+        año, dia, hora, minuto = (np.asarray(c, dtype=int) for c in (año, dia, hora, minuto))
+        self.fechas = ((año - 1970).astype("datetime64[Y]").astype("datetime64[m]")
+                       + ((dia - 1)*24 + hora)*60 + minuto)
+        self.ut = self.fechas.astype("datetime64[s]").astype(np.int64)
+        self.parametros = np.column_stack([pdyn, dst, by, bz]).astype(float)
+
+        self.validas = np.all(np.isfinite(self.parametros), axis=1)
+        if kp10 is None:
+            kp10 = np.full(len(self.ut), np.nan)
+        else:
+            kp10 = np.asarray(kp10, dtype=float)
+            self.validas &= np.isfinite(kp10)
+        self.conKp = np.isfinite(kp10)
+        # restricción del kp para el modelo de t96: un entero mas que el medido, hasta 7
+        self.kpMedido = (np.where(self.conKp, kp10, 0)/10).astype(int)
+        self.kp = np.minimum(self.kpMedido + 1, 7)
+
+    @classmethod
+    def deColumnas(cls, columnas):
+
+        # DatosOMNI de un diccionario {nombre: valores} con las columnas de uno de los
+        # FORMATOS_OMNI
+        if "Minuto" in columnas:
+            return cls(*(columnas[c] for c in ("Año", "Día", "Hora", "ByIMF(GSM)", "BzIMF(GSM)", "Pdyn(nPa)")),
+                       None, columnas["SYM-H(nT)"], columnas["Minuto"])
+
+        return cls(*(columnas[c] for c in COLUMNAS_OMNI))
+
+    @classmethod
+    def leer(cls, archivo, enmascarar=True):
+
+        # Leer datos desde el archivo bajado en OMNI web. Con enmascarar=True los valores
+        # de relleno quedan como NaN y esas filas con validas=False
+        nombres = FORMATOS_OMNI[formatoOMNI(archivo)]
+        data = pd.read_csv(archivo, sep=r"\s+", names=nombres)
+        columnas = {c: data[c].to_numpy() for c in nombres}
+        if enmascarar:
+            columnas = {c: enmascararRelleno(c, v) for c, v in columnas.items()}
+
+        return cls.deColumnas(columnas)
+
+    @classmethod
+    def de(cls, archivo):
+
+        # DatosOMNI del archivo, se lee solo la primera vez o si el archivo cambio
+        ruta = os.path.abspath(archivo)
+        modificado = os.path.getmtime(ruta)
+        guardado = cls._cache.get(ruta)
+        if guardado is None or guardado[0] != modificado:
+            guardado = (modificado, cls.leer(ruta))
+            cls._cache[ruta] = guardado
+
+        return guardado[1]
+
+    def __len__(self):
+        return len(self.ut)
+
+    def fecha(self, indice):
+        return datetime.fromtimestamp(int(self.ut[indice]), tz=timezone.utc)
+
+    def fila(self, indice):
+
+        # fecha, ut, parametros, kps de una fila, igual que leerOMNI. Sin kp medido
+        # kps = [nan, nan], y los parametros faltantes quedan como NaN
+        indice = range(len(self))[indice]
+        kps = [int(self.kp[indice]), int(self.kpMedido[indice])] if self.conKp[indice] else [np.nan, np.nan]
+
+        return self.fecha(indice), int(self.ut[indice]), list(self.parametros[indice]), kps
+
+    def indice(self, fecha):
+
+        # fila de una fecha (datetime o ut en segundos), KeyError si no esta
+        ut = int(fecha.timestamp()) if isinstance(fecha, datetime) else int(fecha)
+        i = int(np.searchsorted(self.ut, ut))
+        if i == len(self) or self.ut[i] != ut:
+            raise KeyError(f"no hay datos de OMNI para {fecha}")
+
+        return i
+
+    def filas(self, inicio=0, fin=None):
+
+        # recorre las filas de inicio a fin (sin incluir), indices o fechas
+        inicio = self.indice(inicio) if isinstance(inicio, datetime) else inicio
+        fin = len(self) if fin is None else (self.indice(fin) if isinstance(fin, datetime) else fin)
+        for i in range(inicio, fin):
+            yield self.fila(i)
+
+    def __iter__(self):
+        return self.filas()
+
+# Lee un archivo de OMNI de a "filas" filas y devuelve un DatosOMNI por bloque
+# (generador), asi un archivo de muchos años se recorre con memoria acotada. Con
+# enmascarar=True los valores de relleno quedan como NaN y esas filas con validas=False
+def leerOMNIPorBloques(archivo, filas=100000, enmascarar=True):
+
+    nombres = FORMATOS_OMNI[formatoOMNI(archivo)]
+    for trozo in pd.read_csv(archivo, sep=r"\s+", names=nombres, chunksize=filas):
+        columnas = {c: trozo[c].to_numpy() for c in nombres}
+        if enmascarar:
+            columnas = {c: enmascararRelleno(c, v) for c, v in columnas.items()}
+        yield DatosOMNI.deColumnas(columnas)
+
+# función para leer datos desde OMNI web: fila "indice" del archivo, el archivo se lee
+# una sola vez (DatosOMNI.de)
+def leerOMNI(archivo, indice):
     
-    return fecha, ut, parametros, kps
+    return DatosOMNI.de(archivo).fila(indice)
 
 
 # Esta función crea y devuelve el axes de matplot con la proyección Ortografica de 
@@ -112,39 +316,71 @@ def leerOMNI(archivo, indice):
 # array con el rango inferior y superior de latitudes [latmin , latmax] 
 def proyeccionOrtografica(fig, polo, rango, fecha, info=None):
     
-    # segun el parametro sea sur o norte la proyección se centra en un polo o otro.
+    _estiloFiguras()
+    
+    # creo el objeto axes de matplotlib, en este caso es una projección de cartopy, de tipo ortografica.
+    ax = fig.add_subplot(projection=_proyeccionPolo(polo))
+
+    # detalles para la proyección
+    _capasFijas(ax, polo, rango)
+    ax.add_feature(Nightshade(fecha), alpha=0.5,zorder=2) # Sombra de la noche en función de la hora
+    # ax.set_title("Tormenta del " + fecha.strftime("%Y/%m/%d"), fontname='serif', size="large", weight=700)
+    plt.tight_layout()
+    
+    _marcarPoloMagnetico(ax, polo)
+    return ax
+
+# segun el parametro sea sur o norte la proyección se centra en un polo o otro.
+def _proyeccionPolo(polo):
+    
+    if polo == "sur":
+        return ccrs.Orthographic(180, -90)
+    return ccrs.Orthographic(0, 90)
+
+def _estiloFiguras():
+    
+    plt.rcParams['mathtext.fontset'] = 'custom'
+    plt.rcParams['mathtext.rm'] = 'Times New Roman'
+    plt.rcParams['mathtext.it'] = 'Times New Roman:italic'
+    plt.rcParams['mathtext.bf'] = 'Times New Roman:bold'
+
+def _marcarPoloMagnetico(ax, polo):
+    
+    poloMG = POLOS_MAGNETICOS[polo if polo == "sur" else "norte"]
+    ax.scatter(poloMG[1], poloMG[0], transform=ccrs.PlateCarree(), color="red", marker="D",s=100, alpha=1, zorder=3,label=f"$Polo\;{polo}\;magnético$")
+
+#modificar el rango de latitudes de la imagen. Con cuadrado=True (mapaBase y
+# proyeccionRapida) el paralelo rango[0] es un circulo de radio R*cos(lat) centrado en
+# el polo y se usa el cuadrado que lo contiene en las coordenadas de la proyección: con
+# set_extent en PlateCarree el axes del polo sur queda sin ancho en esas figuras.
+# proyeccionOrtografica mantiene el extent en latitudes de siempre
+def _extentPolo(ax, polo, rango, cuadrado=False):
+    
+    if cuadrado:
+        r = ax.projection.x_limits[1]*np.cos(np.deg2rad(rango[0]))
+        ax.set_extent([-r, r, -r, r], crs=ax.projection)
+        return
+    
     if polo == "sur":
-        lat = -90
-        lon = 180
         la1 = -rango[1]
         la2 = -rango[0]
-        latitudes = np.arange(-90, -30 + 1, 15)  # latitudes visibles
-        poloMG =[-80.65, 107.0]
     else:
-        lat = 90
-        lon = 0
         la1  = rango[0]
         la2  = rango[1]
-        latitudes = np.arange(30, 90 + 1, 15)     # latitudes visibles
-        poloMG =[82.41, -82.86]
-        
-    plt.rcParams['mathtext.fontset'] = 'custom'
-    plt.rcParams['mathtext.rm'] = 'Times New Roman'
-    plt.rcParams['mathtext.it'] = 'Times New Roman:italic'
-    plt.rcParams['mathtext.bf'] = 'Times New Roman:bold'
+    ax.set_extent([-180, 180, la1, la2], crs=ccrs.PlateCarree())
+
+# capas que no dependen de la fecha: fondo, costas, limites, grilla y etiquetas
+def _capasFijas(ax, polo, rango, cuadrado=False):
     
-    # creo el objeto axes de matplotlib, en este caso es una projección de cartopy, de tipo ortografica.
-    ax = fig.add_subplot(projection=ccrs.Orthographic(lon, lat))
+    if polo == "sur":
+        latitudes = np.arange(-90, -30 + 1, 15)  # latitudes visibles
+    else:
+        latitudes = np.arange(30, 90 + 1, 15)     # latitudes visibles
 
-    # detalles para la proyección
     ax.stock_img()  # fondo satelital (opcional)
     ax.coastlines(resolution='110m', linewidth=0.3 ,zorder=2)  # líneas de costa
     ax.add_feature(cfeature.BORDERS.with_scale('110m'), linewidth=0.3, zorder=3) # límites de países
-    ax.add_feature(Nightshade(fecha), alpha=0.5,zorder=2) # Sombra de la noche en función de la hora
-    # ax.set_title("Tormenta del " + fecha.strftime("%Y/%m/%d"), fontname='serif', size="large", weight=700)
-
-    #modificar el rango de latitudes de la imagen
-    ax.set_extent([-180, 180, la1, la2], crs=ccrs.PlateCarree())
+    _extentPolo(ax, polo, rango, cuadrado)
     
     #grilla de puntos
     gl = ax.gridlines(linewidth=0.2, linestyle=(5,(10, 3)), color="k" ,draw_labels=False, zorder=1)
@@ -171,8 +407,86 @@ def proyeccionOrtografica(fig, polo, rango, fecha, info=None):
     for spine in ax.spines.values():
         spine.set_linewidth(1.5)
     #Grosor de los ticks
-    plt.tick_params(width=1.5, length=5,labelsize=15, top=True, right=True, direction="in",color="w") 
-    plt.tight_layout()
+    ax.tick_params(width=1.5, length=5,labelsize=15, top=True, right=True, direction="in",color="w") 
+
+# Mapas base en cache: las capas fijas de la proyección (fondo, costas, limites,
+# grilla, etiquetas) se dibujan una sola vez por polo, rango, tamaño y dpi de figura en
+# una imagen (raster RGBA). Se guarda tambien la posicion del axes y la latitud y
+# longitud de cada pixel, asi la sombra de la noche de cada fecha se calcula sobre la
+# imagen pixel por pixel (angulo cenital del sol) en vez de proyectar el poligono de
+# Nightshade. proyeccionRapida pega esa imagen en la figura y solo dibuja encima el
+# polo magnetico y lo que se agregue despues (ovalos, textos, leyenda). La sombra
+# queda por debajo de las costas y las etiquetas (en proyeccionOrtografica va encima),
+# y la imagen no se escala si despues se cambia el tamaño de la figura. Cada mapa ocupa
+# varios MB (imagen y lat/lon por pixel), se guardan los _MAPAS_BASE_MAX mas usados.
+_MAPAS_BASE = OrderedDict()
+_MAPAS_BASE_MAX = 8
+
+def mapaBase(polo, rango, figsize, dpi):
     
-    ax.scatter(poloMG[1], poloMG[0], transform=ccrs.PlateCarree(), color="red", marker="D",s=100, alpha=1, zorder=3,label=f"$Polo\;{polo}\;magnético$")
-    return ax
\ No newline at end of file
+    clave = (polo, tuple(rango), tuple(figsize), dpi)
+    if clave in _MAPAS_BASE:
+        _MAPAS_BASE.move_to_end(clave)
+    else:
+        _estiloFiguras()
+        fig = Figure(figsize=figsize, dpi=dpi)
+        lienzo = FigureCanvasAgg(fig)
+        proyeccion = _proyeccionPolo(polo)
+        ax = fig.add_subplot(projection=proyeccion)
+        _capasFijas(ax, polo, rango, cuadrado=True)
+        fig.tight_layout()
+        lienzo.draw()
+        raster = np.asarray(lienzo.buffer_rgba()).copy()
+
+        # latitud y longitud del centro de cada pixel (NaN fuera del axes), la fila 0
+        # de la imagen es la de arriba
+        alto, ancho = raster.shape[:2]
+        px, py = np.meshgrid(np.arange(ancho) + 0.5, alto - np.arange(alto) - 0.5)
+        xy = ax.transData.inverted().transform(np.column_stack([px.ravel(), py.ravel()]))
+        with np.errstate(invalid="ignore"):
+            lonlat = ccrs.PlateCarree().transform_points(proyeccion, xy[:, 0], xy[:, 1])
+        lonlat[~np.isfinite(lonlat)] = np.nan
+        x0, y0, x1, y1 = ax.bbox.extents
+        fuera = (px.ravel() < x0) | (px.ravel() > x1) | (py.ravel() < y0) | (py.ravel() > y1)
+        lonlat[fuera] = np.nan
+        latPix = lonlat[:, 1].reshape(alto, ancho).astype(np.float32)
+        lonPix = lonlat[:, 0].reshape(alto, ancho).astype(np.float32)
+
+        _MAPAS_BASE[clave] = (raster, ax.get_position(), latPix, lonPix)
+        while len(_MAPAS_BASE) > _MAPAS_BASE_MAX:
+            _MAPAS_BASE.popitem(last=False)
+    
+    return _MAPAS_BASE[clave]
+
+# oscurece (alpha) los pixeles de la imagen donde es de noche en la fecha: el sol esta
+# mas de "refraccion" grados bajo el horizonte, como Nightshade (refraction=-0.83)
+def sombraNoche(raster, latPix, lonPix, fecha, alpha=0.5, refraccion=-0.83):
+    
+    from starkov import subsolar_geodetic
+    latSol, lonSol = np.deg2rad(subsolar_geodetic(fecha))
+    lat, lon = np.deg2rad(latPix), np.deg2rad(lonPix)
+    cosCenit = np.sin(lat)*np.sin(latSol) + np.cos(lat)*np.cos(latSol)*np.cos(lon - lonSol)
+    with np.errstate(invalid="ignore"):
+        noche = cosCenit < np.sin(np.deg2rad(refraccion))
+    
+    cuadro = raster.copy()
+    cuadro[noche, :3] = (cuadro[noche, :3]*(1 - alpha)).astype(raster.dtype)
+    return cuadro
+
+# Igual que proyeccionOrtografica pero usando el mapa base en cache, para graficar
+# muchas fechas (cuadros de una animación) con la misma figura base
+def proyeccionRapida(fig, polo, rango, fecha, info=None):
+    
+    raster, posicion, latPix, lonPix = mapaBase(polo, rango, tuple(fig.get_size_inches()), fig.dpi)
+    _estiloFiguras()
+    
+    # la imagen va detras del axes, que queda con fondo transparente
+    fig.figimage(sombraNoche(raster, latPix, lonPix, fecha), 0, 0, zorder=-1)
+    ax = fig.add_axes(posicion, projection=_proyeccionPolo(polo))
+    ax.patch.set_visible(False)
+    _extentPolo(ax, polo, rango, cuadrado=True)
+    for spine in ax.spines.values():
+        spine.set_linewidth(1.5)
+    
+    _marcarPoloMagnetico(ax, polo)
+    return ax